@@ -10,6 +10,10 @@ def create_app(config_name='development'):
     """Application factory pattern"""
     app = Flask(__name__)
     
+    # JSON serialization for slotted storage records
+    from app.utils.serializers import RecordJSONProvider
+    app.json = RecordJSONProvider(app)
+    
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
     
@@ -23,4 +27,19 @@ def create_app(config_name='development'):
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp)
     
+    from app.routes.api import snapshot_manager, write_ahead_log, shared_storage
+    
+    # Periodic storage snapshots (seconds, disabled when unset). In shared mode only
+    # log checkpoints write the snapshot, so a stale worker never overwrites it.
+    snapshot_interval = os.environ.get('SNAPSHOT_INTERVAL')
+    if snapshot_interval and snapshot_manager is not None and shared_storage is None:
+        snapshot_manager.start_periodic(float(snapshot_interval))
+    
+    # Background compaction of the write-ahead log into a fresh snapshot
+    compact_bytes = int(os.environ.get('WAL_COMPACT_BYTES', 16 * 1024 * 1024))
+    if shared_storage is not None:
+        shared_storage.start_compaction(compact_bytes)
+    elif write_ahead_log is not None:
+        write_ahead_log.start_compaction(compact_bytes)
+    
     return app 
\ No newline at end of file
@@ -1,66 +1,25 @@
-from app.utils.sparse_matrix import SparseMatrix
+from app.utils.storage_backend import storage_backend
+from app.models.records import Course
 from datetime import datetime
 
 class CourseStorage:
     """
-    Sistema de almacenamiento de cursos usando matrices dispersas.
+    Sistema de almacenamiento de cursos usando un almacén columnar tipado.
     """
     
-    def __init__(self):
-        # Matriz principal para almacenar cursos
-        # Dimensiones: (course_id, attribute_index)
-        self.courses_matrix = SparseMatrix(10000, 5)  # 10k cursos, 5 atributos
+    def __init__(self, backend=None):
+        # Backend de los registros (memoria o SQLite), elegido por configuración
+        backend = backend or storage_backend
         
-        # Matriz de índices para búsquedas rápidas
-        # codigo_curso -> course_id
-        self.course_code_index = SparseMatrix(10000, 1)
-        
-        # Contador de cursos
-        self.next_course_id = 1
-        
-        # Mapeo de atributos a índices de columna
-        self.attribute_map = {
-            'course_id': 0,
-            'codigo': 1,
-            'nombre': 2,
-            'is_active': 3,
-            'created_at': 4
-        }
-    
-    def _get_course_data(self, course_id):
-        """Obtiene todos los datos de un curso desde la matriz"""
-        if course_id <= 0 or course_id >= self.next_course_id:
-            return None
-        
-        course_data = {}
-        for attr, col_idx in self.attribute_map.items():
-            value = self.courses_matrix.get_value(course_id, col_idx)
-            if value != 0:
-                # Convertir de vuelta a tipos apropiados
-                if attr in ['is_active']:
-                    course_data[attr] = bool(value)
-                elif attr in ['created_at']:
-                    course_data[attr] = datetime.fromisoformat(str(value)) if value else None
-                elif attr == 'course_id':
-                    course_data[attr] = int(value)
-                else:
-                    course_data[attr] = str(value) if value else None
-        
-        return course_data if course_data else None
-    
-    def _store_course_data(self, course_id, course_data):
-        """Almacena los datos de un curso en la matriz"""
-        for attr, value in course_data.items():
-            if attr in self.attribute_map:
-                col_idx = self.attribute_map[attr]
-                if value is not None:
-                    # Convertir a formato numérico para almacenamiento
-                    if isinstance(value, bool):
-                        self.courses_matrix.set_value(course_id, col_idx, 1 if value else 0)
-                    elif isinstance(value, datetime):
-                        self.courses_matrix.set_value(course_id, col_idx, value.isoformat())
-                    else:
-                        self.courses_matrix.set_value(course_id, col_idx, str(value))
+        # Almacén columnar principal de cursos
+        # Cada atributo es una columna tipada indexada por course_id
+        self.courses = backend.create_store('courses', [
+            ('course_id', 'int'),
+            ('codigo', 'str'),
+            ('nombre', 'str'),
+            ('is_active', 'bool'),
+            ('created_at', 'timestamp')
+        ], record_type=Course, unique=('codigo',), ordered=('created_at',))
     
     def create_course(self, course_data):
         """Crea un nuevo curso"""
@@ -72,86 +31,104 @@ class CourseStorage:
             if not codigo or not nombre:
                 raise ValueError("Código y nombre del curso son requeridos")
             
-            # Verificar que el código no exista
-            existing_course = self.get_course_by_code(codigo)
-            if existing_course:
-                raise ValueError(f"El curso con código {codigo} ya existe")
-            
-            # Crear nuevo curso
-            course_id = self.next_course_id
-            self.next_course_id += 1
-            
-            # Preparar datos
-            now = datetime.utcnow()
-            course_data['course_id'] = course_id
-            course_data['created_at'] = now
-            course_data['is_active'] = course_data.get('is_active', True)
-            
-            # Almacenar en matriz principal
-            self._store_course_data(course_id, course_data)
+            # Comprobar y reservar el código de forma atómica frente a altas concurrentes
+            with self.courses.lock_key('codigo', str(codigo)):
+                # Verificar que el código no exista
+                if self.courses.find_first('codigo', codigo) is not None:
+                    raise ValueError(f"El curso con código {codigo} ya existe")
+                
+                # Crear nuevo curso
+                course_id = self.courses.allocate_id()
+                
+                # Preparar datos
+                now = datetime.utcnow()
+                course_data['course_id'] = course_id
+                course_data['created_at'] = now
+                course_data['is_active'] = course_data.get('is_active', True)
+                
+                # Almacenar en el almacén columnar
+                self.courses.insert(course_id, course_data)
             
-            # Actualizar índice
-            course_hash = hash(codigo) % 10000
-            self.course_code_index.set_value(course_hash, 0, course_id)
-            
-            return self._get_course_data(course_id)
+            return self.courses.get(course_id)
             
         except Exception as e:
             raise Exception(f"Error creando curso: {str(e)}")
     
     def get_course_by_id(self, course_id):
         """Obtiene un curso por ID"""
-        return self._get_course_data(course_id)
+        return self.courses.get(course_id)
     
     def get_course_by_code(self, codigo):
         """Obtiene un curso por código"""
         if not codigo:
             return None
         
-        course_hash = hash(codigo) % 10000
-        course_id = self.course_code_index.get_value(course_hash, 0)
-        
-        if course_id > 0:
-            course_data = self._get_course_data(course_id)
-            if course_data and course_data.get('codigo') == codigo:
-                return course_data
-        
-        # If hash lookup failed, do a linear search through all courses
-        # This handles hash collisions
-        all_courses = self.get_all_courses()
-        for course in all_courses:
-            if course.get('codigo') == codigo:
-                return course
-        
-        return None
+        course_id = self.courses.find_first('codigo', codigo)
+        if course_id is None:
+            return None
+        return self.courses.get(course_id)
+    
+    def get_recent_courses(self, limit=10, since=None):
+        """Obtiene los cursos creados más recientemente (desde since, si se indica) usando el índice de created_at"""
+        ids = self.courses.find_range('created_at', low=since, limit=limit, descending=True)
+        return [self.courses.get(record_id) for record_id in ids]
     
     def get_all_courses(self):
         """Obtiene todos los cursos"""
-        courses = []
-        for course_id in range(1, self.next_course_id):
-            course_data = self._get_course_data(course_id)
-            if course_data:
-                courses.append(course_data)
-        return courses
+        return self.courses.get_all()
+    
+    def iter_courses(self, after_id=0):
+        """Itera los cursos en orden de id sin construir una lista"""
+        return self.courses.iter_records(after_id)
+    
+    def get_courses_page(self, after_id=0, limit=None):
+        """Obtiene una página de cursos y el cursor de la siguiente"""
+        return self.courses.page(after_id, limit)
     
-    def bulk_create_courses(self, courses_list):
-        """Crea múltiples cursos de una vez"""
+    def bulk_create_courses(self, courses_list, skip_existing=False):
+        """
+        Crea múltiples cursos en un solo bloque (todo o nada).
+        Los códigos repetidos dentro del lote se descartan; los que ya existen
+        producen un error, o se omiten si skip_existing es True.
+        """
         try:
-            created_courses = []
+            # Validar y deduplicar el lote completo antes de escribir
+            pending = {}
             for course_data in courses_list:
-                created_course = self.create_course(course_data)
-                created_courses.append(created_course)
+                codigo = course_data.get('codigo')
+                nombre = course_data.get('nombre')
+                if not codigo or not nombre:
+                    raise ValueError("Código y nombre del curso son requeridos")
+                pending.setdefault(str(codigo), course_data)
             
-            return created_courses
+            with self.courses.lock_keys(('codigo', codigo) for codigo in pending):
+                existing = self.courses.existing_values('codigo', pending)
+                if existing and not skip_existing:
+                    raise ValueError(f"Los cursos con código {', '.join(sorted(existing))} ya existen")
+                for codigo in existing:
+                    del pending[codigo]
+                
+                # Asignar ids en bloque y escribir las columnas de una vez
+                course_ids = self.courses.allocate_ids(len(pending))
+                now = datetime.utcnow()
+                records = [
+                    dict(course_data, course_id=course_id, created_at=now,
+                         is_active=course_data.get('is_active', True))
+                    for course_id, course_data in zip(course_ids, pending.values())
+                ]
+                self.courses.bulk_insert(course_ids, records)
+            
+            return [self.courses.get(course_id) for course_id in course_ids]
             
         except Exception as e:
             raise Exception(f"Error creando cursos masivamente: {str(e)}")
     
+    def compact(self):
+        """Compacta el almacén de cursos liberando las ranuras de registros eliminados"""
+        return self.courses.compact()
+    
     def get_matrix_stats(self):
-        """Obtiene estadísticas de las matrices"""
-        return {
-            'courses_matrix_density': self.courses_matrix.get_density(),
-            'course_code_index_density': self.course_code_index.get_density(),
-            'total_courses': self.next_course_id - 1,
-            'non_zero_courses': len(self.courses_matrix.get_non_zero_elements())
-        } 
\ No newline at end of file
+        """Obtiene estadísticas del almacenamiento"""
+        stats = self.courses.get_stats()
+        stats['total_courses'] = self.courses.count
+        return stats
@@ -1,71 +1,120 @@
 import os
-import json
+import secrets
+import threading
 import xml.etree.ElementTree as ET
 from datetime import datetime
-from ..utils.sparse_matrix import SparseMatrix, create_sparse_matrix_from_data
+from ..utils.sparse_matrix import create_sparse_matrix_from_data
+from ..utils.events import event_bus as default_event_bus
+from ..utils.storage_backend import storage_backend
+from ..utils.lock_striping import LockStripes
+from ..utils.record_cache import RecordCache
+from ..utils.grades_backend import matrix_summary
+from ..utils.grades_xml import iter_grades_xml
+
+# Course matrices kept in memory at once; the rest are read back from persistence on access
+DEFAULT_RESIDENT_COURSES = 32
 
 class GradesStorage:
     """
     Storage class for managing student grades using sparse matrices.
     Stores grades data from XML files uploaded by tutors.
+    Only the course manifest (a summary of each course and of its matrix) is loaded at
+    startup; each course's matrix, with its activity and student lists, is read on
+    first access and kept in a bounded LRU.
     """
     
-    def __init__(self, storage_file='grades_data.json'):
+    def __init__(self, storage_file='grades_data.json', event_bus=None, entity='grades', backend=None,
+                 max_resident=None):
         self.storage_file = storage_file
+        # Persistence (JSON segments or SQLite tables) chosen by the storage backend configuration
+        self.backend = (backend or storage_backend).create_grades_backend(storage_file)
         self.grades_data = self._load_data()
+        # Resident matrices; every write is persisted right away, so evicting one only drops it
+        if max_resident is None:
+            max_resident = int(os.environ.get('GRADES_RESIDENT_COURSES', DEFAULT_RESIDENT_COURSES))
+        self.matrices = RecordCache(max_resident)
+        self.residency_lock = threading.Lock()
+        # Change events are published per course key ("<course_code>_<tutor_id>")
+        self.event_bus = event_bus
+        self.entity = entity
+        # In-memory versions for conditional requests; the epoch changes on every load
+        self.version = 0
+        self.epoch = secrets.token_hex(4)
+        self.course_versions = {course_key: 0 for course_key in self.grades_data['courses']}
+        # Writes to the same course key are serialized by its stripe; different courses
+        # (e.g. two tutors uploading at once) only share the short version bump
+        self.course_locks = LockStripes()
+        self.version_lock = threading.Lock()
     
     def _load_data(self):
-        """Load grades data from storage file"""
-        if os.path.exists(self.storage_file):
-            try:
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                # Convert string keys back to tuples for sparse matrix reconstruction
-                for course_key in data.get('sparse_matrices', {}):
-                    matrix_data = data['sparse_matrices'][course_key].get('matrix_data', {})
-                    # Convert string keys back to tuple format
-                    data['sparse_matrices'][course_key]['matrix_data'] = {
-                        tuple(map(int, key.split(','))): value for key, value in matrix_data.items()
-                    }
-                    
-                return data
-            except (json.JSONDecodeError, FileNotFoundError):
-                return {
-                    'courses': {},
-                    'sparse_matrices': {},
-                    'metadata': {
-                        'created_at': datetime.utcnow().isoformat(),
-                        'last_updated': datetime.utcnow().isoformat()
-                    }
-                }
-        return {
-            'courses': {},
-            'sparse_matrices': {},
-            'metadata': {
-                'created_at': datetime.utcnow().isoformat(),
-                'last_updated': datetime.utcnow().isoformat()
-            }
-        }
+        """Load the course manifest from the persistence backend"""
+        return self.backend.load_manifest()
     
-    def _save_data(self):
-        """Save grades data to storage file"""
+    def _save_data(self, course_key, matrix_info=None, changes=None, added=None):
+        """
+        Persist the course that changed (matrix_info None means it was deleted);
+        with changes ("row,col" -> grade or None) only those cells are written, along
+        with the activities and students appended by a merge (added)
+        """
         self.grades_data['metadata']['last_updated'] = datetime.utcnow().isoformat()
-        # Convert tuple keys to strings for JSON serialization
-        serializable_data = self.grades_data.copy()
-        for course_key in serializable_data['sparse_matrices']:
-            matrix_data = serializable_data['sparse_matrices'][course_key]['matrix_data']
-            # Robustly convert tuple keys to string format, leave string keys as is
-            serializable_data['sparse_matrices'][course_key]['matrix_data'] = {
-                (f"{key[0]},{key[1]}" if isinstance(key, tuple) else str(key)): value
-                for key, value in matrix_data.items()
-            }
-        with open(self.storage_file, 'w', encoding='utf-8') as f:
-            json.dump(serializable_data, f, indent=2, ensure_ascii=False)
+        if matrix_info is None:
+            self.backend.delete_course(self.grades_data, course_key)
+        elif changes is not None:
+            self.backend.save_course_delta(self.grades_data, course_key, matrix_info, changes, added)
+        else:
+            self.backend.save_course(self.grades_data, course_key, matrix_info)
+    
+    def _get_matrix(self, course_key):
+        """Matrix data of a course, read from persistence on a miss (None if it has no grades)"""
+        with self.residency_lock:
+            matrix_info = self.matrices.get(course_key)
+        if matrix_info is not None:
+            return matrix_info
+        # The course stripe keeps a concurrent upload from being overwritten by an older read
+        with self.course_locks.hold(course_key):
+            with self.residency_lock:
+                matrix_info = self.matrices.peek(course_key)
+            if matrix_info is None and course_key in self.grades_data['courses']:
+                matrix_info = self.backend.load_matrix(course_key)
+                self._set_resident(course_key, matrix_info)
+        return matrix_info
+    
+    def _set_resident(self, course_key, matrix_info):
+        """Make a matrix resident (None drops it), evicting the least recently used one"""
+        with self.residency_lock:
+            self.matrices.put(course_key, matrix_info)
+    
+    def _publish(self, course_key, operation):
+        """Bump the versions and publish a change event for a course key"""
+        with self.version_lock:
+            self.version += 1
+            if operation == 'delete':
+                self.course_versions.pop(course_key, None)
+            else:
+                self.course_versions[course_key] = self.version
+        if self.event_bus is not None:
+            self.event_bus.publish(self.entity, course_key, operation)
+    
+    def etag(self, course_code=None, tutor_id=None):
+        """Version tag of the whole storage, or of one course (None if it has no grades)"""
+        if course_code is None:
+            return f"{self.epoch}.{self.version}"
+        course_key = f"{course_code}_{tutor_id}"
+        version = self.course_versions.get(course_key)
+        return None if version is None else f"{self.epoch}.{course_key}.{version}"
     
-    def parse_grades_xml(self, xml_content, tutor_id):
+    def parse_grades_xml(self, xml_content, tutor_id, merge=False):
         """
-        Parse XML grades file and create sparse matrix
+        Parse a grades XML file and store it as a sparse matrix
+        
+        The document is streamed with iterparse (see app/utils/grades_xml.py), so
+        xml_content can be a binary stream such as the uploaded file, bytes or text.
+        Activities and students get their row/column in order of first appearance.
+        
+        With merge=True an upload for a course that already has grades is diffed
+        against the stored matrix instead of replacing it: new activities and
+        students are appended (existing rows and columns keep their index), only
+        the cells that changed are written, and the result reports the delta.
         
         Expected XML format:
         <?xml version="1.0"?>
@@ -77,117 +126,92 @@ class GradesStorage:
         </notas>
         """
         try:
-            print(f"DEBUG: parse_grades_xml called with tutor_id: {tutor_id}")
-            print(f"DEBUG: XML content length: {len(xml_content)}")
-            print(f"DEBUG: XML content preview: {xml_content[:200]}...")
-            
-            # Remove XML declaration if present and wrap in root element
-            if xml_content.strip().startswith('<?xml'):
-                # Find the end of the XML declaration
-                end_declaration = xml_content.find('?>') + 2
-                xml_content = xml_content[end_declaration:].strip()
+            print(f"DEBUG: parse_grades_xml called with tutor_id: {tutor_id}, merge: {merge}")
+            course_code = course_name = None
+            has_notas = False
+            activity_rows = {}
+            student_cols = {}
+            # One {col: grade} dict per activity row; a repeated cell keeps the last grade
+            grade_rows = []
+            grade_count = 0
             
-            # Wrap the XML content in a root element since XML needs one
-            wrapped_xml = f"<root>{xml_content}</root>"
-            print(f"DEBUG: Wrapped XML: {wrapped_xml[:200]}...")
+            for item in iter_grades_xml(xml_content):
+                if item[0] == 'actividad':
+                    _, activity_name, student_carnet, grade = item
+                    row = activity_rows.setdefault(activity_name, len(activity_rows))
+                    if row == len(grade_rows):
+                        grade_rows.append({})
+                    col = student_cols.setdefault(student_carnet, len(student_cols))
+                    grade_rows[row][col] = grade
+                    grade_count += 1
+                elif item[0] == 'curso':
+                    _, course_code, course_name = item
+                else:
+                    has_notas = True
             
-            root = ET.fromstring(wrapped_xml)
-            print(f"DEBUG: Root tag: {root.tag}")
-            
-            # Extract course information
-            curso_elem = root.find('curso')
-            print(f"DEBUG: curso_elem found: {curso_elem is not None}")
-            if curso_elem is None:
+            if course_name is None:
                 raise ValueError("Missing 'curso' element in XML")
-            
-            course_code = curso_elem.get('codigo')
-            course_name = curso_elem.text.strip()
-            print(f"DEBUG: Course code: {course_code}, Course name: {course_name}")
-            
             if not course_code:
                 raise ValueError("Course code is required in 'curso' element")
-            
-            # Extract grades
-            notas_elem = root.find('notas')
-            print(f"DEBUG: notas_elem found: {notas_elem is not None}")
-            if notas_elem is None:
+            if not has_notas:
                 raise ValueError("Missing 'notas' element in XML")
-            
-            activities = []
-            students = set()
-            grades_data = {}
-            
-            actividades = notas_elem.findall('actividad')
-            print(f"DEBUG: Found {len(actividades)} actividades")
-            
-            for actividad in actividades:
-                activity_name = actividad.get('nombre')
-                student_carnet = actividad.get('carnet')
-                grade_value = actividad.text.strip()
-                
-                print(f"DEBUG: Processing actividad - nombre: {activity_name}, carnet: {student_carnet}, grade: {grade_value}")
-                
-                if not activity_name or not student_carnet or not grade_value:
-                    raise ValueError("Missing required attributes in 'actividad' element")
-                
-                try:
-                    grade = float(grade_value)
-                    if grade < 0 or grade > 100:
-                        raise ValueError(f"Grade {grade} is out of valid range (0-100)")
-                except ValueError:
-                    raise ValueError(f"Invalid grade value: {grade_value}")
-                
-                activities.append(activity_name)
-                students.add(student_carnet)
-                
-                if activity_name not in grades_data:
-                    grades_data[activity_name] = {}
-                grades_data[activity_name][student_carnet] = grade
-            
-            print(f"DEBUG: Unique activities: {list(set(activities))}")
-            print(f"DEBUG: Unique students: {list(students)}")
-            print(f"DEBUG: Grades data: {grades_data}")
-            
-            # Create sparse matrix
-            activities = list(set(activities))  # Remove duplicates and maintain order
-            students = list(students)
-            
-            print(f"DEBUG: Creating sparse matrix with {len(activities)} activities and {len(students)} students")
-            sparse_matrix = SparseMatrix(len(activities), len(students))
-            
-            # Fill sparse matrix
-            for i, activity in enumerate(activities):
-                for j, student in enumerate(students):
-                    if activity in grades_data and student in grades_data[activity]:
-                        grade_value = grades_data[activity][student]
-                        print(f"DEBUG: Setting matrix[{i}][{j}] = {grade_value} for activity '{activity}' and student '{student}'")
-                        sparse_matrix.set_value(i, j, grade_value)
+            print(f"DEBUG: Parsed {len(activity_rows)} activities, {len(student_cols)} students, {grade_count} grades")
             
             # Store course information
             course_key = f"{course_code}_{tutor_id}"
             print(f"DEBUG: Course key: {course_key}")
-            
-            self.grades_data['courses'][course_key] = {
-                'course_code': course_code,
-                'course_name': course_name,
-                'tutor_id': tutor_id,
-                'activities': activities,
-                'students': students,
-                'upload_date': datetime.utcnow().isoformat(),
-                'total_activities': len(activities),
-                'total_students': len(students)
-            }
-            
-            # Store sparse matrix data
-            self.grades_data['sparse_matrices'][course_key] = {
-                'matrix_data': sparse_matrix.get_non_zero_elements(),
-                'rows': sparse_matrix.rows,
-                'cols': sparse_matrix.cols,
-                'density': sparse_matrix.get_density()
-            }
-            
-            print(f"DEBUG: Saving data to storage")
-            self._save_data()
+            with self.course_locks.hold(course_key):
+                stored_info = self.grades_data['courses'].get(course_key)
+                stored_matrix = self._get_matrix(course_key) if merge and stored_info is not None else None
+                
+                if stored_matrix is not None:
+                    activities, students, matrix_data, changes, delta = self._merge_grades(
+                        stored_matrix, list(activity_rows), list(student_cols), grade_rows
+                    )
+                else:
+                    activities, students, changes, delta = list(activity_rows), list(student_cols), None, None
+                    matrix_data = {}
+                    for row, grades in enumerate(grade_rows):
+                        for col, grade in grades.items():
+                            # Zero grades are not stored, as in SparseMatrix.set_value
+                            if grade:
+                                matrix_data[f"{row},{col}"] = grade
+                        grade_rows[row] = None
+                
+                cells = len(activities) * len(students)
+                density = (len(matrix_data) / cells) * 100 if cells > 0 else 0
+                
+                if (changes is not None and not changes and not delta['activities_added']
+                        and not delta['students_added'] and course_name == stored_info['course_name']):
+                    # Nothing changed: no write, no version bump (ETags stay valid)
+                    upload_date = stored_info['upload_date']
+                else:
+                    upload_date = datetime.utcnow().isoformat()
+                    # The manifest keeps a fixed-size summary; the lists live with the matrix
+                    self.grades_data['courses'][course_key] = {
+                        'course_code': course_code,
+                        'course_name': course_name,
+                        'tutor_id': tutor_id,
+                        'upload_date': upload_date,
+                        'total_activities': len(activities),
+                        'total_students': len(students)
+                    }
+                    
+                    # Store sparse matrix data ("row,col" keys, the JSON-serializable form)
+                    matrix_info = {
+                        'matrix_data': matrix_data,
+                        'rows': len(activities),
+                        'cols': len(students),
+                        'density': density,
+                        'activities': activities,
+                        'students': students
+                    }
+                    self.grades_data['matrices'][course_key] = matrix_summary(matrix_info)
+                    self._set_resident(course_key, matrix_info)
+                    
+                    print(f"DEBUG: Saving data to storage")
+                    self._save_data(course_key, matrix_info, changes, delta)
+                    self._publish(course_key, 'insert' if stored_info is None else 'update')
             
             result = {
                 'success': True,
@@ -195,9 +219,19 @@ class GradesStorage:
                 'course_name': course_name,
                 'activities_count': len(activities),
                 'students_count': len(students),
-                'matrix_density': sparse_matrix.get_density(),
-                'upload_date': datetime.utcnow().isoformat()
+                'matrix_density': density,
+                'upload_date': upload_date,
+                'mode': 'merge' if merge else 'replace'
             }
+            if merge:
+                result['delta'] = delta if delta is not None else {
+                    'activities_added': activities,
+                    'students_added': students,
+                    'cells_added': len(matrix_data),
+                    'cells_updated': 0,
+                    'cells_removed': 0,
+                    'cells_unchanged': 0
+                }
             
             print(f"DEBUG: Returning result: {result}")
             return result
@@ -211,33 +245,98 @@ class GradesStorage:
             print(f"DEBUG: Traceback: {traceback.format_exc()}")
             raise ValueError(f"Error parsing XML: {str(e)}")
     
+    def _merge_grades(self, stored_matrix, activities, students, grade_rows):
+        """
+        Diff uploaded grades against a stored course.
+        Uploaded activities and students are mapped onto the stored rows/columns and
+        new ones are appended, so existing indexes never move. Cells missing from the
+        upload are kept; a zero grade removes a cell.
+        
+        Returns:
+            tuple: (activities, students, matrix_data, changes, delta) where changes maps
+                each changed "row,col" to its new grade (None when removed)
+        """
+        merged_activities = list(stored_matrix['activities'])
+        merged_students = list(stored_matrix['students'])
+        
+        def index_map(names, merged):
+            positions = {name: index for index, name in enumerate(merged)}
+            added = []
+            mapping = []
+            for name in names:
+                if name not in positions:
+                    positions[name] = len(merged)
+                    merged.append(name)
+                    added.append(name)
+                mapping.append(positions[name])
+            return mapping, added
+        
+        row_map, activities_added = index_map(activities, merged_activities)
+        col_map, students_added = index_map(students, merged_students)
+        
+        # Copy so readers of the resident matrix never see a half-applied merge
+        matrix_data = dict(stored_matrix['matrix_data'])
+        changes = {}
+        added = updated = removed = unchanged = 0
+        for upload_row, grades in enumerate(grade_rows):
+            row = row_map[upload_row]
+            for upload_col, grade in grades.items():
+                key = f"{row},{col_map[upload_col]}"
+                previous = matrix_data.get(key, 0)
+                if grade == previous:
+                    unchanged += 1
+                    continue
+                if grade:
+                    matrix_data[key] = grade
+                    if previous:
+                        updated += 1
+                    else:
+                        added += 1
+                else:
+                    del matrix_data[key]
+                    removed += 1
+                changes[key] = grade or None
+            grade_rows[upload_row] = None
+        
+        delta = {
+            'activities_added': activities_added,
+            'students_added': students_added,
+            'cells_added': added,
+            'cells_updated': updated,
+            'cells_removed': removed,
+            'cells_unchanged': unchanged
+        }
+        return merged_activities, merged_students, matrix_data, changes, delta
+    
     def get_course_grades(self, course_code, tutor_id):
         """Get grades for a specific course"""
         course_key = f"{course_code}_{tutor_id}"
         
-        if course_key not in self.grades_data['courses']:
+        course_info = self.grades_data['courses'].get(course_key)
+        if course_info is None:
             return None
         
-        course_info = self.grades_data['courses'][course_key]
-        matrix_info = self.grades_data['sparse_matrices'][course_key]
+        matrix_info = self._get_matrix(course_key)
+        if matrix_info is None:
+            return None
         
         # Reconstruct sparse matrix using robust function
         sparse_matrix = create_sparse_matrix_from_data(matrix_info['rows'], matrix_info['cols'], matrix_info['matrix_data'])
         
         return {
-            'course_info': course_info,
+            'course_info': dict(course_info, activities=matrix_info['activities'], students=matrix_info['students']),
             'sparse_matrix': sparse_matrix,
             'matrix_info': matrix_info
         }
     
     def get_all_courses(self):
-        """Get all courses with grades"""
+        """Get all course summaries with grades (activity and student lists come with get_course_grades)"""
         return self.grades_data['courses']
     
     def get_tutor_courses(self, tutor_id):
-        """Get all courses for a specific tutor"""
+        """Get all course summaries for a specific tutor"""
         tutor_courses = {}
-        for course_key, course_info in self.grades_data['courses'].items():
+        for course_key, course_info in list(self.grades_data['courses'].items()):
             if course_info['tutor_id'] == tutor_id:
                 tutor_courses[course_key] = course_info
         return tutor_courses
@@ -307,31 +406,35 @@ class GradesStorage:
     def delete_course_grades(self, course_code, tutor_id):
         """Delete grades for a specific course"""
         course_key = f"{course_code}_{tutor_id}"
-        
-        if course_key in self.grades_data['courses']:
-            del self.grades_data['courses'][course_key]
-        
-        if course_key in self.grades_data['sparse_matrices']:
-            del self.grades_data['sparse_matrices'][course_key]
-        
-        self._save_data()
+        with self.course_locks.hold(course_key):
+            existed = course_key in self.grades_data['courses']
+            
+            if course_key in self.grades_data['courses']:
+                del self.grades_data['courses'][course_key]
+            
+            self.grades_data['matrices'].pop(course_key, None)
+            self._set_resident(course_key, None)
+            
+            self._save_data(course_key)
+            if existed:
+                self._publish(course_key, 'delete')
         return True
     
     def get_storage_stats(self):
         """Get storage statistics"""
         total_courses = len(self.grades_data['courses'])
-        total_matrices = len(self.grades_data['sparse_matrices'])
+        total_matrices = len(self.grades_data['matrices'])
         
         total_activities = 0
         total_students = 0
         total_grades = 0
         
-        for course_info in self.grades_data['courses'].values():
+        for course_info in list(self.grades_data['courses'].values()):
             total_activities += course_info.get('total_activities', 0)
             total_students += course_info.get('total_students', 0)
         
-        for matrix_info in self.grades_data['sparse_matrices'].values():
-            total_grades += len(matrix_info.get('matrix_data', {}))
+        for summary in list(self.grades_data['matrices'].values()):
+            total_grades += summary.get('cells') or 0
         
         return {
             'total_courses': total_courses,
@@ -340,8 +443,10 @@ class GradesStorage:
             'total_students': total_students,
             'total_grades': total_grades,
             'created_at': self.grades_data['metadata']['created_at'],
-            'last_updated': self.grades_data['metadata']['last_updated']
+            'last_updated': self.grades_data['metadata']['last_updated'],
+            'persistence': self.backend.get_stats(),
+            'resident_matrices': self.matrices.get_stats()
         }
 
 # Global instance
-grades_storage = GradesStorage() 
\ No newline at end of file
+grades_storage = GradesStorage(event_bus=default_event_bus) 
\ No newline at end of file
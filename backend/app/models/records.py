@@ -0,0 +1,173 @@
+from app.utils.columnar_store import from_epoch_micros
+
+
+class Record:
+    """
+    Registro base con __slots__ devuelto por los almacenamientos.
+    Se comporta como un diccionario de solo lectura: los campos sin valor (None)
+    se consideran ausentes, igual que en los diccionarios que se usaban antes.
+
+    Los campos de fecha (timestamps) se guardan como enteros en microsegundos desde
+    la época: como atributos se comparan y ordenan como enteros, y solo se convierten
+    a datetime al leerlos como diccionario (get, [], items, to_dict) o al serializarlos.
+    """
+
+    __slots__ = ()
+    timestamps = frozenset()
+
+    def _value(self, key):
+        """Valor de un campo tal como se expone como diccionario"""
+        value = getattr(self, key)
+        if value is not None and key in self.timestamps:
+            return from_epoch_micros(value)
+        return value
+
+    def get(self, key, default=None):
+        """Obtiene el valor de un campo o default si no tiene valor"""
+        if key not in self.__slots__:
+            return default
+        value = self._value(key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        value = self._value(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def keys(self):
+        """Nombres de los campos con valor"""
+        return [name for name in self.__slots__ if getattr(self, name) is not None]
+
+    def items(self):
+        """Pares (campo, valor) de los campos con valor"""
+        return [(name, self._value(name)) for name in self.__slots__ if getattr(self, name) is not None]
+
+    def to_dict(self):
+        """Convierte el registro a diccionario (solo campos con valor)"""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class User(Record):
+    """Usuario (tutor o administrador)"""
+
+    __slots__ = ('user_id', 'username', 'email', 'password_hash', 'first_name', 'last_name',
+                 'is_active', 'is_admin', 'created_at', 'updated_at')
+    timestamps = frozenset({'created_at', 'updated_at'})
+
+    def __init__(self, user_id=None, username=None, email=None, password_hash=None, first_name=None,
+                 last_name=None, is_active=None, is_admin=None, created_at=None, updated_at=None):
+        self.user_id = user_id
+        self.username = username
+        self.email = email
+        self.password_hash = password_hash
+        self.first_name = first_name
+        self.last_name = last_name
+        self.is_active = is_active
+        self.is_admin = is_admin
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+
+class Student(Record):
+    """Estudiante"""
+
+    __slots__ = ('student_id', 'carnet', 'password_hash', 'nombre', 'is_active', 'is_admin',
+                 'created_at', 'updated_at')
+    timestamps = frozenset({'created_at', 'updated_at'})
+
+    def __init__(self, student_id=None, carnet=None, password_hash=None, nombre=None, is_active=None,
+                 is_admin=None, created_at=None, updated_at=None):
+        self.student_id = student_id
+        self.carnet = carnet
+        self.password_hash = password_hash
+        self.nombre = nombre
+        self.is_active = is_active
+        self.is_admin = is_admin
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+
+class Course(Record):
+    """Curso"""
+
+    __slots__ = ('course_id', 'codigo', 'nombre', 'is_active', 'created_at')
+    timestamps = frozenset({'created_at'})
+
+    def __init__(self, course_id=None, codigo=None, nombre=None, is_active=None, created_at=None):
+        self.course_id = course_id
+        self.codigo = codigo
+        self.nombre = nombre
+        self.is_active = is_active
+        self.created_at = created_at
+
+
+class Schedule(Record):
+    """Horario de tutoría de un curso"""
+
+    __slots__ = ('schedule_id', 'codigo_curso', 'horario_inicio', 'horario_fin', 'tutor_id',
+                 'upload_date', 'is_active', 'created_at')
+    timestamps = frozenset({'upload_date', 'created_at'})
+
+    def __init__(self, schedule_id=None, codigo_curso=None, horario_inicio=None, horario_fin=None,
+                 tutor_id=None, upload_date=None, is_active=None, created_at=None):
+        self.schedule_id = schedule_id
+        self.codigo_curso = codigo_curso
+        self.horario_inicio = horario_inicio
+        self.horario_fin = horario_fin
+        self.tutor_id = tutor_id
+        self.upload_date = upload_date
+        self.is_active = is_active
+        self.created_at = created_at
+
+
+class Assignment(Record):
+    """Asignación base de una persona a un curso"""
+
+    __slots__ = ()
+
+
+class TutorAssignment(Assignment):
+    """Asignación tutor-curso"""
+
+    __slots__ = ('assignment_id', 'tutor_id', 'course_code', 'is_active', 'created_at', 'updated_at')
+    timestamps = frozenset({'created_at', 'updated_at'})
+
+    def __init__(self, assignment_id=None, tutor_id=None, course_code=None, is_active=None,
+                 created_at=None, updated_at=None):
+        self.assignment_id = assignment_id
+        self.tutor_id = tutor_id
+        self.course_code = course_code
+        self.is_active = is_active
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+
+class StudentAssignment(Assignment):
+    """Asignación estudiante-curso"""
+
+    __slots__ = ('assignment_id', 'student_id', 'course_code', 'is_active', 'created_at', 'updated_at')
+    timestamps = frozenset({'created_at', 'updated_at'})
+
+    def __init__(self, assignment_id=None, student_id=None, course_code=None, is_active=None,
+                 created_at=None, updated_at=None):
+        self.assignment_id = assignment_id
+        self.student_id = student_id
+        self.course_code = course_code
+        self.is_active = is_active
+        self.created_at = created_at
+        self.updated_at = updated_at
@@ -1,75 +1,30 @@
-from app.utils.sparse_matrix import SparseMatrix
+from app.utils.storage_backend import storage_backend
+from app.models.records import Schedule
 from datetime import datetime
 import json
 
 class ScheduleStorage:
     """
-    Sistema de almacenamiento de horarios usando matrices dispersas.
+    Sistema de almacenamiento de horarios usando un almacén columnar tipado.
     Almacena los horarios de tutoría por curso.
     """
     
-    def __init__(self):
-        # Matriz principal para almacenar horarios
-        # Dimensiones: (schedule_id, attribute_index)
-        self.schedules_matrix = SparseMatrix(10000, 8)  # 10k horarios, 8 atributos
+    def __init__(self, backend=None):
+        # Backend de los registros (memoria o SQLite), elegido por configuración
+        backend = backend or storage_backend
         
-        # Matriz de índices para búsquedas rápidas
-        # codigo_curso -> schedule_ids
-        self.course_index = SparseMatrix(10000, 1)
-        # tutor_id -> schedule_ids
-        self.tutor_index = SparseMatrix(10000, 1)
-        
-        # Contador de horarios
-        self.next_schedule_id = 1
-        
-        # Mapeo de atributos a índices de columna
-        self.attribute_map = {
-            'schedule_id': 0,
-            'codigo_curso': 1,
-            'horario_inicio': 2,
-            'horario_fin': 3,
-            'tutor_id': 4,
-            'upload_date': 5,
-            'is_active': 6,
-            'created_at': 7
-        }
-    
-    def _get_schedule_data(self, schedule_id):
-        """Obtiene todos los datos de un horario desde la matriz"""
-        if schedule_id <= 0 or schedule_id >= self.next_schedule_id:
-            return None
-        
-        schedule_data = {}
-        for attr, col_idx in self.attribute_map.items():
-            value = self.schedules_matrix.get_value(schedule_id, col_idx)
-            if value != 0:
-                # Convertir de vuelta a tipos apropiados
-                if attr in ['is_active']:
-                    schedule_data[attr] = bool(value)
-                elif attr in ['created_at', 'upload_date']:
-                    schedule_data[attr] = datetime.fromisoformat(str(value)) if value else None
-                elif attr in ['schedule_id', 'tutor_id']:
-                    schedule_data[attr] = int(value)
-                else:
-                    schedule_data[attr] = str(value) if value else None
-        
-        return schedule_data if schedule_data else None
-    
-    def _store_schedule_data(self, schedule_id, schedule_data):
-        """Almacena los datos de un horario en la matriz"""
-        for attr, value in schedule_data.items():
-            if attr in self.attribute_map:
-                col_idx = self.attribute_map[attr]
-                if value is not None:
-                    # Convertir a formato numérico para almacenamiento
-                    if isinstance(value, bool):
-                        self.schedules_matrix.set_value(schedule_id, col_idx, 1 if value else 0)
-                    elif isinstance(value, datetime):
-                        self.schedules_matrix.set_value(schedule_id, col_idx, value.isoformat())
-                    elif isinstance(value, int):
-                        self.schedules_matrix.set_value(schedule_id, col_idx, str(value))
-                    else:
-                        self.schedules_matrix.set_value(schedule_id, col_idx, str(value))
+        # Almacén columnar principal de horarios
+        # Cada atributo es una columna tipada indexada por schedule_id
+        self.schedules = backend.create_store('schedules', [
+            ('schedule_id', 'int'),
+            ('codigo_curso', 'str'),
+            ('horario_inicio', 'str'),
+            ('horario_fin', 'str'),
+            ('tutor_id', 'int'),
+            ('upload_date', 'timestamp'),
+            ('is_active', 'bool'),
+            ('created_at', 'timestamp')
+        ], record_type=Schedule, indexes=('codigo_curso', 'tutor_id'), ordered=('created_at',))
     
     def create_schedule(self, schedule_data):
         """Crea un nuevo horario"""
@@ -84,8 +39,7 @@ class ScheduleStorage:
                 raise ValueError("Todos los campos son requeridos: codigo_curso, horario_inicio, horario_fin, tutor_id")
             
             # Crear nuevo horario
-            schedule_id = self.next_schedule_id
-            self.next_schedule_id += 1
+            schedule_id = self.schedules.allocate_id()
             
             # Preparar datos
             now = datetime.utcnow()
@@ -94,79 +48,66 @@ class ScheduleStorage:
             schedule_data['upload_date'] = schedule_data.get('upload_date', now)
             schedule_data['is_active'] = schedule_data.get('is_active', True)
             
-            # Almacenar en matriz principal
-            self._store_schedule_data(schedule_id, schedule_data)
+            # Almacenar en el almacén columnar
+            self.schedules.insert(schedule_id, schedule_data)
             
-            # Actualizar índices
-            course_hash = hash(codigo_curso) % 10000
-            self.course_index.set_value(course_hash, 0, schedule_id)
-            
-            tutor_hash = hash(str(tutor_id)) % 10000
-            self.tutor_index.set_value(tutor_hash, 0, schedule_id)
-            
-            return self._get_schedule_data(schedule_id)
+            return self.schedules.get(schedule_id)
             
         except Exception as e:
             raise Exception(f"Error creando horario: {str(e)}")
     
     def get_schedule_by_id(self, schedule_id):
         """Obtiene un horario por ID"""
-        return self._get_schedule_data(schedule_id)
+        return self.schedules.get(schedule_id)
     
     def get_schedules_by_course(self, codigo_curso):
         """Obtiene todos los horarios de un curso específico"""
         if not codigo_curso:
             return []
         
-        schedules = []
-        course_hash = hash(codigo_curso) % 10000
-        schedule_id = self.course_index.get_value(course_hash, 0)
-        
-        if schedule_id > 0:
-            schedule_data = self._get_schedule_data(schedule_id)
-            if schedule_data and schedule_data.get('codigo_curso') == codigo_curso:
-                schedules.append(schedule_data)
-        
-        return schedules
+        schedule_ids = self.schedules.find('codigo_curso', codigo_curso)
+        return [self.schedules.get(schedule_id) for schedule_id in schedule_ids]
     
     def get_schedules_by_tutor(self, tutor_id):
         """Obtiene todos los horarios de un tutor específico"""
         if not tutor_id:
             return []
         
-        schedules = []
-        # Scan through all schedules to find those belonging to this tutor
-        for schedule_id in range(1, self.next_schedule_id):
-            schedule_data = self._get_schedule_data(schedule_id)
-            if schedule_data and schedule_data.get('tutor_id') == tutor_id:
-                schedules.append(schedule_data)
-        
-        return schedules
+        # Filtrar la columna tutor_id completa
+        schedule_ids = self.schedules.find('tutor_id', tutor_id)
+        return [self.schedules.get(schedule_id) for schedule_id in schedule_ids]
+    
+    def get_recent_schedules(self, limit=10, since=None):
+        """Obtiene los horarios creados más recientemente (desde since, si se indica) usando el índice de created_at"""
+        ids = self.schedules.find_range('created_at', low=since, limit=limit, descending=True)
+        return [self.schedules.get(record_id) for record_id in ids]
     
     def get_all_schedules(self):
         """Obtiene todos los horarios"""
-        schedules = []
-        for schedule_id in range(1, self.next_schedule_id):
-            schedule_data = self._get_schedule_data(schedule_id)
-            if schedule_data:
-                schedules.append(schedule_data)
-        return schedules
+        return self.schedules.get_all()
+    
+    def iter_schedules(self, after_id=0):
+        """Itera los horarios en orden de id sin construir una lista"""
+        return self.schedules.iter_records(after_id)
+    
+    def get_schedules_page(self, after_id=0, limit=None):
+        """Obtiene una página de horarios y el cursor de la siguiente"""
+        return self.schedules.page(after_id, limit)
     
     def update_schedule(self, schedule_id, update_data):
         """Actualiza un horario existente"""
         try:
-            schedule_data = self._get_schedule_data(schedule_id)
-            if not schedule_data:
+            if not self.schedules.exists(schedule_id):
                 return None
             
-            # Actualizar datos
-            schedule_data.update(update_data)
-            schedule_data['upload_date'] = datetime.utcnow()
+            # Preparar cambios
+            changes = dict(update_data)
+            changes['upload_date'] = datetime.utcnow()
             
             # Almacenar datos actualizados
-            self._store_schedule_data(schedule_id, schedule_data)
+            self.schedules.update(schedule_id, changes)
             
-            return schedule_data
+            return self.schedules.get(schedule_id)
             
         except Exception as e:
             raise Exception(f"Error actualizando horario: {str(e)}")
@@ -174,50 +115,52 @@ class ScheduleStorage:
     def delete_schedule(self, schedule_id):
         """Elimina un horario"""
         try:
-            schedule_data = self._get_schedule_data(schedule_id)
-            if not schedule_data:
-                return False
-            
-            # Limpiar datos de la matriz principal
-            for col_idx in self.attribute_map.values():
-                self.schedules_matrix.set_value(schedule_id, col_idx, 0)
-            
-            # Limpiar índices
-            codigo_curso = schedule_data.get('codigo_curso')
-            tutor_id = schedule_data.get('tutor_id')
-            
-            if codigo_curso:
-                course_hash = hash(codigo_curso) % 10000
-                self.course_index.set_value(course_hash, 0, 0)
-            
-            if tutor_id:
-                tutor_hash = hash(str(tutor_id)) % 10000
-                self.tutor_index.set_value(tutor_hash, 0, 0)
-            
-            return True
+            return self.schedules.delete(schedule_id)
             
         except Exception as e:
             raise Exception(f"Error eliminando horario: {str(e)}")
     
     def bulk_create_schedules(self, schedules_list):
-        """Crea múltiples horarios de una vez"""
+        """
+        Crea múltiples horarios en un solo bloque (todo o nada).
+        Los horarios idénticos dentro del lote se crean una sola vez.
+        """
         try:
-            created_schedules = []
+            # Validar y deduplicar el lote completo antes de escribir
+            pending = {}
             for schedule_data in schedules_list:
-                created_schedule = self.create_schedule(schedule_data)
-                created_schedules.append(created_schedule)
+                key = (
+                    schedule_data.get('codigo_curso'),
+                    schedule_data.get('horario_inicio'),
+                    schedule_data.get('horario_fin'),
+                    schedule_data.get('tutor_id')
+                )
+                if not all(key):
+                    raise ValueError("Todos los campos son requeridos: codigo_curso, horario_inicio, horario_fin, tutor_id")
+                pending.setdefault(key, schedule_data)
+            
+            # Asignar ids en bloque y escribir las columnas de una vez
+            schedule_ids = self.schedules.allocate_ids(len(pending))
+            now = datetime.utcnow()
+            records = [
+                dict(schedule_data, schedule_id=schedule_id, created_at=now,
+                     upload_date=schedule_data.get('upload_date', now),
+                     is_active=schedule_data.get('is_active', True))
+                for schedule_id, schedule_data in zip(schedule_ids, pending.values())
+            ]
+            self.schedules.bulk_insert(schedule_ids, records)
             
-            return created_schedules
+            return [self.schedules.get(schedule_id) for schedule_id in schedule_ids]
             
         except Exception as e:
             raise Exception(f"Error creando horarios masivamente: {str(e)}")
     
+    def compact(self):
+        """Compacta el almacén de horarios liberando las ranuras de registros eliminados"""
+        return self.schedules.compact()
+    
     def get_matrix_stats(self):
-        """Obtiene estadísticas de las matrices"""
-        return {
-            'schedules_matrix_density': self.schedules_matrix.get_density(),
-            'course_index_density': self.course_index.get_density(),
-            'tutor_index_density': self.tutor_index.get_density(),
-            'total_schedules': self.next_schedule_id - 1,
-            'non_zero_schedules': len(self.schedules_matrix.get_non_zero_elements())
-        } 
\ No newline at end of file
+        """Obtiene estadísticas del almacenamiento"""
+        stats = self.schedules.get_stats()
+        stats['total_schedules'] = self.schedules.count
+        return stats
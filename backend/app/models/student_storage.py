@@ -1,79 +1,38 @@
-from app.utils.sparse_matrix import SparseMatrix
-import bcrypt
+from app.utils.storage_backend import storage_backend
+from app.models.records import Student
+from app.utils.password_hasher import password_hasher
 from datetime import datetime
 
 class StudentStorage:
     """
-    Sistema de almacenamiento de estudiantes usando matrices dispersas.
+    Sistema de almacenamiento de estudiantes usando un almacén columnar tipado.
     """
     
-    def __init__(self):
-        # Matriz principal para almacenar estudiantes
-        # Dimensiones: (student_id, attribute_index)
-        self.students_matrix = SparseMatrix(10000, 8)  # 10k estudiantes, 8 atributos
+    def __init__(self, backend=None):
+        # Backend de los registros (memoria o SQLite), elegido por configuración
+        backend = backend or storage_backend
+        self.backend = backend
         
-        # Matriz de índices para búsquedas rápidas
-        # carnet -> student_id
-        self.carnet_index = SparseMatrix(10000, 1)
-        
-        # Contador de estudiantes
-        self.next_student_id = 1
-        
-        # Mapeo de atributos a índices de columna
-        self.attribute_map = {
-            'student_id': 0,
-            'carnet': 1,
-            'password_hash': 2,
-            'nombre': 3,
-            'is_active': 4,
-            'is_admin': 5,
-            'created_at': 6,
-            'updated_at': 7
-        }
+        # Almacén columnar principal de estudiantes
+        # Cada atributo es una columna tipada indexada por student_id
+        self.students = backend.create_store('students', [
+            ('student_id', 'int'),
+            ('carnet', 'str'),
+            ('password_hash', 'str'),
+            ('nombre', 'str'),
+            ('is_active', 'bool'),
+            ('is_admin', 'bool'),
+            ('created_at', 'timestamp'),
+            ('updated_at', 'timestamp')
+        ], record_type=Student, unique=('carnet',), ordered=('created_at',))
     
     def _hash_password(self, password):
         """Hashea una contraseña usando bcrypt"""
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        return password_hasher.hash(password)
     
     def _check_password(self, password, hashed):
         """Verifica una contraseña contra su hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-    
-    def _get_student_data(self, student_id):
-        """Obtiene todos los datos de un estudiante desde la matriz"""
-        if student_id <= 0 or student_id >= self.next_student_id:
-            return None
-        
-        student_data = {}
-        for attr, col_idx in self.attribute_map.items():
-            value = self.students_matrix.get_value(student_id, col_idx)
-            if value != 0:
-                # Convertir de vuelta a tipos apropiados
-                if attr in ['is_active', 'is_admin']:
-                    student_data[attr] = bool(value)
-                elif attr in ['created_at', 'updated_at']:
-                    student_data[attr] = datetime.fromisoformat(str(value)) if value else None
-                elif attr == 'student_id':
-                    student_data[attr] = int(value)
-                else:
-                    student_data[attr] = str(value) if value else None
-        
-        return student_data if student_data else None
-    
-    def _store_student_data(self, student_id, student_data):
-        """Almacena los datos de un estudiante en la matriz"""
-        for attr, value in student_data.items():
-            if attr in self.attribute_map:
-                col_idx = self.attribute_map[attr]
-                if value is not None:
-                    # Convertir a formato numérico para almacenamiento
-                    if isinstance(value, bool):
-                        self.students_matrix.set_value(student_id, col_idx, 1 if value else 0)
-                    elif isinstance(value, datetime):
-                        self.students_matrix.set_value(student_id, col_idx, value.isoformat())
-                    else:
-                        self.students_matrix.set_value(student_id, col_idx, str(value))
+        return password_hasher.check(password, hashed)
     
     def create_student(self, student_data):
         """Crea un nuevo estudiante"""
@@ -86,101 +45,156 @@ class StudentStorage:
             if not carnet or not password or not nombre:
                 raise ValueError("Carnet, contraseña y nombre son requeridos")
             
-            # Verificar que el carnet no exista
-            existing_student = self.get_student_by_carnet(carnet)
-            if existing_student:
-                raise ValueError(f"El estudiante con carnet {carnet} ya existe")
-            
-            # Crear nuevo estudiante
-            student_id = self.next_student_id
-            self.next_student_id += 1
-            
-            # Preparar datos
-            now = datetime.utcnow()
-            student_data['student_id'] = student_id
-            student_data['created_at'] = now
-            student_data['updated_at'] = now
-            student_data['is_active'] = student_data.get('is_active', True)
-            student_data['is_admin'] = student_data.get('is_admin', False)
-            
-            # Hashear contraseña
+            # Hashear contraseña (antes de tomar el candado del carnet)
             student_data['password_hash'] = self._hash_password(password)
             del student_data['password']
             
-            # Almacenar en matriz principal
-            self._store_student_data(student_id, student_data)
+            # Comprobar y reservar el carnet de forma atómica frente a altas concurrentes
+            with self.students.lock_key('carnet', str(carnet)):
+                # Verificar que el carnet no exista
+                if self.students.find_first('carnet', carnet) is not None:
+                    raise ValueError(f"El estudiante con carnet {carnet} ya existe")
+                
+                # Crear nuevo estudiante
+                student_id = self.students.allocate_id()
+                
+                # Preparar datos
+                now = datetime.utcnow()
+                student_data['student_id'] = student_id
+                student_data['created_at'] = now
+                student_data['updated_at'] = now
+                student_data['is_active'] = student_data.get('is_active', True)
+                student_data['is_admin'] = student_data.get('is_admin', False)
+                
+                # Almacenar en el almacén columnar
+                self.students.insert(student_id, student_data)
             
-            # Actualizar índice
-            carnet_hash = hash(carnet) % 10000
-            self.carnet_index.set_value(carnet_hash, 0, student_id)
-            
-            return self._get_student_data(student_id)
+            return self.students.get(student_id)
             
         except Exception as e:
             raise Exception(f"Error creando estudiante: {str(e)}")
     
     def get_student_by_id(self, student_id):
         """Obtiene un estudiante por ID"""
-        return self._get_student_data(student_id)
+        return self.students.get(student_id)
     
     def get_student_by_carnet(self, carnet):
         """Obtiene un estudiante por carnet"""
         if not carnet:
             return None
         
-        carnet_hash = hash(carnet) % 10000
-        student_id = self.carnet_index.get_value(carnet_hash, 0)
-        
-        if student_id > 0:
-            student_data = self._get_student_data(student_id)
-            if student_data and student_data.get('carnet') == carnet:
-                return student_data
-        
-        # If hash lookup failed, do a linear search through all students
-        # This handles hash collisions
-        all_students = self.get_all_students()
-        for student in all_students:
-            if student.get('carnet') == carnet:
-                return student
-        
-        return None
+        student_id = self.students.find_first('carnet', carnet)
+        if student_id is None:
+            return None
+        return self.students.get(student_id)
+    
+    def get_recent_students(self, limit=10, since=None):
+        """Obtiene los estudiantes creados más recientemente (desde since, si se indica) usando el índice de created_at"""
+        ids = self.students.find_range('created_at', low=since, limit=limit, descending=True)
+        return [self.students.get(record_id) for record_id in ids]
     
     def get_all_students(self):
         """Obtiene todos los estudiantes"""
-        students = []
-        for student_id in range(1, self.next_student_id):
-            student_data = self._get_student_data(student_id)
-            if student_data:
-                students.append(student_data)
-        return students
+        return self.students.get_all()
+    
+    def iter_students(self, after_id=0):
+        """Itera los estudiantes en orden de id sin construir una lista"""
+        return self.students.iter_records(after_id)
+    
+    def get_students_page(self, after_id=0, limit=None):
+        """Obtiene una página de estudiantes y el cursor de la siguiente"""
+        return self.students.page(after_id, limit)
     
     def authenticate_student(self, carnet, password):
         """Autentica un estudiante con carnet y contraseña"""
-        student_data = self.get_student_by_carnet(carnet)
+        return self.verify_student(self.get_student_by_carnet(carnet), password)
+    
+    def verify_student(self, student_data, password):
+        """Verifica la contraseña de un estudiante ya encontrado (una sola verificación bcrypt)"""
         if student_data and student_data.get('is_active'):
             stored_hash = student_data.get('password_hash')
             if stored_hash and self._check_password(password, stored_hash):
-                return student_data
+                return self._rehash_if_needed(student_data, password)
         return None
     
-    def bulk_create_students(self, students_list):
-        """Crea múltiples estudiantes de una vez"""
+    def _rehash_if_needed(self, student_data, password):
+        """Regenera el hash de la contraseña si su costo es menor al de la política vigente"""
+        if not password_hasher.needs_rehash(student_data['password_hash']):
+            return student_data
+        student_id = student_data['student_id']
+        password_hash = self._hash_password(password)
+        # Solo la escritura va dentro de la transacción (y del candado de escritor compartido)
+        with self.backend.transaction():
+            self.students.update(student_id, {'password_hash': password_hash})
+        return self.students.get(student_id)
+    
+    def bulk_create_students(self, students_list, skip_existing=False):
+        """
+        Crea múltiples estudiantes en un solo bloque (todo o nada).
+        Los carnets repetidos dentro del lote se descartan; los que ya existen
+        producen un error, o se omiten si skip_existing es True. Cada estudiante
+        trae 'password' (se hashean todas en paralelo) o un 'password_hash' ya
+        calculado.
+        """
         try:
-            created_students = []
+            # Validar y deduplicar el lote completo antes de escribir
+            pending = {}
             for student_data in students_list:
-                created_student = self.create_student(student_data)
-                created_students.append(created_student)
+                carnet = student_data.get('carnet')
+                password = student_data.get('password') or student_data.get('password_hash')
+                if not carnet or not password or not student_data.get('nombre'):
+                    raise ValueError("Carnet, contraseña y nombre son requeridos")
+                pending.setdefault(str(carnet), student_data)
+            
+            existing = self.students.existing_values('carnet', pending)
+            if existing and not skip_existing:
+                raise ValueError(f"Los estudiantes con carnet {', '.join(sorted(existing))} ya existen")
+            for carnet in existing:
+                del pending[carnet]
             
-            return created_students
+            # Hashear en paralelo las contraseñas que no vienen hasheadas
+            to_hash = [carnet for carnet, student_data in pending.items() if 'password_hash' not in student_data]
+            password_hashes = dict(zip(to_hash, password_hasher.hash_many(
+                pending[carnet]['password'] for carnet in to_hash
+            )))
+            
+            with self.students.lock_keys(('carnet', carnet) for carnet in pending):
+                # Volver a comprobar con los candados tomados: otra alta pudo ocupar un carnet
+                # mientras se calculaban los hashes
+                existing = self.students.existing_values('carnet', pending)
+                if existing and not skip_existing:
+                    raise ValueError(f"Los estudiantes con carnet {', '.join(sorted(existing))} ya existen")
+                for carnet in existing:
+                    del pending[carnet]
+                
+                # Asignar ids en bloque y escribir las columnas de una vez
+                student_ids = self.students.allocate_ids(len(pending))
+                now = datetime.utcnow()
+                records = []
+                for student_id, (carnet, student_data) in zip(student_ids, pending.items()):
+                    record = {key: value for key, value in student_data.items() if key != 'password'}
+                    record.update({
+                        'student_id': student_id,
+                        'password_hash': student_data.get('password_hash') or password_hashes[carnet],
+                        'created_at': now,
+                        'updated_at': now,
+                        'is_active': student_data.get('is_active', True),
+                        'is_admin': student_data.get('is_admin', False)
+                    })
+                    records.append(record)
+                self.students.bulk_insert(student_ids, records)
+            
+            return [self.students.get(student_id) for student_id in student_ids]
             
         except Exception as e:
             raise Exception(f"Error creando estudiantes masivamente: {str(e)}")
     
+    def compact(self):
+        """Compacta el almacén de estudiantes liberando las ranuras de registros eliminados"""
+        return self.students.compact()
+    
     def get_matrix_stats(self):
-        """Obtiene estadísticas de las matrices"""
-        return {
-            'students_matrix_density': self.students_matrix.get_density(),
-            'carnet_index_density': self.carnet_index.get_density(),
-            'total_students': self.next_student_id - 1,
-            'non_zero_students': len(self.students_matrix.get_non_zero_elements())
-        } 
\ No newline at end of file
+        """Obtiene estadísticas del almacenamiento"""
+        stats = self.students.get_stats()
+        stats['total_students'] = self.students.count
+        return stats
@@ -1,89 +1,47 @@
-from app.utils.sparse_matrix import SparseMatrix
+from app.utils.storage_backend import storage_backend
+from app.models.records import User
 import json
 import hashlib
-import bcrypt
+from app.utils.password_hasher import password_hasher
 from datetime import datetime
 
 class UserStorage:
     """
-    Sistema de almacenamiento de usuarios usando matrices dispersas.
-    No utiliza SQL, todo se maneja en memoria con matrices dispersas.
+    Sistema de almacenamiento de usuarios usando un almacén columnar tipado.
+    Por defecto todo se maneja en memoria con columnas compactas; con el backend
+    SQLite los registros viven en una tabla local con la misma interfaz.
     """
     
-    def __init__(self):
-        # Matriz principal para almacenar usuarios
-        # Dimensiones: (user_id, attribute_index)
-        self.users_matrix = SparseMatrix(10000, 10)  # 10k usuarios, 10 atributos
+    def __init__(self, backend=None):
+        # Backend de los registros (memoria o SQLite), elegido por configuración
+        backend = backend or storage_backend
+        self.backend = backend
         
-        # Matriz de índices para búsquedas rápidas
-        # username -> user_id
-        self.username_index = SparseMatrix(10000, 1)
-        # email -> user_id  
-        self.email_index = SparseMatrix(10000, 1)
-        
-        # Contador de usuarios
-        self.next_user_id = 1
-        
-        # Mapeo de atributos a índices de columna
-        self.attribute_map = {
-            'username': 0,
-            'email': 1,
-            'password_hash': 2,
-            'first_name': 3,
-            'last_name': 4,
-            'is_active': 5,
-            'is_admin': 6,
-            'created_at': 7,
-            'updated_at': 8,
-            'user_id': 9
-        }
+        # Almacén columnar principal de usuarios
+        # Cada atributo es una columna tipada indexada por user_id
+        self.users = backend.create_store('users', [
+            ('user_id', 'int'),
+            ('username', 'str'),
+            ('email', 'str'),
+            ('password_hash', 'str'),
+            ('first_name', 'str'),
+            ('last_name', 'str'),
+            ('is_active', 'bool'),
+            ('is_admin', 'bool'),
+            ('created_at', 'timestamp'),
+            ('updated_at', 'timestamp')
+        ], record_type=User, unique=('username', 'email'), ordered=('created_at',))
     
     def _hash_password(self, password):
         """Hashea una contraseña usando bcrypt"""
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        return password_hasher.hash(password)
     
     def _check_password(self, password, hashed):
         """Verifica una contraseña contra su hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-    
-    def _get_user_data(self, user_id):
-        """Obtiene todos los datos de un usuario desde la matriz"""
-        if user_id <= 0 or user_id >= self.next_user_id:
-            return None
-        
-        user_data = {}
-        for attr, col_idx in self.attribute_map.items():
-            value = self.users_matrix.get_value(user_id, col_idx)
-            if value != 0:
-                # Convertir de vuelta a tipos apropiados
-                if attr in ['is_active', 'is_admin']:
-                    user_data[attr] = bool(value)
-                elif attr in ['created_at', 'updated_at']:
-                    user_data[attr] = datetime.fromisoformat(str(value)) if value else None
-                elif attr == 'user_id':
-                    user_data[attr] = int(value)
-                else:
-                    user_data[attr] = str(value) if value else None
-        
-        return user_data if user_data else None
-    
-    def _store_user_data(self, user_id, user_data):
-        """Almacena los datos de un usuario en la matriz"""
-        for attr, value in user_data.items():
-            if attr in self.attribute_map:
-                col_idx = self.attribute_map[attr]
-                if value is not None:
-                    # Convertir a formato numérico para almacenamiento
-                    if isinstance(value, bool):
-                        self.users_matrix.set_value(user_id, col_idx, 1 if value else 0)
-                    elif isinstance(value, datetime):
-                        self.users_matrix.set_value(user_id, col_idx, value.isoformat())
-                    else:
-                        self.users_matrix.set_value(user_id, col_idx, str(value))
+        return password_hasher.check(password, hashed)
     
-    def create_user(self, user_data):
-        """Crea un nuevo usuario"""
+    def create_user(self, user_data, password_hash=None):
+        """Crea un nuevo usuario (password_hash: hash ya calculado de la contraseña, p. ej. en lote)"""
         try:
             # Verificar que username y email no existan
             username = user_data.get('username')
@@ -92,138 +50,113 @@ class UserStorage:
             if not username or not email:
                 raise ValueError("Username y email son requeridos")
             
-            # Buscar si ya existe
-            existing_user = self.get_user_by_username(username)
-            if existing_user:
-                raise ValueError("Username ya existe")
-            
-            existing_user = self.get_user_by_email(email)
-            if existing_user:
-                raise ValueError("Email ya existe")
-            
-            # Crear nuevo usuario
-            user_id = self.next_user_id
-            self.next_user_id += 1
-            
-            # Preparar datos
-            now = datetime.utcnow()
-            user_data['user_id'] = user_id
-            user_data['created_at'] = now
-            user_data['updated_at'] = now
-            user_data['is_active'] = user_data.get('is_active', True)
-            user_data['is_admin'] = user_data.get('is_admin', False)
-            
-            # Hashear contraseña si se proporciona
+            # Hashear contraseña si se proporciona (salvo que ya venga hasheada en lote),
+            # antes de tomar el candado de las claves
             if 'password' in user_data:
-                user_data['password_hash'] = self._hash_password(user_data['password'])
+                user_data['password_hash'] = password_hash or self._hash_password(user_data['password'])
                 del user_data['password']
             
-            # Almacenar en matriz principal
-            self._store_user_data(user_id, user_data)
-            
-            # Actualizar índices
-            self.username_index.set_value(hash(username) % 10000, 0, user_id)
-            self.email_index.set_value(hash(email) % 10000, 0, user_id)
+            # Comprobar y reservar username y email de forma atómica frente a altas concurrentes
+            with self.users.lock_keys([('username', username), ('email', email)]):
+                # Buscar si ya existe
+                if self.users.find_first('username', username) is not None:
+                    raise ValueError("Username ya existe")
+                
+                if self.users.find_first('email', email) is not None:
+                    raise ValueError("Email ya existe")
+                
+                # Crear nuevo usuario
+                user_id = self.users.allocate_id()
+                
+                # Preparar datos
+                now = datetime.utcnow()
+                user_data['user_id'] = user_id
+                user_data['created_at'] = now
+                user_data['updated_at'] = now
+                user_data['is_active'] = user_data.get('is_active', True)
+                user_data['is_admin'] = user_data.get('is_admin', False)
+                
+                # Almacenar en el almacén columnar
+                self.users.insert(user_id, user_data)
             
-            return self._get_user_data(user_id)
+            return self.users.get(user_id)
             
         except Exception as e:
             raise Exception(f"Error creando usuario: {str(e)}")
     
     def get_user_by_id(self, user_id):
         """Obtiene un usuario por ID"""
-        return self._get_user_data(user_id)
+        return self.users.get(user_id)
     
     def get_user_by_username(self, username):
         """Obtiene un usuario por username"""
         if not username:
             return None
         
-        # Buscar en índice de usernames
-        hash_value = hash(username) % 10000
-        user_id = self.username_index.get_value(hash_value, 0)
-        
-        if user_id > 0:
-            user_data = self._get_user_data(user_id)
-            if user_data and user_data.get('username') == username:
-                return user_data
-        
-        # If hash lookup failed, do a linear search through all users
-        # This handles hash collisions
-        all_users = self.get_all_users()
-        for user in all_users:
-            if user.get('username') == username:
-                return user
-        
-        return None
+        user_id = self.users.find_first('username', username)
+        if user_id is None:
+            return None
+        return self.users.get(user_id)
     
     def get_user_by_email(self, email):
         """Obtiene un usuario por email"""
         if not email:
             return None
         
-        # Buscar en índice de emails
-        hash_value = hash(email) % 10000
-        user_id = self.email_index.get_value(hash_value, 0)
-        
-        if user_id > 0:
-            user_data = self._get_user_data(user_id)
-            if user_data and user_data.get('email') == email:
-                return user_data
-        
-        return None
+        user_id = self.users.find_first('email', email)
+        if user_id is None:
+            return None
+        return self.users.get(user_id)
+    
+    def get_recent_users(self, limit=10, since=None):
+        """Obtiene los usuarios creados más recientemente (desde since, si se indica) usando el índice de created_at"""
+        ids = self.users.find_range('created_at', low=since, limit=limit, descending=True)
+        return [self.users.get(record_id) for record_id in ids]
     
     def get_all_users(self):
         """Obtiene todos los usuarios"""
-        users = []
-        for user_id in range(1, self.next_user_id):
-            user_data = self._get_user_data(user_id)
-            if user_data:
-                users.append(user_data)
-        return users
+        return self.users.get_all()
+    
+    def iter_users(self, after_id=0):
+        """Itera los usuarios en orden de id sin construir una lista"""
+        return self.users.iter_records(after_id)
     
-    def update_user(self, user_id, update_data):
-        """Actualiza un usuario existente"""
+    def get_users_page(self, after_id=0, limit=None):
+        """Obtiene una página de usuarios y el cursor de la siguiente"""
+        return self.users.page(after_id, limit)
+    
+    def update_user(self, user_id, update_data, password_hash=None):
+        """Actualiza un usuario existente (password_hash: hash ya calculado de la contraseña nueva)"""
         try:
-            user_data = self._get_user_data(user_id)
-            if not user_data:
+            if not self.users.exists(user_id):
                 return None
             
-            # Verificar unicidad de username/email si se están actualizando
-            if 'username' in update_data:
-                existing = self.get_user_by_username(update_data['username'])
-                if existing and existing['user_id'] != user_id:
-                    raise ValueError("Username ya existe")
+            # Preparar cambios
+            changes = dict(update_data)
+            changes['updated_at'] = datetime.utcnow()
             
-            if 'email' in update_data:
-                existing = self.get_user_by_email(update_data['email'])
-                if existing and existing['user_id'] != user_id:
-                    raise ValueError("Email ya existe")
+            # Hashear nueva contraseña si se proporciona (salvo que ya venga hasheada en lote)
+            if 'password' in changes:
+                changes['password_hash'] = password_hash or self._hash_password(changes['password'])
+                del changes['password']
             
-            # Actualizar datos
-            user_data.update(update_data)
-            user_data['updated_at'] = datetime.utcnow()
+            keys = [(name, update_data[name]) for name in ('username', 'email') if name in update_data]
+            with self.users.lock_keys(keys):
+                # Verificar unicidad de username/email si se están actualizando
+                if 'username' in update_data:
+                    existing_id = self.users.find_first('username', update_data['username'])
+                    if existing_id is not None and existing_id != user_id:
+                        raise ValueError("Username ya existe")
+                
+                if 'email' in update_data:
+                    existing_id = self.users.find_first('email', update_data['email'])
+                    if existing_id is not None and existing_id != user_id:
+                        raise ValueError("Email ya existe")
+                
+                # Almacenar datos actualizados
+                self.users.update(user_id, changes)
             
-            # Hashear nueva contraseña si se proporciona
-            if 'password' in user_data:
-                user_data['password_hash'] = self._hash_password(user_data['password'])
-                del user_data['password']
-            
-            # Almacenar datos actualizados
-            self._store_user_data(user_id, user_data)
-            
-            # Actualizar índices si username o email cambiaron
-            if 'username' in update_data:
-                old_username = user_data.get('username')
-                if old_username:
-                    self.username_index.set_value(hash(update_data['username']) % 10000, 0, user_id)
-            
-            if 'email' in update_data:
-                old_email = user_data.get('email')
-                if old_email:
-                    self.email_index.set_value(hash(update_data['email']) % 10000, 0, user_id)
-            
-            return user_data
+            return self.users.get(user_id)
             
         except Exception as e:
             raise Exception(f"Error actualizando usuario: {str(e)}")
@@ -231,43 +164,115 @@ class UserStorage:
     def delete_user(self, user_id):
         """Elimina un usuario"""
         try:
-            user_data = self._get_user_data(user_id)
-            if not user_data:
-                return False
-            
-            # Limpiar datos de la matriz principal
-            for col_idx in self.attribute_map.values():
-                self.users_matrix.set_value(user_id, col_idx, 0)
-            
-            # Limpiar índices
-            username = user_data.get('username')
-            email = user_data.get('email')
-            
-            if username:
-                self.username_index.set_value(hash(username) % 10000, 0, 0)
-            if email:
-                self.email_index.set_value(hash(email) % 10000, 0, 0)
-            
-            return True
+            return self.users.delete(user_id)
             
         except Exception as e:
             raise Exception(f"Error eliminando usuario: {str(e)}")
     
     def authenticate_user(self, username, password):
         """Autentica un usuario con username y contraseña"""
-        user_data = self.get_user_by_username(username)
+        return self.verify_user(self.get_user_by_username(username), password)
+    
+    def verify_user(self, user_data, password):
+        """Verifica la contraseña de un usuario ya encontrado (una sola verificación bcrypt)"""
         if user_data and user_data.get('is_active'):
             stored_hash = user_data.get('password_hash')
             if stored_hash and self._check_password(password, stored_hash):
-                return user_data
+                return self._rehash_if_needed(user_data, password)
         return None
     
+    def _rehash_if_needed(self, user_data, password):
+        """Regenera el hash de la contraseña si su costo es menor al de la política vigente"""
+        if not password_hasher.needs_rehash(user_data['password_hash']):
+            return user_data
+        user_id = user_data['user_id']
+        password_hash = self._hash_password(password)
+        # Solo la escritura va dentro de la transacción (y del candado de escritor compartido)
+        with self.backend.transaction():
+            self.users.update(user_id, {'password_hash': password_hash})
+        return self.users.get(user_id)
+    
+    def bulk_create_users(self, users_list, skip_existing=False):
+        """
+        Crea múltiples usuarios en un solo bloque (todo o nada).
+        Los usernames o emails repetidos dentro del lote se descartan (gana el
+        primero); los usernames o emails que ya existen producen un error, o se
+        omiten si skip_existing es True. Cada usuario trae 'password' (se hashean
+        todas en paralelo) o un 'password_hash' ya calculado.
+        """
+        try:
+            # Validar y deduplicar el lote completo antes de escribir
+            pending = {}
+            claimed_emails = set()
+            for user_data in users_list:
+                username = user_data.get('username')
+                if not username or not user_data.get('email'):
+                    raise ValueError("Username y email son requeridos")
+                if str(username) in pending or str(user_data['email']) in claimed_emails:
+                    continue
+                pending[str(username)] = user_data
+                claimed_emails.add(str(user_data['email']))
+            
+            self._drop_existing(pending, skip_existing)
+            
+            # Hashear en paralelo las contraseñas que no vienen hasheadas
+            to_hash = [username for username, user_data in pending.items() if 'password_hash' not in user_data]
+            password_hashes = dict(zip(to_hash, password_hasher.hash_many(
+                pending[username].get('password') or '' for username in to_hash
+            )))
+            
+            keys = [('username', username) for username in pending]
+            keys += [('email', str(user_data['email'])) for user_data in pending.values()]
+            with self.users.lock_keys(keys):
+                # Volver a comprobar con los candados tomados: otra alta pudo ocupar un
+                # username o un email mientras se calculaban los hashes
+                self._drop_existing(pending, skip_existing)
+                
+                # Asignar ids en bloque y escribir las columnas de una vez
+                user_ids = self.users.allocate_ids(len(pending))
+                now = datetime.utcnow()
+                records = []
+                for user_id, (username, user_data) in zip(user_ids, pending.items()):
+                    record = {key: value for key, value in user_data.items() if key != 'password'}
+                    record.update({
+                        'user_id': user_id,
+                        'password_hash': user_data.get('password_hash') or password_hashes[username],
+                        'created_at': now,
+                        'updated_at': now,
+                        'is_active': user_data.get('is_active', True),
+                        'is_admin': user_data.get('is_admin', False)
+                    })
+                    records.append(record)
+                self.users.bulk_insert(user_ids, records)
+            
+            return [self.users.get(user_id) for user_id in user_ids]
+            
+        except Exception as e:
+            raise Exception(f"Error creando usuarios masivamente: {str(e)}")
+    
+    def _drop_existing(self, pending, skip_existing):
+        """
+        Quita del lote los usuarios cuyo username o email ya existe, o lanza un
+        error si skip_existing es False.
+
+        Args:
+            pending (dict): username -> datos del usuario, se modifica en el lugar
+            skip_existing (bool): Omitir los existentes en lugar de fallar
+        """
+        existing = self.users.existing_values('username', pending)
+        taken_emails = self.users.existing_values('email', [user_data['email'] for user_data in pending.values()])
+        existing.update(username for username, user_data in pending.items() if user_data['email'] in taken_emails)
+        if existing and not skip_existing:
+            raise ValueError(f"Los usuarios {', '.join(sorted(existing))} ya existen")
+        for username in existing:
+            del pending[username]
+    
+    def compact(self):
+        """Compacta el almacén de usuarios liberando las ranuras de registros eliminados"""
+        return self.users.compact()
+    
     def get_matrix_stats(self):
-        """Obtiene estadísticas de las matrices"""
-        return {
-            'users_matrix_density': self.users_matrix.get_density(),
-            'username_index_density': self.username_index.get_density(),
-            'email_index_density': self.email_index.get_density(),
-            'total_users': self.next_user_id - 1,
-            'non_zero_users': len(self.users_matrix.get_non_zero_elements())
-        } 
\ No newline at end of file
+        """Obtiene estadísticas del almacenamiento"""
+        stats = self.users.get_stats()
+        stats['total_users'] = self.users.count
+        return stats
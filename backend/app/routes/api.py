@@ -1,5 +1,7 @@
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, make_response
 from app.services.user_service import UserService
+from app.services.identity_service import IdentityService
+from app.services.unit_of_work import ConfigurationUnitOfWork
 from app.models.schedule_storage import ScheduleStorage
 from marshmallow import ValidationError
 import jwt
@@ -13,6 +15,15 @@ from app.models.course_storage import CourseStorage
 from app.models.student_storage import StudentStorage
 from app.models.assignment_storage import AssignmentStorage
 from ..models.grades_storage import grades_storage
+from app.utils.serializers import json_response
+from app.utils.query import Query
+from app.utils.snapshot import SnapshotManager
+from app.utils.wal import WriteAheadLog
+from app.utils.shared_storage import SharedStorage
+from app.utils.password_hasher import password_hasher
+from app.utils.events import event_bus
+from app.utils.storage_backend import storage_backend
+from app.utils.search_index import SearchIndex
 import graphviz
 
 api_bp = Blueprint('api', __name__)
@@ -21,6 +32,66 @@ schedule_storage = ScheduleStorage()
 course_storage = CourseStorage()
 student_storage = StudentStorage()
 assignment_storage = AssignmentStorage()
+identity_service = IdentityService(user_service.user_storage, student_storage)
+
+stores = {
+    'users': user_service.user_storage.users,
+    'students': student_storage.students,
+    'courses': course_storage.courses,
+    'schedules': schedule_storage.schedules,
+    'tutor_assignments': assignment_storage.tutor_assignments,
+    'student_assignments': assignment_storage.student_assignments
+}
+
+# Every store publishes its changes (entity = store name) for cache invalidation
+for store_name, store in stores.items():
+    store.attach_events(event_bus, store_name)
+
+# Binary snapshot of the in-memory stores, loaded at import for a warm start.
+# The SQLite backend is durable by itself, so snapshots and the log are memory-only.
+snapshot_manager = None
+if storage_backend.in_memory:
+    snapshot_manager = SnapshotManager(stores, os.environ.get('SNAPSHOT_PATH', 'storage_snapshot.bin'))
+elif os.environ.get('WAL_PATH') or os.environ.get('STORAGE_MODE') == 'shared':
+    raise RuntimeError('WAL_PATH and STORAGE_MODE=shared only apply to STORAGE_BACKEND=memory')
+
+# Write-ahead log of every store mutation, replayed over the snapshot (disabled when WAL_PATH is unset)
+write_ahead_log = None
+if os.environ.get('WAL_PATH'):
+    write_ahead_log = WriteAheadLog(snapshot_manager, os.environ['WAL_PATH'])
+
+# Shared mode: several worker processes serve one dataset (snapshot + log) with a single writer
+shared_storage = None
+if os.environ.get('STORAGE_MODE') == 'shared':
+    if write_ahead_log is None:
+        raise RuntimeError('STORAGE_MODE=shared requires WAL_PATH')
+    shared_storage = SharedStorage(write_ahead_log)
+    shared_storage.open()
+    # Model writes outside a decorated endpoint (e.g. a rehash on login) take the writer lock too
+    storage_backend.attach_writer(shared_storage.write)
+elif snapshot_manager is not None:
+    snapshot_manager.warm_start()
+    if write_ahead_log is not None:
+        write_ahead_log.replay()
+        write_ahead_log.open()
+        # Writes inside storage_backend.transaction() share one durable log commit
+        storage_backend.attach_writer(write_ahead_log.group)
+
+# Name search over people and courses, kept up to date by the change events
+search_index = SearchIndex()
+search_index.add_source('student', student_storage.students, ('nombre', 'carnet'), 'students')
+search_index.add_source('tutor', user_service.user_storage.users, ('first_name', 'last_name', 'username'), 'users')
+search_index.add_source('course', course_storage.courses, ('nombre', 'codigo'), 'courses')
+search_index.rebuild()
+search_index.attach(event_bus)
+
+@api_bp.before_request
+def sync_shared_storage():
+    """Catch up with the writes other workers made since the last request"""
+    # SQLite: drop cached records if another worker committed since the last request
+    storage_backend.refresh()
+    if shared_storage is not None:
+        shared_storage.refresh()
 
 # Helper: JWT encode/decode
 
@@ -82,6 +153,56 @@ def admin_required(f):
         return f(user_id=user_id, *args, **kwargs)
     return decorated
 
+def exclusive_writes(f):
+    """In shared mode, hold the cross-process writer lock while a mutating endpoint runs"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        with storage_backend.write_section():
+            return f(*args, **kwargs)
+    return decorated
+
+def conditional_get(etag_for):
+    """
+    Answer GET requests with an ETag built from store versions. A matching
+    If-None-Match returns 304 before the view runs, so nothing is decoded or serialized.
+    etag_for receives the view arguments and returns the version tag (None to skip).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            tag = etag_for(**kwargs)
+            if tag is None:
+                return f(*args, **kwargs)
+            # Responses depend on the requester (role, own courses), so the tag does too
+            etag = f"{kwargs.get('auth_user_id')}-{tag}"
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return decorated
+    return decorator
+
+def stores_etag(*stores):
+    """Combined version tag of several stores"""
+    return '-'.join(store.etag() for store in stores)
+
+def get_pagination_args(cursor_param='cursor'):
+    """Parse keyset pagination query parameters (limit and cursor)"""
+    limit = request.args.get('limit')
+    cursor = request.args.get(cursor_param)
+    try:
+        limit = int(limit) if limit not in (None, '') else None
+        after_id = int(cursor) if cursor not in (None, '') else 0
+    except ValueError:
+        raise ValueError(f'limit and {cursor_param} must be valid integers')
+    if limit is not None and limit <= 0:
+        raise ValueError('limit must be a positive integer')
+    return after_id, limit
+
 @api_bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -97,40 +218,14 @@ def login():
         print("DEBUG: Username/email and password required")
         return jsonify({'success': False, 'error': 'Username/email and password required'}), 400
     
-    user = None
-    if username:
-        print(f"DEBUG: Trying login as username: {username}")
-        user = user_service.authenticate_user(username, password)
-        print(f"DEBUG: Result of authenticate_user: {user}")
-        if not user:
-            print(f"DEBUG: Username login failed, searching all users for username match: {username}")
-            all_users = user_service.get_all_users()
-            for u in all_users:
-                print(f"DEBUG: Checking user: {u.get('username')}")
-                if u.get('username') == username:
-                    user = user_service.authenticate_user(u.get('username'), password)
-                    print(f"DEBUG: Result of authenticate_user for user {u.get('username')}: {user}")
-                    if user:
-                        break
-        if not user:
-            print(f"DEBUG: Trying as student carnet: {username}")
-            student = student_storage.authenticate_student(username, password)
-            print(f"DEBUG: Result of authenticate_student: {student}")
-            if student:
-                print(f"DEBUG: Student login successful: {student}")
-                return jsonify({'success': True, 'token': generate_token(student['student_id']), 'user': student}), 200
-    elif email:
-        print(f"DEBUG: Trying login as email: {email}")
-        user_data = user_service.get_user_by_email(email)
-        print(f"DEBUG: Result of get_user_by_email: {user_data}")
-        if user_data:
-            user = user_service.authenticate_user(user_data['username'], password)
-            print(f"DEBUG: Result of authenticate_user by email: {user}")
+    # One probe resolves the handle to a single principal; at most one bcrypt check
+    handle = username or email
+    result = identity_service.authenticate(handle, password)
     
-    if user:
-        print(f"DEBUG: Login successful for user: {user}")
-        token = generate_token(user['user_id'])
-        return jsonify({'success': True, 'token': token, 'user': user}), 200
+    if result:
+        role, principal = result
+        principal_id = principal['student_id'] if role == 'student' else principal['user_id']
+        return jsonify({'success': True, 'token': generate_token(principal_id), 'user': principal}), 200
     print("DEBUG: Invalid credentials")
     return jsonify({'success': False, 'error': 'Invalid credentials'}), 401
 
@@ -151,7 +246,14 @@ def get_storage_stats(user_id):
         
         combined_stats = {
             'users': user_stats,
-            'schedules': schedule_stats
+            'schedules': schedule_stats,
+            'courses': course_storage.get_matrix_stats(),
+            'students': student_storage.get_matrix_stats(),
+            'assignments': assignment_storage.get_matrix_stats(),
+            'password_hashing': password_hasher.get_stats(),
+            'backend': storage_backend.get_stats(),
+            'search_index': search_index.get_stats(),
+            'change_events': event_bus.get_stats()
         }
         
         return jsonify({
@@ -161,6 +263,65 @@ def get_storage_stats(user_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@api_bp.route('/storage/snapshot', methods=['POST'])
+@admin_required
+def create_storage_snapshot(user_id):
+    """Write a binary snapshot of every store so the next start is a warm start"""
+    try:
+        if snapshot_manager is None:
+            return jsonify({'success': False, 'error': 'Snapshots are not used with the SQLite backend'}), 400
+        # With a write-ahead log the snapshot is a checkpoint that also truncates the log
+        if shared_storage is not None:
+            snapshot = shared_storage.checkpoint()
+        elif write_ahead_log is not None:
+            snapshot = write_ahead_log.checkpoint()
+        else:
+            snapshot = snapshot_manager.save()
+        return jsonify({
+            'success': True,
+            'data': snapshot
+        }), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/storage/snapshot', methods=['GET'])
+@admin_required
+def get_storage_snapshot_status(user_id):
+    """Get the snapshot file path and the last snapshot written"""
+    try:
+        if snapshot_manager is None:
+            return jsonify({'success': False, 'error': 'Snapshots are not used with the SQLite backend'}), 400
+        status = snapshot_manager.get_status()
+        status['write_ahead_log'] = write_ahead_log.get_stats() if write_ahead_log else None
+        status['shared_storage'] = shared_storage.get_stats() if shared_storage else None
+        return jsonify({
+            'success': True,
+            'data': status
+        }), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api_bp.route('/storage/compact', methods=['POST'])
+@admin_required
+@exclusive_writes
+def compact_storage(user_id):
+    """Compact every store, reclaiming the slots left by deleted records"""
+    try:
+        result = {
+            'users': user_service.compact_storage(),
+            'schedules': schedule_storage.compact(),
+            'courses': course_storage.compact(),
+            'students': student_storage.compact(),
+            'assignments': assignment_storage.compact()
+        }
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        }), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # File Upload Endpoint
 @api_bp.route('/upload', methods=['POST'])
 @login_required
@@ -214,12 +375,16 @@ def upload_file(auth_user_id):
 def get_all_users_admin(user_id):
     """Get all users (admin only)"""
     try:
-        users = user_service.get_all_users()
-        return jsonify({
+        after_id, limit = get_pagination_args()
+        users, next_cursor = user_service.get_users_page(after_id, limit)
+        return json_response({
             'success': True,
             'data': users,
-            'count': len(users)
-        }), 200
+            'count': len(users),
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -295,8 +460,9 @@ def upload_schedule(auth_user_id):
                 else:
                     invalid_courses += 1
             
-            # Store schedules in sparse matrix storage
-            created_schedules = schedule_storage.bulk_create_schedules(schedules_to_create)
+            # Store schedules in one commit; only the writes run inside it
+            with storage_backend.transaction():
+                created_schedules = schedule_storage.bulk_create_schedules(schedules_to_create)
             
             return jsonify({
                 'success': True,
@@ -325,49 +491,57 @@ def upload_schedule(auth_user_id):
 # Schedule Management Endpoints
 @api_bp.route('/schedules', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(schedule_storage.schedules))
 def get_all_schedules(auth_user_id):
     """Get all schedules"""
     try:
-        schedules = schedule_storage.get_all_schedules()
-        return jsonify({
+        after_id, limit = get_pagination_args()
+        schedules, next_cursor = schedule_storage.get_schedules_page(after_id, limit)
+        return json_response({
             'success': True,
             'data': schedules,
-            'count': len(schedules)
-        }), 200
+            'count': len(schedules),
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @api_bp.route('/schedules/course/<codigo_curso>', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(schedule_storage.schedules))
 def get_schedules_by_course(auth_user_id, codigo_curso):
     """Get schedules by course code"""
     try:
         schedules = schedule_storage.get_schedules_by_course(codigo_curso)
-        return jsonify({
+        return json_response({
             'success': True,
             'data': schedules,
             'count': len(schedules)
-        }), 200
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @api_bp.route('/schedules/tutor/<int:tutor_id>', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(schedule_storage.schedules))
 def get_schedules_by_tutor(auth_user_id, tutor_id):
     """Get schedules by tutor ID"""
     try:
         schedules = schedule_storage.get_schedules_by_tutor(tutor_id)
-        return jsonify({
+        return json_response({
             'success': True,
             'data': schedules,
             'count': len(schedules)
-        }), 200
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # Grades Upload
 @api_bp.route('/grades/upload', methods=['POST'])
 @login_required
+@exclusive_writes
 def upload_grades(auth_user_id):
     """Upload grades XML file for student development in tutor's course"""
     print(f"DEBUG: upload_grades called with auth_user_id: {auth_user_id}")
@@ -389,16 +563,15 @@ def upload_grades(auth_user_id):
         print("DEBUG: File is not XML")
         return jsonify({'success': False, 'error': 'Only XML files are allowed'}), 400
     
+    # "merge" diffs a re-upload against the stored grades; "replace" (default) rebuilds the course
+    mode = request.form.get('mode') or request.args.get('mode') or 'replace'
+    if mode not in ('replace', 'merge'):
+        return jsonify({'success': False, 'error': "mode must be 'replace' or 'merge'"}), 400
+    
     try:
-        # Read XML content
-        print("DEBUG: Reading XML content")
-        xml_content = file.read().decode('utf-8')
-        print(f"DEBUG: XML content length: {len(xml_content)}")
-        print(f"DEBUG: XML content preview: {xml_content[:200]}...")
-        
-        # Parse and store grades using sparse matrix
+        # Parse and store grades using sparse matrix, streaming the upload
         print("DEBUG: Calling grades_storage.parse_grades_xml")
-        result = grades_storage.parse_grades_xml(xml_content, auth_user_id)
+        result = grades_storage.parse_grades_xml(file.stream, auth_user_id, merge=(mode == 'merge'))
         print(f"DEBUG: Parse result: {result}")
         
         return jsonify({
@@ -419,6 +592,7 @@ def upload_grades(auth_user_id):
 # Grade Reports
 @api_bp.route('/reports/grades', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: grades_storage.etag())
 def get_grade_reports(auth_user_id):
     """Generate grade summary report after tutor uploads grades"""
     try:
@@ -461,6 +635,7 @@ def get_grade_reports(auth_user_id):
 
 @api_bp.route('/grades/courses', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: grades_storage.etag())
 def get_tutor_courses(auth_user_id):
     """Get all courses with grades for a tutor"""
     try:
@@ -477,6 +652,7 @@ def get_tutor_courses(auth_user_id):
 
 @api_bp.route('/grades/course/<course_code>', methods=['GET'])
 @login_required
+@conditional_get(lambda auth_user_id, course_code: grades_storage.etag(course_code, auth_user_id))
 def get_course_grades(auth_user_id, course_code):
     """Get detailed grades for a specific course"""
     try:
@@ -513,7 +689,7 @@ def get_course_grades(auth_user_id, course_code):
 @api_bp.route('/grades/stats', methods=['GET'])
 @login_required
 def get_grades_stats(auth_user_id):
-    """Get grades storage statistics"""
+    """Get grades storage statistics (no ETag: residency and write counters change without a version bump)"""
     try:
         stats = grades_storage.get_storage_stats()
         
@@ -529,20 +705,37 @@ def get_grades_stats(auth_user_id):
 def get_users():
     """Get all users"""
     try:
-        users = user_service.get_all_users()
-        return jsonify({
+        after_id, limit = get_pagination_args()
+        users, next_cursor = user_service.get_users_page(after_id, limit)
+        return json_response({
             'success': True,
             'data': users,
-            'count': len(users)
-        }), 200
+            'count': len(users),
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+def user_record_etag(record_id, role=None):
+    """Version tag of a tutor or student record; None when it does not exist (404 path)"""
+    if role in (None, 'tutor'):
+        tag = user_service.user_storage.users.etag(record_id)
+        if tag is not None:
+            return f"tutor.{tag}"
+    if role in (None, 'student'):
+        tag = student_storage.students.etag(record_id)
+        if tag is not None:
+            return f"student.{tag}"
+    return None
+
 @api_bp.route('/users/<int:user_id>', methods=['GET'])
 @login_required
+@conditional_get(lambda auth_user_id, user_id: user_record_etag(user_id))
 def get_user_by_id(auth_user_id, user_id):
     """Get specific user by ID with full name and registro personal"""
     try:
@@ -592,6 +785,7 @@ def get_user_by_id(auth_user_id, user_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @api_bp.route('/users', methods=['POST'])
+@exclusive_writes
 def create_user():
     """Create a new user"""
     try:
@@ -621,6 +815,7 @@ def create_user():
         }), 500
 
 @api_bp.route('/users/<int:user_id>', methods=['PUT'])
+@exclusive_writes
 def update_user(user_id):
     """Update a user"""
     try:
@@ -656,6 +851,7 @@ def update_user(user_id):
         }), 500
 
 @api_bp.route('/users/<int:user_id>', methods=['DELETE'])
+@exclusive_writes
 def delete_user(user_id):
     """Delete a user"""
     try:
@@ -717,175 +913,40 @@ def upload_configuration():
             if root.tag != 'configuraciones':
                 raise ValueError("Root element must be 'configuraciones'")
             
-            # Initialize counters
-            stats = {
-                'cursos_cargados': 0,
-                'tutores_cargados': 0,
-                'estudiantes_cargados': 0,
-                'asignaciones': {
-                    'tutores': {
-                        'total': 0,
-                        'correcto': 0,
-                        'incorrecto': 0
-                    },
-                    'estudiantes': {
-                        'total': 0,
-                        'correcto': 0,
-                        'incorrecto': 0
-                    }
-                }
-            }
+            # Stage every row in one unit of work; nothing is written until commit()
+            unit_of_work = ConfigurationUnitOfWork(
+                course_storage, user_service.user_storage, student_storage, assignment_storage
+            )
             
-            # Process courses first
             cursos_element = root.find('cursos')
             if cursos_element is not None:
                 for curso in cursos_element.findall('curso'):
-                    codigo = curso.get('codigo')
-                    nombre = curso.text.strip() if curso.text else ""
-                    
-                    if codigo and nombre:
-                        try:
-                            course_data = {
-                                'codigo': codigo,
-                                'nombre': nombre
-                            }
-                            course_storage.create_course(course_data)
-                            stats['cursos_cargados'] += 1
-                            print(f"Created course: {codigo} - {nombre}")
-                        except Exception as e:
-                            print(f"Error creating course {codigo}: {str(e)}")
+                    unit_of_work.stage_course(curso.get('codigo'), curso.text.strip() if curso.text else "")
             
-            # Process tutors
             tutores_element = root.find('tutores')
             if tutores_element is not None:
                 for tutor in tutores_element.findall('tutor'):
-                    registro_personal = tutor.get('registro_personal')
-                    contrasenia = tutor.get('contrasenia')
-                    nombre = tutor.text.strip() if tutor.text else ""
-                    
-                    if registro_personal and contrasenia and nombre:
-                        try:
-                            tutor_data = {
-                                'username': registro_personal,
-                                'email': f"{registro_personal}@tutor.com",
-                                'password': contrasenia,
-                                'first_name': nombre,
-                                'last_name': '',
-                                'is_admin': False
-                            }
-                            existing_tutor = user_service.get_user_by_username(registro_personal)
-                            if existing_tutor:
-                                # Update password and name
-                                user_service.update_user(existing_tutor['user_id'], {
-                                    'password': contrasenia,
-                                    'first_name': nombre,
-                                    'last_name': ''
-                                })
-                                print(f"Updated tutor: {registro_personal} - {nombre}")
-                            else:
-                                user_service.create_user(tutor_data)
-                                stats['tutores_cargados'] += 1
-                                print(f"Created tutor: {registro_personal} - {nombre}")
-                        except Exception as e:
-                            print(f"Error creating/updating tutor {registro_personal}: {str(e)}")
+                    unit_of_work.stage_tutor(tutor.get('registro_personal'), tutor.get('contrasenia'),
+                                             tutor.text.strip() if tutor.text else "")
             
-            # Process students
             estudiantes_element = root.find('estudiantes')
             if estudiantes_element is not None:
                 for estudiante in estudiantes_element.findall('estudiante'):
-                    carnet = estudiante.get('carnet')
-                    contrasenia = estudiante.get('contrasenia')
-                    nombre = estudiante.text.strip() if estudiante.text else ""
-                    
-                    if carnet and contrasenia and nombre:
-                        try:
-                            student_data = {
-                                'carnet': carnet,
-                                'password': contrasenia,
-                                'nombre': nombre
-                            }
-                            student_storage.create_student(student_data)
-                            stats['estudiantes_cargados'] += 1
-                            print(f"Created student: {carnet} - {nombre}")
-                        except Exception as e:
-                            print(f"Error creating student {carnet}: {str(e)}")
+                    unit_of_work.stage_student(estudiante.get('carnet'), estudiante.get('contrasenia'),
+                                               estudiante.text.strip() if estudiante.text else "")
             
-            # Process assignments - improved logic
             asignaciones_element = root.find('asignaciones')
             if asignaciones_element is not None:
-                # Process tutor-course assignments
-                c_tutores_element = asignaciones_element.find('c_tutores')
-                if c_tutores_element is not None:
-                    for tutor_curso in c_tutores_element.findall('tutor_curso'):
-                        codigo = tutor_curso.get('codigo')
-                        registro_personal = tutor_curso.text.strip() if tutor_curso.text else ""
-                        
-                        if codigo and registro_personal:
-                            stats['asignaciones']['tutores']['total'] += 1
-                            
-                            try:
-                                # Check if course exists
-                                course = course_storage.get_course_by_code(codigo)
-                                if not course:
-                                    print(f"Course {codigo} not found")
-                                    stats['asignaciones']['tutores']['incorrecto'] += 1
-                                    continue
-                                
-                                # Find tutor by username - improved lookup
-                                tutor = user_service.get_user_by_username(registro_personal)
-                                
-                                if not tutor:
-                                    print(f"Tutor {registro_personal} not found")
-                                    stats['asignaciones']['tutores']['incorrecto'] += 1
-                                    continue
-                                
-                                # Create assignment
-                                assignment_storage.create_tutor_course_assignment(
-                                    tutor['user_id'], codigo
-                                )
-                                stats['asignaciones']['tutores']['correcto'] += 1
-                                print(f"Created tutor assignment: {registro_personal} -> {codigo}")
-                                
-                            except Exception as e:
-                                print(f"Error creating tutor assignment {registro_personal} -> {codigo}: {str(e)}")
-                                stats['asignaciones']['tutores']['incorrecto'] += 1
-                
-                # Process student-course assignments
-                c_estudiante_element = asignaciones_element.find('c_estudiante')
-                if c_estudiante_element is not None:
-                    for estudiante_curso in c_estudiante_element.findall('estudiante_curso'):
-                        codigo = estudiante_curso.get('codigo')
-                        carnet = estudiante_curso.text.strip() if estudiante_curso.text else ""
-                        
-                        if codigo and carnet:
-                            stats['asignaciones']['estudiantes']['total'] += 1
-                            
-                            try:
-                                # Check if course exists
-                                course = course_storage.get_course_by_code(codigo)
-                                if not course:
-                                    print(f"Course {codigo} not found")
-                                    stats['asignaciones']['estudiantes']['incorrecto'] += 1
-                                    continue
-                                
-                                # Find student by carnet - improved lookup
-                                student = student_storage.get_student_by_carnet(carnet)
-                                
-                                if not student:
-                                    print(f"Student {carnet} not found")
-                                    stats['asignaciones']['estudiantes']['incorrecto'] += 1
-                                    continue
-                                
-                                # Create assignment
-                                assignment_storage.create_student_course_assignment(
-                                    student['student_id'], codigo
-                                )
-                                stats['asignaciones']['estudiantes']['correcto'] += 1
-                                print(f"Created student assignment: {carnet} -> {codigo}")
-                                
-                            except Exception as e:
-                                print(f"Error creating student assignment {carnet} -> {codigo}: {str(e)}")
-                                stats['asignaciones']['estudiantes']['incorrecto'] += 1
+                for tutor_curso in asignaciones_element.findall('c_tutores/tutor_curso'):
+                    unit_of_work.stage_tutor_assignment(tutor_curso.get('codigo'),
+                                                        tutor_curso.text.strip() if tutor_curso.text else "")
+                for estudiante_curso in asignaciones_element.findall('c_estudiante/estudiante_curso'):
+                    unit_of_work.stage_student_assignment(estudiante_curso.get('codigo'),
+                                                          estudiante_curso.text.strip() if estudiante_curso.text else "")
+            
+            # Cross-references are checked against the staged indexes, then every store
+            # is written in one batch (or the whole upload is undone)
+            stats = unit_of_work.commit()
             
             # Generate output XML
             output_xml = generate_configuration_output(stats)
@@ -934,102 +995,125 @@ def generate_configuration_output(stats):
 # Get all courses
 @api_bp.route('/courses', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(course_storage.courses))
 def get_all_courses(auth_user_id):
     """Get all courses"""
     try:
-        courses = course_storage.get_all_courses()
-        return jsonify({
+        after_id, limit = get_pagination_args()
+        courses, next_cursor = course_storage.get_courses_page(after_id, limit)
+        return json_response({
             'success': True,
             'data': courses,
-            'count': len(courses)
-        }), 200
+            'count': len(courses),
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # Get all students
 @api_bp.route('/students', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(student_storage.students))
 def get_all_students(auth_user_id):
     """Get all students"""
     try:
-        students = student_storage.get_all_students()
-        return jsonify({
+        after_id, limit = get_pagination_args()
+        students, next_cursor = student_storage.get_students_page(after_id, limit)
+        return json_response({
             'success': True,
             'data': students,
-            'count': len(students)
-        }), 200
+            'count': len(students),
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # Get all assignments
 @api_bp.route('/assignments', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(assignment_storage.tutor_assignments, assignment_storage.student_assignments))
 def get_all_assignments(auth_user_id):
     """Get all assignments (tutor-course and student-course)"""
     try:
-        tutor_assignments = assignment_storage.get_all_tutor_assignments()
-        student_assignments = assignment_storage.get_all_student_assignments()
+        tutor_after_id, limit = get_pagination_args('tutor_cursor')
+        student_after_id, _ = get_pagination_args('student_cursor')
+        tutor_assignments, next_tutor_cursor = assignment_storage.get_tutor_assignments_page(tutor_after_id, limit)
+        student_assignments, next_student_cursor = assignment_storage.get_student_assignments_page(student_after_id, limit)
         
-        return jsonify({
+        return json_response({
             'success': True,
             'data': {
                 'tutor_assignments': tutor_assignments,
                 'student_assignments': student_assignments,
                 'total_tutor_assignments': len(tutor_assignments),
-                'total_student_assignments': len(student_assignments)
+                'total_student_assignments': len(student_assignments),
+                'next_tutor_cursor': next_tutor_cursor,
+                'next_student_cursor': next_student_cursor
             }
-        }), 200
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # Get assignments by tutor
 @api_bp.route('/assignments/tutor/<int:tutor_id>', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(assignment_storage.tutor_assignments, assignment_storage.student_assignments))
 def get_assignments_by_tutor(auth_user_id, tutor_id):
     """Get all assignments for a specific tutor"""
     try:
         assignments = assignment_storage.get_tutor_assignments(tutor_id)
-        return jsonify({
+        return json_response({
             'success': True,
             'data': assignments,
             'count': len(assignments)
-        }), 200
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # Get assignments by student
 @api_bp.route('/assignments/student/<int:student_id>', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(assignment_storage.tutor_assignments, assignment_storage.student_assignments))
 def get_assignments_by_student(auth_user_id, student_id):
     """Get all assignments for a specific student"""
     try:
         assignments = assignment_storage.get_student_assignments(student_id)
-        return jsonify({
+        return json_response({
             'success': True,
             'data': assignments,
             'count': len(assignments)
-        }), 200
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # Get assignments by course
 @api_bp.route('/assignments/course/<course_code>', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(assignment_storage.tutor_assignments, assignment_storage.student_assignments))
 def get_assignments_by_course(auth_user_id, course_code):
     """Get all assignments for a specific course"""
     try:
         assignments = assignment_storage.get_course_assignments(course_code)
-        return jsonify({
+        return json_response({
             'success': True,
             'data': assignments,
             'course_code': course_code
-        }), 200
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # Comprehensive users overview endpoint
 @api_bp.route('/users/overview', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(
+    user_service.user_storage.users, student_storage.students, course_storage.courses,
+    assignment_storage.tutor_assignments, assignment_storage.student_assignments))
 def get_users_overview(auth_user_id):
     """Get comprehensive overview of all users (tutors and students)"""
     try:
@@ -1046,23 +1130,28 @@ def get_users_overview(auth_user_id):
         tutor_assignments = assignment_storage.get_all_tutor_assignments()
         student_assignments = assignment_storage.get_all_student_assignments()
         
-        # Process tutors with their assignments
+        # Course names per person: assignments ⋈ courses (hash join), grouped by person id
+        def course_info(row):
+            return {
+                'course_code': row['assignment']['course_code'],
+                'course_name': row['course'].get('nombre')
+            }
+        
+        courses_by_tutor = (
+            Query.scan(tutor_assignments, 'assignment')
+            .join(Query.scan(courses, 'course'), 'assignment.course_code', 'course.codigo')
+            .group_by('assignment.tutor_id', course_info)
+        )
+        courses_by_student = (
+            Query.scan(student_assignments, 'assignment')
+            .join(Query.scan(courses, 'course'), 'assignment.course_code', 'course.codigo')
+            .group_by('assignment.student_id', course_info)
+        )
+        
+        # Process tutors with their assignments (assignments store the person id as text)
         tutors_with_assignments = []
         for tutor in tutors:
-            tutor_id = tutor.get('user_id')
-            tutor_assignments_list = assignment_storage.get_tutor_assignments(tutor_id)
-            
-            # Get course names for assignments
-            assigned_courses = []
-            for assignment in tutor_assignments_list:
-                course_code = assignment.get('course_code')
-                course = course_storage.get_course_by_code(course_code)
-                if course:
-                    assigned_courses.append({
-                        'course_code': course_code,
-                        'course_name': course.get('nombre')
-                    })
-            
+            assigned_courses = courses_by_tutor.get(str(tutor.get('user_id')), [])
             tutors_with_assignments.append({
                 'user_id': tutor.get('user_id'),
                 'username': tutor.get('username'),
@@ -1079,20 +1168,7 @@ def get_users_overview(auth_user_id):
         # Process students with their assignments
         students_with_assignments = []
         for student in students:
-            student_id = student.get('student_id')
-            student_assignments_list = assignment_storage.get_student_assignments(student_id)
-            
-            # Get course names for assignments
-            assigned_courses = []
-            for assignment in student_assignments_list:
-                course_code = assignment.get('course_code')
-                course = course_storage.get_course_by_code(course_code)
-                if course:
-                    assigned_courses.append({
-                        'course_code': course_code,
-                        'course_name': course.get('nombre')
-                    })
-            
+            assigned_courses = courses_by_student.get(str(student.get('student_id')), [])
             students_with_assignments.append({
                 'student_id': student.get('student_id'),
                 'carnet': student.get('carnet'),
@@ -1128,16 +1204,117 @@ def get_users_overview(auth_user_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Name search endpoint
+@api_bp.route('/search', methods=['GET'])
+@login_required
+@conditional_get(lambda **kwargs: stores_etag(
+    user_service.user_storage.users, student_storage.students, course_storage.courses))
+def search(auth_user_id):
+    """Search students, tutors and courses by name with prefix and typo-tolerant matching"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'success': False, 'error': 'q is required'}), 400
+        kinds = request.args.get('type')
+        kinds = [kind.strip() for kind in kinds.split(',') if kind.strip()] if kinds else None
+        if kinds and any(kind not in search_index.sources for kind in kinds):
+            return jsonify({'success': False, 'error': 'type must be student, tutor or course'}), 400
+        limit = request.args.get('limit', '10')
+        try:
+            limit = min(int(limit), 100)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit must be a valid integer'}), 400
+        if limit <= 0:
+            return jsonify({'success': False, 'error': 'limit must be a positive integer'}), 400
+        
+        results = search_index.search(query, kinds, limit)
+        for result in results:
+            if result['type'] == 'student':
+                student = student_storage.get_student_by_id(result['id'])
+                result['carnet'] = student.get('carnet') if student else None
+            elif result['type'] == 'tutor':
+                user = user_service.get_user_by_id(result['id'])
+                result['username'] = user.get('username') if user else None
+            else:
+                course = course_storage.get_course_by_id(result['id'])
+                result['codigo'] = course.get('codigo') if course else None
+        
+        return jsonify({
+            'success': True,
+            'query': query,
+            'data': results,
+            'count': len(results)
+        }), 200
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Recently created records (newest first, from the created_at ordered index)
+RECENT_FIELDS = {
+    'student': ('student_id', 'carnet', 'nombre', 'is_active', 'created_at'),
+    'tutor': ('user_id', 'username', 'email', 'first_name', 'last_name', 'is_admin', 'is_active', 'created_at'),
+    'course': None,
+    'schedule': None
+}
+
+@api_bp.route('/recent', methods=['GET'])
+@login_required
+@conditional_get(lambda **kwargs: stores_etag(
+    user_service.user_storage.users, student_storage.students, course_storage.courses, schedule_storage.schedules))
+def recent(auth_user_id):
+    """List the most recently created students, tutors, courses or schedules"""
+    try:
+        kind = request.args.get('type', 'course')
+        if kind not in RECENT_FIELDS:
+            return jsonify({'success': False, 'error': 'type must be student, tutor, course or schedule'}), 400
+        limit = request.args.get('limit', '10')
+        try:
+            limit = min(int(limit), 100)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit must be a valid integer'}), 400
+        if limit <= 0:
+            return jsonify({'success': False, 'error': 'limit must be a positive integer'}), 400
+        since = request.args.get('since')
+        if since:
+            try:
+                since = datetime.datetime.fromisoformat(since)
+            except ValueError:
+                return jsonify({'success': False, 'error': 'since must be an ISO 8601 date'}), 400
+        
+        if kind == 'student':
+            records = student_storage.get_recent_students(limit, since)
+        elif kind == 'tutor':
+            records = user_service.user_storage.get_recent_users(limit, since)
+        elif kind == 'course':
+            records = course_storage.get_recent_courses(limit, since)
+        else:
+            records = schedule_storage.get_recent_schedules(limit, since)
+        
+        fields = RECENT_FIELDS[kind]
+        if fields is not None:
+            # People records also carry password hashes; only expose the public fields
+            records = [{field: record.get(field) for field in fields} for record in records]
+        
+        return json_response({
+            'success': True,
+            'type': kind,
+            'data': records,
+            'count': len(records)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # Simple users list endpoint
 @api_bp.route('/users/list', methods=['GET'])
 @login_required
+@conditional_get(lambda **kwargs: stores_etag(user_service.user_storage.users, student_storage.students))
 def get_users_list(auth_user_id):
     """Get simple list of users with basic info"""
     try:
-        # Get all users (tutors)
-        tutors = user_service.get_all_users()
-        # Get all students
-        students = student_storage.get_all_students()
+        # Get users (tutors) and students, one page each when limit is given
+        tutor_after_id, limit = get_pagination_args('tutor_cursor')
+        student_after_id, _ = get_pagination_args('student_cursor')
+        tutors, next_tutor_cursor = user_service.get_users_page(tutor_after_id, limit)
+        students, next_student_cursor = student_storage.get_students_page(student_after_id, limit)
 
         # Determine the role of the requesting user
         requested_user_role = None
@@ -1181,14 +1358,19 @@ def get_users_list(auth_user_id):
                 'tutors': tutors_list,
                 'students': students_list,
                 'total_tutors': len(tutors_list),
-                'total_students': len(students_list)
+                'total_students': len(students_list),
+                'next_tutor_cursor': next_tutor_cursor,
+                'next_student_cursor': next_student_cursor
             }
         }), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @api_bp.route('/users/<role>/<int:id>', methods=['GET'])
 @login_required
+@conditional_get(lambda auth_user_id, role, id: user_record_etag(id, role))
 def get_user_by_role_and_id(auth_user_id, role, id):
     """Get a user by role (tutor or student) and ID, avoiding ambiguity if IDs overlap."""
     try:
@@ -1287,8 +1469,9 @@ def upload_tutor_schedule(auth_user_id):
                 else:
                     invalid_courses += 1
 
-            # Store schedules in sparse matrix storage
-            created_schedules = schedule_storage.bulk_create_schedules(schedules_to_create)
+            # Store schedules in one commit; only the writes run inside it
+            with storage_backend.transaction():
+                created_schedules = schedule_storage.bulk_create_schedules(schedules_to_create)
 
             return jsonify({
                 'success': True,
@@ -1313,6 +1496,7 @@ def upload_tutor_schedule(auth_user_id):
         return jsonify({'success': False, 'error': f'Error uploading schedule: {str(e)}'}), 500
 
 @api_bp.route('/debug/reset_password', methods=['POST'])
+@exclusive_writes
 def debug_reset_password():
     data = request.get_json()
     username = data.get('username')
@@ -1327,6 +1511,7 @@ def debug_reset_password():
 
 @api_bp.route('/grades/report/graphviz/<course_code>', methods=['GET'])
 @login_required
+@conditional_get(lambda auth_user_id, course_code: grades_storage.etag(course_code, auth_user_id))
 def graphviz_grades_report(auth_user_id, course_code):
     """Generate a Graphviz SVG report for the grades matrix of a course, as a node-based table-like grid."""
     course_data = grades_storage.get_course_grades(course_code, auth_user_id)
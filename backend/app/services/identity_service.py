@@ -0,0 +1,58 @@
+class IdentityService:
+    """
+    Servicio de identidad para el inicio de sesión.
+    Resuelve cualquier identificador (username, email o carnet) a un único
+    principal con su rol consultando los índices únicos de los almacenamientos,
+    de modo que cada intento hace como máximo una verificación bcrypt.
+    """
+
+    def __init__(self, user_storage, student_storage):
+        self.user_storage = user_storage
+        self.student_storage = student_storage
+
+    def resolve(self, handle):
+        """
+        Resuelve un identificador de inicio de sesión.
+        Si un identificador coincide en varios espacios gana, en orden, el username,
+        el email y por último el carnet.
+
+        Args:
+            handle (str): Username, email o carnet
+
+        Returns:
+            tuple: (rol, registro) con rol 'admin', 'tutor' o 'student'; None si no existe
+        """
+        if not handle:
+            return None
+
+        users = self.user_storage.users
+        user_id = users.find_first('username', handle)
+        if user_id is None:
+            user_id = users.find_first('email', handle)
+        if user_id is not None:
+            user = users.get(user_id)
+            return ('admin' if user.get('is_admin') else 'tutor'), user
+
+        students = self.student_storage.students
+        student_id = students.find_first('carnet', handle)
+        if student_id is not None:
+            return 'student', students.get(student_id)
+        return None
+
+    def authenticate(self, handle, password):
+        """
+        Autentica un identificador con su contraseña.
+
+        Returns:
+            tuple: (rol, registro) si las credenciales son válidas; None en otro caso
+        """
+        resolved = self.resolve(handle)
+        if resolved is None or not password:
+            return None
+
+        role, record = resolved
+        if role == 'student':
+            record = self.student_storage.verify_student(record, password)
+        else:
+            record = self.user_storage.verify_user(record, password)
+        return (role, record) if record else None
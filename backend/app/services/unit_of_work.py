@@ -0,0 +1,241 @@
+from datetime import datetime
+from app.utils.password_hasher import password_hasher
+from app.utils.storage_backend import storage_backend
+
+
+def empty_configuration_stats():
+    """Contadores vacíos de una carga de configuración"""
+    return {
+        'cursos_cargados': 0,
+        'tutores_cargados': 0,
+        'estudiantes_cargados': 0,
+        'asignaciones': {
+            'tutores': {'total': 0, 'correcto': 0, 'incorrecto': 0},
+            'estudiantes': {'total': 0, 'correcto': 0, 'incorrecto': 0}
+        }
+    }
+
+
+class ConfigurationUnitOfWork:
+    """
+    Unidad de trabajo de una carga de configuración.
+    Las altas de cursos, tutores, estudiantes y asignaciones se acumulan en memoria;
+    commit() resuelve las referencias cruzadas contra los índices del lote y los
+    índices únicos de los almacenes, y escribe cada almacén en un solo bloque. Si
+    algo falla a mitad de la escritura se deshace lo ya aplicado, de modo que nunca
+    queda una configuración cargada a medias.
+    """
+
+    def __init__(self, course_storage, user_storage, student_storage, assignment_storage, backend=None):
+        self.course_storage = course_storage
+        self.user_storage = user_storage
+        self.student_storage = student_storage
+        self.assignment_storage = assignment_storage
+        self.backend = backend or storage_backend
+
+        # Altas pendientes indexadas por su clave única, en orden de aparición
+        self.courses = {}
+        self.tutors = {}
+        self.students = {}
+        self.tutor_assignments = []
+        self.student_assignments = []
+
+        # Acciones para deshacer lo aplicado, en orden de aplicación
+        self._undo = []
+
+    def stage_course(self, codigo, nombre):
+        """Agrega un curso al lote (el primero con cada código gana)"""
+        if codigo and nombre:
+            self.courses.setdefault(str(codigo), {'codigo': codigo, 'nombre': nombre})
+
+    def stage_tutor(self, registro_personal, contrasenia, nombre):
+        """
+        Agrega un tutor al lote (el último con cada registro personal gana).
+        Se descartan, como en el alta individual, los registros de menos de 3
+        caracteres y las contraseñas de menos de 4.
+        """
+        if not (registro_personal and contrasenia and nombre):
+            return
+        if len(registro_personal) < 3 or len(contrasenia) < 4:
+            return
+        self.tutors.pop(str(registro_personal), None)
+        self.tutors[str(registro_personal)] = (contrasenia, nombre)
+
+    def stage_student(self, carnet, contrasenia, nombre):
+        """Agrega un estudiante al lote (el primero con cada carnet gana)"""
+        if carnet and contrasenia and nombre:
+            self.students.setdefault(str(carnet), {'carnet': carnet, 'password': contrasenia, 'nombre': nombre})
+
+    def stage_tutor_assignment(self, codigo, registro_personal):
+        """Agrega una asignación tutor-curso al lote"""
+        if codigo and registro_personal:
+            self.tutor_assignments.append((str(registro_personal), str(codigo)))
+
+    def stage_student_assignment(self, codigo, carnet):
+        """Agrega una asignación estudiante-curso al lote"""
+        if codigo and carnet:
+            self.student_assignments.append((str(carnet), str(codigo)))
+
+    def commit(self):
+        """
+        Valida y aplica todo el lote.
+
+        Returns:
+            dict: Contadores de la carga (cursos, tutores y estudiantes creados y
+                asignaciones totales, correctas e incorrectas)
+        """
+        stats = empty_configuration_stats()
+        users = self.user_storage.users
+        students = self.student_storage.students
+
+        # Resolver en bloque qué claves ya existen en los almacenes
+        referenced_courses = {codigo for _, codigo in self.tutor_assignments + self.student_assignments}
+        known_courses = self.course_storage.courses.existing_values(
+            'codigo', self.courses.keys() | referenced_courses
+        ) | set(self.courses)
+        tutor_ids = {username: users.find_first('username', username)
+                     for username in self.tutors.keys() | {username for username, _ in self.tutor_assignments}}
+        tutor_ids = {username: user_id for username, user_id in tutor_ids.items() if user_id is not None}
+        taken_emails = users.existing_values('email', [f"{username}@tutor.com" for username in self.tutors
+                                                       if username not in tutor_ids])
+        new_tutors = [username for username in self.tutors
+                      if username not in tutor_ids and f"{username}@tutor.com" not in taken_emails]
+        existing_tutors = [username for username in self.tutors if username in tutor_ids]
+        existing_students = students.existing_values(
+            'carnet', self.students.keys() | {carnet for carnet, _ in self.student_assignments}
+        )
+        known_tutors = set(tutor_ids) | set(new_tutors)
+        known_students = existing_students | set(self.students)
+
+        # Hashear en paralelo, antes de abrir la transacción, las contraseñas de los
+        # tutores y de los estudiantes nuevos que se cargan
+        loaded_tutors = existing_tutors + new_tutors
+        new_students = [carnet for carnet in self.students if carnet not in existing_students]
+        hashes = password_hasher.hash_many(
+            [self.tutors[username][0] for username in loaded_tutors]
+            + [self.students[carnet]['password'] for carnet in new_students]
+        )
+        password_hashes = dict(zip(loaded_tutors, hashes))
+        student_hashes = dict(zip(new_students, hashes[len(loaded_tutors):]))
+
+        # Validar las asignaciones contra los índices del lote
+        tutor_pairs = self._validate_assignments(
+            self.tutor_assignments, known_courses, known_tutors,
+            {tutor_ids[username]: username for username in tutor_ids},
+            self.assignment_storage.get_tutor_assignments, 'tutor_id',
+            stats['asignaciones']['tutores']
+        )
+        student_ids = {carnet: students.find_first('carnet', carnet) for carnet in existing_students}
+        student_pairs = self._validate_assignments(
+            self.student_assignments, known_courses, known_students,
+            {student_ids[carnet]: carnet for carnet in student_ids},
+            self.assignment_storage.get_student_assignments, 'student_id',
+            stats['asignaciones']['estudiantes']
+        )
+
+        try:
+            with self.backend.transaction():
+                created = self.course_storage.bulk_create_courses(list(self.courses.values()), skip_existing=True)
+                self._undo.append((self.course_storage.courses, [course['course_id'] for course in created]))
+                stats['cursos_cargados'] = len(created)
+
+                created = self.user_storage.bulk_create_users([
+                    {
+                        'username': username,
+                        'email': f"{username}@tutor.com",
+                        'password_hash': password_hashes[username],
+                        'first_name': self.tutors[username][1],
+                        'last_name': '',
+                        'is_admin': False
+                    }
+                    for username in new_tutors
+                ])
+                self._undo.append((users, [user['user_id'] for user in created]))
+                tutor_ids.update((user['username'], user['user_id']) for user in created)
+                stats['tutores_cargados'] = len(created)
+
+                # Los tutores que ya existían reciben la contraseña y el nombre nuevos
+                now = datetime.utcnow()
+                for username in existing_tutors:
+                    user_id, nombre = tutor_ids[username], self.tutors[username][1]
+                    # Se guarda el registro completo: update() ignora los None y no los restauraría
+                    previous = users.get(user_id)
+                    self._undo.append((users, user_id, {name: previous.get(name) for name in users.schema}))
+                    users.update(user_id, {'password_hash': password_hashes[username], 'first_name': nombre,
+                                           'last_name': '', 'updated_at': now})
+
+                created = self.student_storage.bulk_create_students([
+                    {'carnet': student['carnet'], 'nombre': student['nombre'], 'password_hash': student_hashes[carnet]}
+                    for carnet, student in self.students.items() if carnet in student_hashes
+                ], skip_existing=True)
+                self._undo.append((students, [student['student_id'] for student in created]))
+                student_ids.update((student['carnet'], student['student_id']) for student in created)
+                stats['estudiantes_cargados'] = len(created)
+
+                created = self.assignment_storage.bulk_create_tutor_assignments(
+                    (tutor_ids[username], codigo) for username, codigo in tutor_pairs
+                )
+                self._undo.append((self.assignment_storage.tutor_assignments,
+                                   [assignment['assignment_id'] for assignment in created]))
+                created = self.assignment_storage.bulk_create_student_assignments(
+                    (student_ids[carnet], codigo) for carnet, codigo in student_pairs
+                )
+                self._undo.append((self.assignment_storage.student_assignments,
+                                   [assignment['assignment_id'] for assignment in created]))
+        except Exception as e:
+            self.rollback()
+            raise Exception(f"Error aplicando la configuración: {str(e)}")
+
+        self._undo = []
+        return stats
+
+    def _validate_assignments(self, assignments, known_courses, known_people, existing_people,
+                              get_assignments, person_field, counters):
+        """
+        Clasifica las asignaciones del lote en correctas e incorrectas.
+        Una asignación es incorrecta si su curso o su persona no existen (ni en el
+        almacén ni en el lote), si ya estaba asignada o si se repite en el lote.
+
+        Args:
+            assignments (list): Pares (clave de la persona, código del curso)
+            known_courses (set): Códigos de curso existentes o del lote
+            known_people (set): Claves de personas existentes o del lote
+            existing_people (dict): id -> clave de las personas que ya existían
+            get_assignments (callable): Asignaciones actuales de una persona por id
+            person_field (str): Columna de la persona en las asignaciones
+            counters (dict): Contadores 'total', 'correcto' e 'incorrecto' a actualizar
+
+        Returns:
+            list: Pares válidos a crear, en orden
+        """
+        # Solo las personas que ya existían pueden tener asignaciones previas
+        taken = set()
+        referenced = {person for person, _ in assignments}
+        for person_id, person in existing_people.items():
+            if person in referenced:
+                taken.update((person, assignment['course_code']) for assignment in get_assignments(person_id))
+
+        valid = []
+        for pair in assignments:
+            counters['total'] += 1
+            person, codigo = pair
+            if codigo not in known_courses or person not in known_people or pair in taken:
+                counters['incorrecto'] += 1
+                continue
+            taken.add(pair)
+            valid.append(pair)
+            counters['correcto'] += 1
+        return valid
+
+    def rollback(self):
+        """Deshace, en orden inverso, lo que alcanzó a aplicarse del lote"""
+        for action in reversed(self._undo):
+            if len(action) == 2:
+                store, row_ids = action
+                for row_id in row_ids:
+                    if store.exists(row_id):
+                        store.delete(row_id)
+            else:
+                store, row_id, previous = action
+                store.insert(row_id, previous)
+        self._undo = []
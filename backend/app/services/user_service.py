@@ -11,6 +11,14 @@ class UserService:
         """Obtiene todos los usuarios"""
         return self.user_storage.get_all_users()
     
+    def iter_users(self, after_id=0):
+        """Itera los usuarios en orden de id"""
+        return self.user_storage.iter_users(after_id)
+    
+    def get_users_page(self, after_id=0, limit=None):
+        """Obtiene una página de usuarios y el cursor de la siguiente"""
+        return self.user_storage.get_users_page(after_id, limit)
+    
     def get_user_by_id(self, user_id):
         """Obtiene un usuario por ID"""
         return self.user_storage.get_user_by_id(user_id)
@@ -23,7 +31,7 @@ class UserService:
         """Obtiene un usuario por email"""
         return self.user_storage.get_user_by_email(email)
     
-    def create_user(self, data):
+    def create_user(self, data, password_hash=None):
         """Crea un nuevo usuario"""
         try:
             # Validar datos requeridos
@@ -41,7 +49,7 @@ class UserService:
                 raise ValidationError('Password debe tener al menos 4 caracteres')
             
             # Crear usuario usando el almacenamiento en matrices
-            user = self.user_storage.create_user(data)
+            user = self.user_storage.create_user(data, password_hash)
             return user
             
         except ValidationError as e:
@@ -49,7 +57,7 @@ class UserService:
         except Exception as e:
             raise Exception(f"Error creando usuario: {str(e)}")
     
-    def update_user(self, user_id, data):
+    def update_user(self, user_id, data, password_hash=None):
         """Actualiza un usuario existente"""
         try:
             # Validar que el usuario existe
@@ -64,7 +72,7 @@ class UserService:
                 raise ValidationError('Password debe tener al menos 4 caracteres')
             
             # Actualizar usuario
-            user = self.user_storage.update_user(user_id, data)
+            user = self.user_storage.update_user(user_id, data, password_hash)
             return user
             
         except ValidationError as e:
@@ -87,4 +95,8 @@ class UserService:
     
     def get_storage_stats(self):
         """Obtiene estadísticas del almacenamiento"""
-        return self.user_storage.get_matrix_stats() 
\ No newline at end of file
+        return self.user_storage.get_matrix_stats()
+    
+    def compact_storage(self):
+        """Compacta el almacenamiento de usuarios"""
+        return self.user_storage.compact()
@@ -0,0 +1,931 @@
+import secrets
+import threading
+from array import array
+from datetime import datetime, timedelta, timezone
+from bisect import bisect_left, bisect_right, insort
+from app.utils.lock_striping import LockStripes
+from app.utils.record_cache import RecordCache
+
+# Época de referencia para las columnas de tipo timestamp (UTC, sin zona horaria)
+EPOCH = datetime(1970, 1, 1)
+
+# Tipos de columna soportados y su código de array
+COLUMN_TYPECODES = {
+    'int': 'q',
+    'bool': 'b',
+    'timestamp': 'q',
+    'str': 'i'
+}
+
+# Valor centinela que representa "sin valor" en cada tipo de columna
+NULL_VALUES = {
+    'int': -(2 ** 63),
+    'bool': -1,
+    'timestamp': -(2 ** 63),
+    'str': -1
+}
+
+
+def to_epoch_micros(value):
+    """
+    Convierte un datetime (o cadena ISO) a microsegundos desde la época.
+
+    Args:
+        value (datetime/str/int): Valor a convertir
+
+    Returns:
+        int: Microsegundos desde 1970-01-01
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def timestamp_columns(schema):
+    """Nombres de las columnas de tipo timestamp de un esquema (dict nombre -> tipo)"""
+    return {name for name, column_type in schema.items() if column_type == 'timestamp'}
+
+
+def from_epoch_micros(value):
+    """
+    Convierte microsegundos desde la época a datetime.
+
+    Args:
+        value (int): Microsegundos desde 1970-01-01
+
+    Returns:
+        datetime: Fecha y hora correspondiente
+    """
+    return EPOCH + timedelta(microseconds=value)
+
+
+class ColumnarStore:
+    """
+    Almacén de registros en columnas tipadas.
+    Cada columna es un array compacto indexado por ranura (slot); las cadenas
+    se codifican con diccionario, por lo que filtrar por valor solo requiere
+    buscar el código y recorrer un array de enteros.
+
+    Los ids externos de los registros son estables: un mapeo id -> ranura permite
+    reutilizar las ranuras liberadas y compactar las columnas sin renumerar ids.
+
+    Concurrencia: cada escritura toma el candado de la franja de su id y escribe las
+    columnas de la ranura con él, de modo que las escrituras a un mismo registro se
+    serializan (junto con su log y sus eventos) y las de registros distintos avanzan
+    en paralelo. Solo coinciden en secciones cortas: structure_lock para asignar o
+    liberar ranuras (y hacer crecer los arrays), añadir cadenas a los diccionarios y
+    subir la versión; index_lock para los índices únicos y ordenados; id_lock para
+    reservar ids. lock_key() serializa la comprobación y el alta de un valor único.
+
+    Orden de adquisición: franjas de clave, franjas de registro, structure_lock,
+    index_lock e id_lock. Las tres últimas no se anidan salvo en las operaciones que
+    reorganizan el almacén completo (compactar, restaurar).
+    """
+
+    def __init__(self, schema, record_type=None, cache_size=10000, unique=(), ordered=()):
+        """
+        Inicializa el almacén con un esquema declarado.
+
+        Args:
+            schema (list): Lista de tuplas (nombre_columna, tipo) donde tipo es
+                'int', 'bool', 'timestamp' o 'str'
+            record_type (type): Clase de registro con __slots__ en el mismo orden
+                que el esquema; si es None los registros se devuelven como dict
+            cache_size (int): Tamaño máximo de la caché de registros decodificados
+            unique (tuple): Columnas de valor único con índice hash valor -> id
+            ordered (tuple): Columnas int/timestamp con índice ordenado para find_range()
+        """
+        for name, column_type in schema:
+            if column_type not in COLUMN_TYPECODES:
+                raise ValueError(f"Tipo de columna no soportado para {name}: {column_type}")
+
+        self.schema = dict(schema)
+        if record_type is not None and tuple(self.schema) != tuple(record_type.__slots__):
+            raise ValueError(f"Los campos de {record_type.__name__} no coinciden con el esquema")
+        if record_type is not None and set(record_type.timestamps) != timestamp_columns(self.schema):
+            raise ValueError(f"Los campos de fecha de {record_type.__name__} no coinciden con el esquema")
+        self.record_type = record_type
+
+        # La ranura 0 queda reservada para que 0 signifique "ranura libre"
+        self.columns = {
+            name: array(COLUMN_TYPECODES[column_type], [NULL_VALUES[column_type]])
+            for name, column_type in self.schema.items()
+        }
+        # ranura -> id externo (0 = libre)
+        self.slot_ids = array('q', [0])
+        # id externo -> ranura
+        self.slots = {}
+        # Ids vivos en orden ascendente, para iterar sin recorrer filas eliminadas
+        self.live_ids = array('q')
+        # Ranuras liberadas disponibles para reutilizar
+        self.free_slots = []
+
+        # Diccionarios de codificación para columnas de texto
+        self.dictionaries = {name: [] for name, column_type in self.schema.items() if column_type == 'str'}
+        self.codes = {name: {} for name in self.dictionaries}
+
+        self.next_id = 1
+        self.cache = RecordCache(cache_size)
+
+        # Versiones: la del almacén sube con cada modificación y cada ranura guarda la
+        # versión de su última escritura. La época cambia al reemplazar el contenido
+        # (instantánea, reinicio), de modo que una versión vieja nunca vuelve a coincidir.
+        self.version = 0
+        self.epoch = secrets.token_hex(4)
+        self.row_versions = array('q', [0])
+
+        # Índices hash de las columnas únicas: valor almacenado -> id
+        for name in unique:
+            if name not in self.schema:
+                raise ValueError(f"Columna única desconocida: {name}")
+        self.unique_indexes = {name: {} for name in unique}
+
+        # Índices ordenados: valores almacenados en orden ascendente y sus ids (a igual
+        # valor, en orden de id), para consultas por rango como "creados recientemente"
+        for name in ordered:
+            if self.schema.get(name) not in ('int', 'timestamp'):
+                raise ValueError(f"Columna ordenada desconocida o no numérica: {name}")
+        self.ordered_indexes = {name: (array('q'), array('q')) for name in ordered}
+
+        # Log de escritura anticipada (opcional) que recibe cada modificación
+        self.journal = None
+        self.journal_name = None
+
+        # Bus de eventos (opcional) que recibe cada cambio como entidad, id y operación
+        self.events = None
+        self.entity = None
+
+        # Candados (en orden de adquisición): franjas por clave única y por id de
+        # registro, ranuras y diccionarios, índices y reserva de ids
+        self.key_locks = LockStripes()
+        self.row_locks = LockStripes()
+        self.structure_lock = threading.RLock()
+        self.index_lock = threading.RLock()
+        self.id_lock = threading.Lock()
+
+    @property
+    def count(self):
+        """Número de registros vivos"""
+        return len(self.slots)
+
+    def _encode(self, name, value):
+        """Convierte un valor de Python a su representación en la columna"""
+        column_type = self.schema[name]
+        if value is None:
+            return NULL_VALUES[column_type]
+        if column_type == 'str':
+            value = str(value)
+            code = self.codes[name].get(value)
+            if code is None:
+                with self.structure_lock:
+                    code = self.codes[name].get(value)
+                    if code is None:
+                        code = len(self.dictionaries[name])
+                        self.dictionaries[name].append(value)
+                        self.codes[name][value] = code
+            return code
+        if column_type == 'bool':
+            return 1 if value else 0
+        if column_type == 'timestamp':
+            return to_epoch_micros(value)
+        return int(value)
+
+    def _decode(self, name, raw, materialize=True):
+        """
+        Convierte un valor almacenado de vuelta a su tipo de Python. Con materialize=False
+        los timestamps quedan en microsegundos (los registros tipados los convierten a
+        datetime solo al leerlos como diccionario o al serializarlos).
+        """
+        column_type = self.schema[name]
+        if raw == NULL_VALUES[column_type]:
+            return None
+        if column_type == 'str':
+            return self.dictionaries[name][raw]
+        if column_type == 'bool':
+            return bool(raw)
+        if column_type == 'timestamp' and materialize:
+            return from_epoch_micros(raw)
+        return raw
+
+    def _acquire_slot(self, row_id):
+        """
+        Obtiene una ranura para un id nuevo, reutilizando ranuras libres.
+        Requiere structure_lock.
+        """
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = len(self.slot_ids)
+            for name, column in self.columns.items():
+                column.append(NULL_VALUES[self.schema[name]])
+            self.slot_ids.append(0)
+            self.row_versions.append(0)
+        self.slot_ids[slot] = row_id
+        self.slots[row_id] = slot
+        if not self.live_ids or row_id > self.live_ids[-1]:
+            self.live_ids.append(row_id)
+        else:
+            insort(self.live_ids, row_id)
+        return slot
+
+    def attach_journal(self, journal, name=None):
+        """
+        Conecta (o desconecta con None) un log que recibe cada modificación.
+
+        Args:
+            journal: Objeto con append(nombre, operación, id, campos)
+            name (str): Nombre del almacén en el log
+        """
+        self.journal = journal
+        self.journal_name = name
+
+    def _log(self, operation, row_id, slot=None, names=None):
+        """Envía una modificación al log con los valores tal como quedaron almacenados"""
+        fields = []
+        if slot is not None:
+            for index, (name, column) in enumerate(self.columns.items()):
+                if names is not None and name not in names:
+                    continue
+                raw = column[slot]
+                column_type = self.schema[name]
+                if raw == NULL_VALUES[column_type]:
+                    continue
+                fields.append((index, self.dictionaries[name][raw] if column_type == 'str' else raw))
+        self.journal.append(self.journal_name, operation, row_id, fields)
+
+    def attach_events(self, event_bus, entity=None):
+        """
+        Conecta (o desconecta con None) un bus de eventos de cambio.
+
+        Args:
+            event_bus (EventBus): Bus que recibe publish(entidad, id, operación)
+            entity (str): Nombre de la entidad en los eventos
+        """
+        self.events = event_bus
+        self.entity = entity
+
+    def _bump_version(self, slot=None):
+        """Incrementa la versión del almacén y la registra en la ranura modificada"""
+        with self.structure_lock:
+            self.version += 1
+            if slot is not None:
+                self.row_versions[slot] = self.version
+
+    def record_version(self, row_id):
+        """
+        Obtiene la versión de la última escritura de un registro.
+
+        Returns:
+            int: Versión del registro o None si no existe
+        """
+        slot = self.slots.get(row_id)
+        return None if slot is None else self.row_versions[slot]
+
+    def etag(self, row_id=None):
+        """
+        Obtiene una etiqueta de versión del almacén completo o de un registro.
+
+        Args:
+            row_id (int): Id del registro; None para el almacén completo
+
+        Returns:
+            str: Etiqueta '<época>.<versión>' o '<época>.<id>.<versión>'; None si el
+                registro no existe
+        """
+        if row_id is None:
+            return f"{self.epoch}.{self.version}"
+        version = self.record_version(row_id)
+        return None if version is None else f"{self.epoch}.{row_id}.{version}"
+
+    def _index_add(self, row_id, slot, names=None):
+        """Registra en los índices únicos y ordenados los valores de una ranura. Requiere index_lock."""
+        for name, index in self.unique_indexes.items():
+            if names is not None and name not in names:
+                continue
+            raw = self.columns[name][slot]
+            if raw != NULL_VALUES[self.schema[name]]:
+                index[raw] = row_id
+        for name, (keys, ids) in self.ordered_indexes.items():
+            if names is not None and name not in names:
+                continue
+            raw = self.columns[name][slot]
+            if raw != NULL_VALUES[self.schema[name]]:
+                position = bisect_right(ids, row_id, bisect_left(keys, raw), bisect_right(keys, raw))
+                keys.insert(position, raw)
+                ids.insert(position, row_id)
+
+    def _index_remove(self, row_id, slot, names=None):
+        """Quita de los índices únicos y ordenados los valores de una ranura. Requiere index_lock."""
+        for name, index in self.unique_indexes.items():
+            if names is not None and name not in names:
+                continue
+            raw = self.columns[name][slot]
+            if index.get(raw) == row_id:
+                del index[raw]
+        for name, (keys, ids) in self.ordered_indexes.items():
+            if names is not None and name not in names:
+                continue
+            raw = self.columns[name][slot]
+            end = bisect_right(keys, raw)
+            position = bisect_left(ids, row_id, bisect_left(keys, raw), end)
+            if position < end and ids[position] == row_id:
+                del keys[position]
+                del ids[position]
+
+    def _rebuild_indexes(self):
+        """Reconstruye los índices únicos y ordenados a partir de las columnas"""
+        for name in self.unique_indexes:
+            column = self.columns[name]
+            null = NULL_VALUES[self.schema[name]]
+            self.unique_indexes[name] = {
+                column[slot]: row_id for row_id, slot in self.slots.items() if column[slot] != null
+            }
+        for name in self.ordered_indexes:
+            column = self.columns[name]
+            null = NULL_VALUES[self.schema[name]]
+            pairs = sorted((column[slot], row_id) for row_id, slot in self.slots.items() if column[slot] != null)
+            self.ordered_indexes[name] = (array('q', [raw for raw, _ in pairs]), array('q', [row_id for _, row_id in pairs]))
+
+    def allocate_id(self):
+        """
+        Reserva el siguiente id de registro.
+
+        Returns:
+            int: Id asignado
+        """
+        with self.id_lock:
+            row_id = self.next_id
+            self.next_id += 1
+        return row_id
+
+    def allocate_ids(self, count):
+        """
+        Reserva un bloque de ids consecutivos.
+
+        Args:
+            count (int): Número de ids
+
+        Returns:
+            range: Ids asignados
+        """
+        with self.id_lock:
+            first_id = self.next_id
+            self.next_id += count
+        return range(first_id, first_id + count)
+
+    def _reserve_through(self, row_id):
+        """Avanza el siguiente id para que no vuelva a asignarse row_id"""
+        with self.id_lock:
+            if row_id >= self.next_id:
+                self.next_id = row_id + 1
+
+    def lock_key(self, *key):
+        """
+        Bloque que serializa las operaciones sobre una clave (p. ej. comprobar que un
+        valor único no existe y luego insertarlo). Claves distintas no se esperan salvo
+        que compartan franja.
+
+        Args:
+            key: Partes de la clave, p. ej. ('codigo', '770')
+        """
+        return self.key_locks.hold(key)
+
+    def lock_keys(self, keys):
+        """
+        Bloque con las franjas de varias claves (altas en lote), tomadas en orden.
+
+        Args:
+            keys (iterable): Tuplas de partes de clave
+        """
+        return self.key_locks.hold_many(keys)
+
+    def exists(self, row_id):
+        """Indica si existe un registro vivo con el id dado"""
+        return row_id in self.slots
+
+    def insert(self, row_id, record):
+        """
+        Inserta (o reemplaza) un registro completo con el id dado.
+
+        Args:
+            row_id (int): Id del registro
+            record (dict): Valores por nombre de columna; las columnas ausentes quedan vacías
+        """
+        with self.row_locks.hold(row_id):
+            values = [self._encode(name, record.get(name)) for name in self.columns]
+            # La franja del id protege su ranura: solo la estructura compartida necesita structure_lock
+            slot = self.slots.get(row_id)
+            if slot is None:
+                with self.structure_lock:
+                    slot = self._acquire_slot(row_id)
+            else:
+                with self.index_lock:
+                    self._index_remove(row_id, slot)
+            for column, value in zip(self.columns.values(), values):
+                column[slot] = value
+            with self.index_lock:
+                self._index_add(row_id, slot)
+            self._reserve_through(row_id)
+            self._bump_version(slot)
+            self.cache.invalidate(row_id)
+            if self.journal is not None:
+                self._log('insert', row_id, slot)
+            if self.events is not None:
+                self.events.publish(self.entity, row_id, 'insert')
+
+    def bulk_insert(self, row_ids, records):
+        """
+        Inserta un bloque de registros nuevos columna por columna. Todas las
+        columnas se codifican antes de modificar el almacén, de modo que un valor
+        inválido no deja el bloque insertado a medias.
+
+        Args:
+            row_ids (range): Ids nuevos en orden ascendente (ver allocate_ids). Entre
+                la reserva y la inserción otra alta puede haber usado un id mayor,
+                así que el bloque no tiene por qué ser el último
+            records (list): Valores por nombre de columna de cada registro
+        """
+        if len(row_ids) != len(records):
+            raise ValueError("El número de ids no coincide con el número de registros")
+        if not records:
+            return
+        with self.row_locks.hold_many(row_ids):
+            if any(row_id in self.slots for row_id in row_ids):
+                raise ValueError("Los ids del bloque deben ser nuevos")
+
+            encoded = {}
+            for name, column_type in self.schema.items():
+                encoded[name] = array(COLUMN_TYPECODES[column_type],
+                                      [self._encode(name, record.get(name)) for record in records])
+
+            # Los arrays crecen a la vez para que todas las columnas sigan alineadas por ranura
+            with self.structure_lock:
+                first_slot = len(self.slot_ids)
+                for name, column in self.columns.items():
+                    column.extend(encoded[name])
+                self.slot_ids.extend(row_ids)
+                self.version += 1
+                self.row_versions.extend([self.version] * len(row_ids))
+                self.slots.update(zip(row_ids, range(first_slot, first_slot + len(row_ids))))
+                if not self.live_ids or row_ids[0] > self.live_ids[-1]:
+                    self.live_ids.extend(row_ids)
+                else:
+                    for row_id in row_ids:
+                        insort(self.live_ids, row_id)
+            self._reserve_through(row_ids[-1])
+            self._bulk_index_add(row_ids, encoded)
+
+            if self.journal is not None:
+                for slot, row_id in enumerate(row_ids, start=first_slot):
+                    self._log('insert', row_id, slot)
+        if self.events is not None:
+            for row_id in row_ids:
+                self.events.publish(self.entity, row_id, 'insert')
+
+    def _bulk_index_add(self, row_ids, encoded):
+        """Registra en los índices los valores codificados de un bloque de altas"""
+        with self.index_lock:
+            for name, index in self.unique_indexes.items():
+                null = NULL_VALUES[self.schema[name]]
+                index.update((raw, row_id) for raw, row_id in zip(encoded[name], row_ids) if raw != null)
+            for name, (keys, ids) in self.ordered_indexes.items():
+                null = NULL_VALUES[self.schema[name]]
+                pairs = sorted((raw, row_id) for raw, row_id in zip(encoded[name], row_ids) if raw != null)
+                if pairs and (not keys or pairs[0][0] >= keys[-1]):
+                    # Caso habitual (fecha de creación actual): el bloque va al final del índice
+                    keys.extend(raw for raw, _ in pairs)
+                    ids.extend(row_id for _, row_id in pairs)
+                else:
+                    for raw, row_id in pairs:
+                        position = bisect_right(ids, row_id, bisect_left(keys, raw), bisect_right(keys, raw))
+                        keys.insert(position, raw)
+                        ids.insert(position, row_id)
+
+    def update(self, row_id, changes):
+        """
+        Actualiza columnas de un registro existente. Los valores None se ignoran.
+
+        Args:
+            row_id (int): Id del registro
+            changes (dict): Valores nuevos por nombre de columna
+
+        Returns:
+            bool: True si el registro existía
+        """
+        with self.row_locks.hold(row_id):
+            slot = self.slots.get(row_id)
+            if slot is None:
+                return False
+            changed = {name for name, value in changes.items() if name in self.columns and value is not None}
+            encoded = {name: self._encode(name, changes[name]) for name in changed}
+            with self.index_lock:
+                self._index_remove(row_id, slot, changed)
+            for name, raw in encoded.items():
+                self.columns[name][slot] = raw
+            with self.index_lock:
+                self._index_add(row_id, slot, changed)
+            if changed:
+                self._bump_version(slot)
+            self.cache.invalidate(row_id)
+            if self.journal is not None and changed:
+                self._log('update', row_id, slot, changed)
+            if self.events is not None and changed:
+                self.events.publish(self.entity, row_id, 'update')
+        return True
+
+    def delete(self, row_id):
+        """
+        Elimina un registro y deja su ranura libre para reutilizarla.
+
+        Returns:
+            bool: True si el registro existía
+        """
+        with self.row_locks.hold(row_id):
+            slot = self.slots.get(row_id)
+            if slot is None:
+                return False
+            with self.index_lock:
+                self._index_remove(row_id, slot)
+            for name, column in self.columns.items():
+                column[slot] = NULL_VALUES[self.schema[name]]
+            # La ranura solo vuelve a la lista de libres cuando ya está vacía
+            with self.structure_lock:
+                del self.slots[row_id]
+                self.slot_ids[slot] = 0
+                self.row_versions[slot] = 0
+                self._bump_version()
+                self.free_slots.append(slot)
+                del self.live_ids[bisect_left(self.live_ids, row_id)]
+            self.cache.invalidate(row_id)
+            if self.journal is not None:
+                self._log('delete', row_id)
+            if self.events is not None:
+                self.events.publish(self.entity, row_id, 'delete')
+        return True
+
+    def get(self, row_id):
+        """
+        Obtiene un registro decodificado.
+
+        Args:
+            row_id (int): Id del registro
+
+        Returns:
+            Record/dict: Instancia de record_type (compartida con la caché, no debe
+                modificarse) o dict con las columnas con valor; None si no existe
+        """
+        cached = self.cache.get(row_id)
+        if cached is not None:
+            return cached if self.record_type is not None else dict(cached)
+        # Con la franja del id tomada ninguna escritura cambia la ranura mientras se lee,
+        # ni queda en la caché un registro anterior a una escritura ya confirmada
+        with self.row_locks.hold(row_id):
+            slot = self.slots.get(row_id)
+            if slot is None:
+                return None
+
+            if self.record_type is not None:
+                record = self.record_type(*[
+                    self._decode(name, column[slot], False) for name, column in self.columns.items()
+                ])
+                self.cache.put(row_id, record)
+                return record
+
+            record = {}
+            for name, column in self.columns.items():
+                value = self._decode(name, column[slot])
+                if value is not None:
+                    record[name] = value
+
+            self.cache.put(row_id, record)
+        return dict(record)
+
+    def ids(self):
+        """
+        Itera los ids de los registros vivos en orden ascendente.
+
+        Returns:
+            iterator: Ids de registro
+        """
+        return iter(self.live_ids)
+
+    def get_all(self):
+        """Obtiene todos los registros vivos"""
+        return [self.get(row_id) for row_id in self.live_ids]
+
+    def iter_records(self, after_id=0):
+        """
+        Itera los registros vivos en orden de id, sin materializar una lista.
+
+        Args:
+            after_id (int): Solo se devuelven registros con id mayor a este
+
+        Returns:
+            generator: Registros en orden ascendente de id
+        """
+        # Reubicarse con bisect tras cada registro tolera altas y bajas durante la iteración
+        last_id = after_id
+        while True:
+            position = bisect_right(self.live_ids, last_id)
+            if position >= len(self.live_ids):
+                return
+            last_id = self.live_ids[position]
+            record = self.get(last_id)
+            if record is not None:
+                yield record
+
+    def page(self, after_id=0, limit=None):
+        """
+        Obtiene una página de registros usando paginación por cursor (keyset).
+
+        Args:
+            after_id (int): Cursor: id del último registro de la página anterior
+            limit (int): Máximo de registros; None devuelve todos los restantes
+
+        Returns:
+            tuple: (lista de registros, cursor siguiente o None si no hay más)
+        """
+        start = bisect_right(self.live_ids, after_id)
+        end = len(self.live_ids) if limit is None else min(start + limit, len(self.live_ids))
+        page_ids = self.live_ids[start:end]
+        records = [self.get(row_id) for row_id in page_ids]
+        next_cursor = page_ids[-1] if page_ids and end < len(self.live_ids) else None
+        return records, next_cursor
+
+    def _raw_for(self, name, value):
+        """Valor almacenado correspondiente a value, o None si no puede existir en la columna"""
+        if self.schema[name] == 'str':
+            return self.codes[name].get(str(value))
+        return self._encode(name, value)
+
+    def find(self, name, value):
+        """
+        Busca los ids cuyo valor en la columna coincide, recorriendo la columna completa
+        (o consultando su índice si la columna es única).
+
+        Args:
+            name (str): Nombre de la columna
+            value: Valor buscado
+
+        Returns:
+            list: Ids que coinciden en orden ascendente
+        """
+        if value is None:
+            return []
+        raw = self._raw_for(name, value)
+        if raw is None:
+            return []
+        if name in self.unique_indexes:
+            row_id = self.unique_indexes[name].get(raw)
+            return [] if row_id is None else [row_id]
+
+        matches = []
+        with self.structure_lock:
+            column = self.columns[name]
+            start = 1
+            while True:
+                try:
+                    slot = column.index(raw, start)
+                except ValueError:
+                    break
+                matches.append(self.slot_ids[slot])
+                start = slot + 1
+        matches.sort()
+        return matches
+
+    def find_first(self, name, value):
+        """
+        Busca un id cuyo valor en la columna coincide (pensado para columnas únicas).
+
+        Returns:
+            int: Id encontrado o None
+        """
+        if value is None:
+            return None
+        raw = self._raw_for(name, value)
+        if raw is None:
+            return None
+        if name in self.unique_indexes:
+            return self.unique_indexes[name].get(raw)
+        with self.structure_lock:
+            try:
+                return self.slot_ids[self.columns[name].index(raw, 1)]
+            except ValueError:
+                return None
+
+    def existing_values(self, name, values):
+        """
+        Obtiene cuáles de los valores ya están en uso por algún registro vivo,
+        recorriendo la columna una sola vez para todo el lote.
+
+        Args:
+            name (str): Nombre de la columna
+            values (iterable): Valores a comprobar
+
+        Returns:
+            set: Valores que ya existen
+        """
+        raw_values = {}
+        for value in values:
+            raw = self._raw_for(name, value) if value is not None else None
+            if raw is not None:
+                raw_values[raw] = value
+        if not raw_values:
+            return set()
+        if name in self.unique_indexes:
+            index = self.unique_indexes[name]
+            return {value for raw, value in raw_values.items() if raw in index}
+        with self.structure_lock:
+            column = self.columns[name]
+            live_raw = {column[slot] for slot in self.slots.values()}
+        return {value for raw, value in raw_values.items() if raw in live_raw}
+
+    def find_range(self, name, low=None, high=None, limit=None, descending=False):
+        """
+        Busca los ids cuyo valor en una columna con índice ordenado está en [low, high).
+
+        Args:
+            name (str): Columna con índice ordenado (ver ordered)
+            low: Valor mínimo incluido (datetime, ISO o entero); None sin mínimo
+            high: Valor máximo excluido; None sin máximo
+            limit (int): Máximo de ids; None devuelve todos
+            descending (bool): Del valor mayor al menor (p. ej. los más recientes primero)
+
+        Returns:
+            list: Ids ordenados por valor (y por id a igual valor)
+        """
+        with self.index_lock:
+            keys, ids = self.ordered_indexes[name]
+            start = 0 if low is None else bisect_left(keys, self._encode(name, low))
+            end = len(keys) if high is None else bisect_left(keys, self._encode(name, high))
+            if end <= start:
+                return []
+            if descending:
+                first = start if limit is None else max(start, end - limit)
+                return ids[first:end].tolist()[::-1]
+            last = end if limit is None else min(end, start + limit)
+            return ids[start:last].tolist()
+
+    def compact(self):
+        """
+        Compacta las columnas: mueve los registros vivos a ranuras contiguas,
+        libera las ranuras sobrantes y descarta las cadenas que ya no se usan.
+        Los ids externos no cambian.
+
+        Returns:
+            dict: Ranuras y entradas de diccionario liberadas
+        """
+        with self.row_locks.hold_all(), self.structure_lock, self.index_lock:
+            old_slots = [self.slots[row_id] for row_id in self.live_ids]
+            freed_slots = len(self.slot_ids) - 1 - len(old_slots)
+            freed_strings = 0
+
+            for name, column in self.columns.items():
+                column_type = self.schema[name]
+                values = [column[slot] for slot in old_slots]
+                if column_type == 'str':
+                    # Recodificar solo las cadenas todavía referenciadas
+                    old_dictionary = self.dictionaries[name]
+                    new_dictionary = []
+                    new_codes = {}
+                    recoded = []
+                    for code in values:
+                        if code == NULL_VALUES[column_type]:
+                            recoded.append(code)
+                            continue
+                        value = old_dictionary[code]
+                        new_code = new_codes.get(value)
+                        if new_code is None:
+                            new_code = len(new_dictionary)
+                            new_dictionary.append(value)
+                            new_codes[value] = new_code
+                        recoded.append(new_code)
+                    freed_strings += len(old_dictionary) - len(new_dictionary)
+                    self.dictionaries[name] = new_dictionary
+                    self.codes[name] = new_codes
+                    values = recoded
+                self.columns[name] = array(COLUMN_TYPECODES[column_type], [NULL_VALUES[column_type]] + values)
+
+            self.row_versions = array('q', [0] + [self.row_versions[slot] for slot in old_slots])
+            self.slot_ids = array('q', [0])
+            self.slot_ids.extend(self.live_ids)
+            self.slots = {row_id: slot for slot, row_id in enumerate(self.live_ids, start=1)}
+            self.free_slots = []
+            self._rebuild_indexes()
+
+            return {
+                'freed_slots': freed_slots,
+                'freed_strings': freed_strings
+            }
+
+    def write_snapshot(self, writer):
+        """
+        Escribe el estado completo del almacén (columnas, ranuras, ids y diccionarios).
+
+        Args:
+            writer (SnapshotWriter): Escritor binario de la instantánea
+        """
+        # Las columnas se escriben con la franja de cada registro: sin ellas, una escritura
+        # en curso podría quedar a medias en la instantánea
+        with self.row_locks.hold_all(), self.structure_lock:
+            writer.write_uint(len(self.schema))
+            for name, column_type in self.schema.items():
+                writer.write_str(name)
+                writer.write_str(column_type)
+            writer.write_uint(self.next_id)
+            writer.write_array(self.slot_ids)
+            writer.write_array(self.live_ids)
+            writer.write_array(array('q', self.free_slots))
+            for name, column in self.columns.items():
+                writer.write_array(column)
+                if name in self.dictionaries:
+                    writer.write_strings(self.dictionaries[name])
+
+    def read_snapshot(self, reader):
+        """
+        Lee el estado de un almacén desde una instantánea sin aplicarlo.
+
+        Args:
+            reader (SnapshotReader): Lector binario de la instantánea
+
+        Returns:
+            dict: Estado listo para restore()
+
+        Raises:
+            ValueError: Si el esquema de la instantánea no coincide con el del almacén
+        """
+        schema = [(reader.read_str(), reader.read_str()) for _ in range(reader.read_uint())]
+        if dict(schema) != self.schema or [name for name, _ in schema] != list(self.schema):
+            raise ValueError("El esquema de la instantánea no coincide con el del almacén")
+
+        state = {
+            'next_id': reader.read_uint(),
+            'slot_ids': reader.read_array('q'),
+            'live_ids': reader.read_array('q'),
+            'free_slots': reader.read_array('q').tolist(),
+            'columns': {},
+            'dictionaries': {}
+        }
+        for name, column_type in self.schema.items():
+            state['columns'][name] = reader.read_array(COLUMN_TYPECODES[column_type])
+            if column_type == 'str':
+                state['dictionaries'][name] = reader.read_strings()
+        return state
+
+    def restore(self, state):
+        """
+        Reemplaza el contenido del almacén con un estado leído por read_snapshot().
+
+        Args:
+            state (dict): Estado del almacén
+        """
+        with self.row_locks.hold_all(), self.structure_lock, self.index_lock:
+            self.columns = state['columns']
+            self.slot_ids = state['slot_ids']
+            self.live_ids = state['live_ids']
+            self.free_slots = state['free_slots']
+            self.slots = {row_id: slot for slot, row_id in enumerate(self.slot_ids) if row_id}
+            self.dictionaries = state['dictionaries']
+            self.codes = {
+                name: {value: code for code, value in enumerate(values)}
+                for name, values in self.dictionaries.items()
+            }
+            self.next_id = state['next_id']
+            self._rebuild_indexes()
+            self.cache.clear()
+            self.epoch = secrets.token_hex(4)
+            self.version += 1
+            self.row_versions = array('q', [self.version]) * len(self.slot_ids)
+            if self.events is not None:
+                self.events.publish(self.entity, None, 'reload')
+
+    def get_stats(self):
+        """
+        Obtiene estadísticas del almacén.
+
+        Returns:
+            dict: Registros, capacidad, memoria de columnas y estado de la caché
+        """
+        memory_bytes = len(self.slot_ids) * self.slot_ids.itemsize
+        memory_bytes += len(self.live_ids) * self.live_ids.itemsize
+        for column in self.columns.values():
+            memory_bytes += len(column) * column.itemsize
+        return {
+            'records': self.count,
+            'capacity': len(self.slot_ids) - 1,
+            'free_slots': len(self.free_slots),
+            'column_memory_bytes': memory_bytes,
+            'dictionary_entries': {name: len(values) for name, values in self.dictionaries.items()},
+            'unique_indexes': {name: len(index) for name, index in self.unique_indexes.items()},
+            'ordered_indexes': {name: len(keys) for name, (keys, _) in self.ordered_indexes.items()},
+            'version': self.version,
+            'record_cache': self.cache.get_stats(),
+            'locks': {'rows': self.row_locks.get_stats(), 'keys': self.key_locks.get_stats()}
+        }
+
+    def __repr__(self):
+        return f"ColumnarStore({len(self.schema)} columnas, {self.count} registros)"
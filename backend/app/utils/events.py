@@ -0,0 +1,145 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+# Operaciones de cambio publicadas por los almacenamientos
+OPERATIONS = ('insert', 'update', 'delete', 'reload')
+
+
+class ChangeEvent:
+    """
+    Evento de cambio de un almacenamiento.
+    La operación 'reload' (id None) indica que el almacén completo se reemplazó,
+    por ejemplo al cargar una instantánea, y todo lo derivado de él debe descartarse.
+    """
+
+    __slots__ = ('entity', 'id', 'operation', 'version', 'timestamp')
+
+    def __init__(self, entity, id, operation, version, timestamp):
+        self.entity = entity
+        self.id = id
+        self.operation = operation
+        self.version = version
+        self.timestamp = timestamp
+
+    def to_dict(self):
+        """Convierte el evento a diccionario"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"ChangeEvent({self.entity}, {self.id!r}, {self.operation}, v{self.version})"
+
+
+class EventBus:
+    """
+    Bus de eventos de cambio de los almacenamientos.
+    Cada modificación se publica como un ChangeEvent con una versión global
+    estrictamente creciente; los suscriptores (cachés de reportes, respuestas o
+    gráficas) reciben los eventos de forma síncrona en el hilo que escribe, y los
+    eventos recientes se conservan para quien consulte por versión.
+    """
+
+    def __init__(self, history_size=10000):
+        """
+        Inicializa el bus.
+
+        Args:
+            history_size (int): Número de eventos recientes que se conservan
+        """
+        self.lock = threading.Lock()
+        self.version = 0
+        self.history = deque(maxlen=history_size)
+        self.subscribers = {}
+        self._tokens = itertools.count(1)
+        self.published = 0
+        self.subscriber_errors = 0
+
+    def subscribe(self, callback, entities=None):
+        """
+        Registra un suscriptor.
+
+        Args:
+            callback (callable): Función que recibe cada ChangeEvent
+            entities (iterable): Entidades de interés; None recibe todas
+
+        Returns:
+            int: Identificador para cancelar la suscripción
+        """
+        token = next(self._tokens)
+        with self.lock:
+            self.subscribers[token] = (callback, frozenset(entities) if entities is not None else None)
+        return token
+
+    def unsubscribe(self, token):
+        """Cancela una suscripción"""
+        with self.lock:
+            return self.subscribers.pop(token, None) is not None
+
+    def publish(self, entity, id, operation):
+        """
+        Publica un cambio y lo entrega a los suscriptores interesados. Un error en
+        un suscriptor no interrumpe la escritura que originó el evento.
+
+        Args:
+            entity (str): Nombre del almacén ('users', 'grades', ...)
+            id: Id del registro modificado (None para 'reload')
+            operation (str): 'insert', 'update', 'delete' o 'reload'
+
+        Returns:
+            ChangeEvent: Evento publicado
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Operación de cambio no soportada: {operation}")
+        with self.lock:
+            self.version += 1
+            event = ChangeEvent(entity, id, operation, self.version, time.time())
+            self.history.append(event)
+            self.published += 1
+            subscribers = list(self.subscribers.values())
+
+        for callback, entities in subscribers:
+            if entities is not None and entity not in entities:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                self.subscriber_errors += 1
+                print(f"Error en suscriptor de eventos ({event!r}): {str(e)}")
+        return event
+
+    def changes_since(self, version, entities=None):
+        """
+        Obtiene los eventos posteriores a una versión, para actualizar una caché
+        de forma incremental.
+
+        Args:
+            version (int): Última versión ya procesada
+            entities (iterable): Entidades de interés; None devuelve todas
+
+        Returns:
+            list: Eventos en orden de versión, o None si parte de ellos ya salió
+                del historial (la caché debe reconstruirse por completo)
+        """
+        entities = frozenset(entities) if entities is not None else None
+        with self.lock:
+            if version >= self.version:
+                return []
+            if not self.history or self.history[0].version > version + 1:
+                return None
+            events = [event for event in self.history if event.version > version]
+        return [event for event in events if entities is None or event.entity in entities]
+
+    def get_stats(self):
+        """Obtiene estadísticas del bus"""
+        return {
+            'version': self.version,
+            'published': self.published,
+            'subscribers': len(self.subscribers),
+            'history': len(self.history),
+            'subscriber_errors': self.subscriber_errors
+        }
+
+
+# Bus global de eventos de los almacenamientos
+event_bus = EventBus()
@@ -0,0 +1,514 @@
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+from datetime import datetime
+
+# Versión del formato del manifiesto de notas segmentadas
+# (2: el manifiesto guarda además el resumen de cada matriz;
+#  3: las listas de actividades y estudiantes pasan al segmento del curso)
+MANIFEST_FORMAT = 3
+
+# Listas de un curso que viven con su matriz y no en el manifiesto
+ROSTER_KEYS = ('activities', 'students')
+
+
+def empty_grades_data():
+    """
+    Estructura vacía del manifiesto de notas: información de cada curso, resumen de
+    su matriz (filas, columnas, densidad y celdas) y metadata. Las matrices completas
+    se cargan aparte, curso por curso.
+    """
+    now = datetime.utcnow().isoformat()
+    return {
+        'courses': {},
+        'matrices': {},
+        'metadata': {
+            'created_at': now,
+            'last_updated': now
+        }
+    }
+
+
+def course_summary(course_info):
+    """Información de un curso sin sus listas de actividades y estudiantes"""
+    return {key: value for key, value in course_info.items() if key not in ROSTER_KEYS}
+
+
+def matrix_summary(matrix_info):
+    """Resumen de una matriz que se mantiene residente aunque la matriz no lo esté"""
+    return {
+        'rows': matrix_info['rows'],
+        'cols': matrix_info['cols'],
+        'density': matrix_info.get('density'),
+        'cells': len(matrix_info['matrix_data'])
+    }
+
+
+class JsonGradesBackend:
+    """
+    Persistencia de las notas en archivos JSON segmentados por curso.
+    Un manifiesto (manifest.json) guarda el resumen de cada curso y la metadata; la
+    matriz de cada curso y sus listas de actividades y estudiantes viven en su propio
+    segmento, de modo que guardar un curso solo reescribe su segmento y un manifiesto
+    de tamaño fijo por curso, no las matrices ni las listas de los demás. Cada
+    archivo se escribe en un temporal y se renombra, así que un corte a mitad de un
+    guardado deja intacta la versión anterior. El formato anterior (un único
+    grades_data.json) se migra al cargar.
+    Una carga en modo merge solo agrega sus celdas cambiadas al registro de cambios
+    del segmento (segmento + ".delta"); cada segmento tiene una generación y solo se
+    aplican los cambios de su misma generación, así que reescribir el segmento
+    descarta el registro anterior aunque no se alcance a borrar.
+    """
+
+    name = 'json'
+
+    def __init__(self, storage_file):
+        """
+        Args:
+            storage_file (str): Archivo del formato anterior; los segmentos viven en un
+                directorio con su mismo nombre sin extensión
+        """
+        self.storage_file = storage_file
+        self.directory = os.path.splitext(storage_file)[0]
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self.segments_directory = os.path.join(self.directory, 'courses')
+        # El manifiesto es compartido: sus reescrituras se serializan; los segmentos no
+        self.write_lock = threading.Lock()
+        self.segment_writes = 0
+        self.manifest_writes = 0
+        self.delta_writes = 0
+        self.migrated = False
+        # Generación del segmento de cada curso leído o escrito en este proceso
+        self.generations = {}
+
+    def segment_path(self, course_key):
+        """
+        Ruta del segmento de un curso. La clave viene del XML subido, así que se
+        limpia para el sistema de archivos y se le agrega un resumen que la distingue
+        de otras claves que se limpian igual.
+        """
+        safe_key = re.sub(r'[^A-Za-z0-9_-]', '_', course_key)[:64]
+        digest = hashlib.blake2b(course_key.encode('utf-8', 'surrogatepass'), digest_size=4).hexdigest()
+        return os.path.join(self.segments_directory, f"{safe_key}-{digest}.json")
+
+    def delta_path(self, course_key):
+        """Ruta del registro de cambios del segmento de un curso"""
+        return f"{self.segment_path(course_key)}.delta"
+
+    @staticmethod
+    def _remove(path):
+        """Borra un archivo si existe"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _size(path):
+        """Tamaño de un archivo (0 si no existe)"""
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _read_json(path):
+        """Lee un archivo JSON (None si no existe o está dañado)"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return None
+
+    @staticmethod
+    def _write_atomic(path, payload):
+        """Escribe un archivo JSON compacto en un temporal y lo renombra sobre el destino"""
+        temp_path = f"{path}.tmp.{threading.get_ident()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def load_manifest(self):
+        """
+        Carga el manifiesto (sin leer ningún segmento), migrando antes el formato
+        anterior si aún no hay manifiesto.
+
+        Returns:
+            dict: Datos con 'courses', 'matrices' y 'metadata'
+        """
+        manifest = self._read_json(self.manifest_path)
+        if manifest is None:
+            if not os.path.exists(self.storage_file):
+                return empty_grades_data()
+            return self._migrate()
+
+        data = empty_grades_data()
+        data['metadata'].update(manifest.get('metadata', {}))
+        summaries = manifest.get('matrices', {})
+        upgraded = False
+        for course_key, course_info in manifest.get('courses', {}).items():
+            summary = summaries.get(course_key)
+            if summary is None or any(key in course_info for key in ROSTER_KEYS):
+                # Manifiestos de las versiones 1 y 2: el resumen sale del segmento y las
+                # listas del curso pasan al segmento, una única vez
+                matrix_info = self.load_matrix(course_key)
+                if matrix_info is None:
+                    continue
+                if any(key in course_info for key in ROSTER_KEYS):
+                    for key in ROSTER_KEYS:
+                        matrix_info[key] = course_info.get(key, [])
+                    self._write_segment(course_key, matrix_info)
+                summary = matrix_summary(matrix_info)
+                upgraded = True
+            data['courses'][course_key] = course_summary(course_info)
+            data['matrices'][course_key] = summary
+        if upgraded:
+            # Guardar el manifiesto actualizado para no releer los segmentos en cada arranque
+            self._write_manifest(data)
+        return data
+
+    def load_matrix(self, course_key):
+        """
+        Carga la matriz de un curso desde su segmento, aplicando los cambios de su
+        generación que estén en el registro de cambios.
+
+        Returns:
+            dict: 'matrix_data' (claves "fila,columna"), 'rows', 'cols', 'density',
+                'activities' y 'students'; None si el segmento no existe
+        """
+        matrix_info = self._read_json(self.segment_path(course_key))
+        if matrix_info is None:
+            return None
+        for key in ROSTER_KEYS:
+            # Segmentos anteriores al formato 3: las listas todavía están en el manifiesto
+            matrix_info.setdefault(key, [])
+        generation = matrix_info.pop('generation', None)
+        self.generations[course_key] = generation
+        try:
+            with open(self.delta_path(course_key), 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            lines = []
+        matrix_data = matrix_info['matrix_data']
+        for line in lines:
+            try:
+                change = json.loads(line) if line else None
+            except json.JSONDecodeError:
+                # Línea cortada por una caída a mitad de un guardado
+                continue
+            if change is None or change.get('generation') != generation:
+                continue
+            for key, value in change['cells'].items():
+                if value is None:
+                    matrix_data.pop(key, None)
+                else:
+                    matrix_data[key] = value
+            for key in ROSTER_KEYS:
+                matrix_info[key].extend(change.get(f"{key}_added", ()))
+            matrix_info.update(rows=change['rows'], cols=change['cols'], density=change['density'])
+        return matrix_info
+
+    def _migrate(self):
+        """
+        Convierte el archivo único del formato anterior en manifiesto y segmentos.
+        El archivo anterior no se modifica: una vez escrito el manifiesto ya no se
+        vuelve a leer.
+        """
+        legacy = self._read_json(self.storage_file) or {}
+        data = empty_grades_data()
+        data['metadata'].update(legacy.get('metadata', {}))
+        matrices = legacy.get('sparse_matrices', {})
+        for course_key, course_info in legacy.get('courses', {}).items():
+            if course_key not in matrices:
+                continue
+            matrix_info = dict(matrices[course_key], **{key: course_info.get(key, []) for key in ROSTER_KEYS})
+            self._write_segment(course_key, matrix_info)
+            data['courses'][course_key] = course_summary(course_info)
+            data['matrices'][course_key] = matrix_summary(matrix_info)
+        self._write_manifest(data)
+        self.migrated = True
+        return data
+
+    def _write_segment(self, course_key, matrix_info):
+        """
+        Reescribe el segmento de un curso (matriz con claves de celda "fila,columna" y
+        listas de actividades y estudiantes) con una generación nueva
+        """
+        os.makedirs(self.segments_directory, exist_ok=True)
+        generation = secrets.token_hex(8)
+        self._write_atomic(self.segment_path(course_key), dict(matrix_info, generation=generation, matrix_data={
+            (f"{key[0]},{key[1]}" if isinstance(key, tuple) else str(key)): value
+            for key, value in matrix_info['matrix_data'].items()
+        }))
+        self.generations[course_key] = generation
+        # Los cambios anteriores ya están en el segmento (y su generación ya no coincide)
+        self._remove(self.delta_path(course_key))
+        self.segment_writes += 1
+
+    def _write_manifest(self, grades_data):
+        """
+        Reescribe el manifiesto. Se serializa una copia tomada con el candado de
+        escritura, de modo que dos guardados concurrentes no se intercalan ni recorren
+        diccionarios que otro hilo está modificando.
+        """
+        with self.write_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._write_atomic(self.manifest_path, {
+                'format': MANIFEST_FORMAT,
+                'metadata': dict(grades_data['metadata']),
+                'courses': dict(grades_data['courses']),
+                'matrices': dict(grades_data['matrices'])
+            })
+            self.manifest_writes += 1
+
+    def save_course(self, grades_data, course_key, matrix_info):
+        """Guarda un curso: su segmento primero y después el manifiesto que lo referencia"""
+        self._write_segment(course_key, matrix_info)
+        self._write_manifest(grades_data)
+
+    def save_course_delta(self, grades_data, course_key, matrix_info, changes, added=None):
+        """
+        Guarda solo las celdas que cambiaron en un curso, agregándolas al registro de
+        cambios de su segmento. Si no se conoce la generación del segmento o el
+        registro ya es más grande que el segmento, el curso se reescribe completo.
+
+        Args:
+            grades_data (dict): Manifiesto en memoria
+            course_key (str): Clave del curso
+            matrix_info (dict): Matriz completa ya actualizada
+            changes (dict): "fila,columna" -> nota nueva (None si la celda se borró)
+            added (dict): Actividades y estudiantes agregados al final de las listas
+                ('activities_added', 'students_added')
+        """
+        delta_path = self.delta_path(course_key)
+        if course_key not in self.generations or \
+                self._size(delta_path) > self._size(self.segment_path(course_key)):
+            self.save_course(grades_data, course_key, matrix_info)
+            return
+        change = {
+            'generation': self.generations[course_key],
+            'rows': matrix_info['rows'],
+            'cols': matrix_info['cols'],
+            'density': matrix_info.get('density'),
+            'cells': changes
+        }
+        for key in ROSTER_KEYS:
+            if added and added.get(f"{key}_added"):
+                change[f"{key}_added"] = added[f"{key}_added"]
+        line = json.dumps(change, ensure_ascii=False, separators=(',', ':'))
+        # El salto de línea inicial cierra una línea cortada por una caída anterior
+        with open(delta_path, 'a', encoding='utf-8') as f:
+            f.write(f"\n{line}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.delta_writes += 1
+        self._write_manifest(grades_data)
+
+    def delete_course(self, grades_data, course_key):
+        """Elimina un curso: el manifiesto deja de referenciarlo antes de borrar su segmento"""
+        self._write_manifest(grades_data)
+        self._remove(self.segment_path(course_key))
+        self._remove(self.delta_path(course_key))
+        self.generations.pop(course_key, None)
+
+    def get_stats(self):
+        """Obtiene la configuración de la persistencia"""
+        return {
+            'backend': self.name,
+            'path': self.directory,
+            'segment_writes': self.segment_writes,
+            'manifest_writes': self.manifest_writes,
+            'delta_writes': self.delta_writes,
+            'migrated': self.migrated
+        }
+
+
+class SqliteGradesBackend:
+    """
+    Persistencia de las notas en la base de datos SQLite de los almacenamientos.
+    Cada curso es una fila y cada nota distinta de cero una celda (curso, fila,
+    columna), de modo que guardar un curso solo escribe ese curso. Como en los
+    segmentos JSON, las listas de actividades y estudiantes (roster) se cargan con la
+    matriz y no con el resumen del curso.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, database):
+        """
+        Crea las tablas de notas si no existen.
+
+        Args:
+            database (SqliteDatabase): Base de datos compartida
+        """
+        self.database = database
+        with database.transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS grades_courses ('
+                'course_key TEXT PRIMARY KEY, tutor_id TEXT, course_code TEXT, info TEXT NOT NULL, '
+                'rows INTEGER NOT NULL, cols INTEGER NOT NULL, density REAL, cells INTEGER, roster TEXT)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS grades_courses_tutor_id ON grades_courses (tutor_id)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS grades_cells ('
+                'course_key TEXT NOT NULL, row INTEGER NOT NULL, col INTEGER NOT NULL, value REAL NOT NULL, '
+                'PRIMARY KEY (course_key, row, col)) WITHOUT ROWID'
+            )
+            # Bases anteriores sin el conteo de celdas: se agrega y se calcula una única vez
+            columns = {row[1] for row in connection.execute('PRAGMA table_info(grades_courses)')}
+            if 'cells' not in columns:
+                connection.execute('ALTER TABLE grades_courses ADD COLUMN cells INTEGER')
+                connection.execute(
+                    'UPDATE grades_courses SET cells = (SELECT COUNT(*) FROM grades_cells '
+                    'WHERE grades_cells.course_key = grades_courses.course_key)'
+                )
+            # Bases anteriores con las listas en la información del curso: pasan a su columna
+            if 'roster' not in columns:
+                connection.execute('ALTER TABLE grades_courses ADD COLUMN roster TEXT')
+                moved = []
+                for course_key, info in connection.execute('SELECT course_key, info FROM grades_courses').fetchall():
+                    course_info = json.loads(info)
+                    moved.append((json.dumps(course_summary(course_info), ensure_ascii=False),
+                                  self._roster(course_info), course_key))
+                connection.executemany('UPDATE grades_courses SET info = ?, roster = ? WHERE course_key = ?', moved)
+            connection.execute('CREATE TABLE IF NOT EXISTS grades_metadata (key TEXT PRIMARY KEY, value TEXT)')
+            now = datetime.utcnow().isoformat()
+            connection.executemany(
+                'INSERT OR IGNORE INTO grades_metadata (key, value) VALUES (?, ?)',
+                [('created_at', now), ('last_updated', now)]
+            )
+
+    def load_manifest(self):
+        """
+        Carga la información y el resumen de la matriz de cada curso, sin leer celdas.
+
+        Returns:
+            dict: Datos con 'courses', 'matrices' y 'metadata'
+        """
+        data = empty_grades_data()
+        with self.database.reading(snapshot=True) as connection:
+            data['metadata'].update(connection.execute('SELECT key, value FROM grades_metadata').fetchall())
+            for course_key, info, rows, cols, density, cells in connection.execute(
+                'SELECT course_key, info, rows, cols, density, cells FROM grades_courses'
+            ):
+                data['courses'][course_key] = json.loads(info)
+                data['matrices'][course_key] = {'rows': rows, 'cols': cols, 'density': density, 'cells': cells}
+        return data
+
+    def load_matrix(self, course_key):
+        """
+        Carga la matriz de un curso (un rango de la clave primaria de las celdas).
+
+        Returns:
+            dict: 'matrix_data' (claves "fila,columna"), 'rows', 'cols', 'density',
+                'activities' y 'students'; None si el curso no existe
+        """
+        with self.database.reading(snapshot=True) as connection:
+            row = connection.execute(
+                'SELECT rows, cols, density, roster FROM grades_courses WHERE course_key = ?', (course_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            # Claves "fila,columna", la misma forma que los segmentos JSON
+            matrix_data = {
+                f"{cell_row},{cell_col}": value
+                for cell_row, cell_col, value in connection.execute(
+                    'SELECT row, col, value FROM grades_cells WHERE course_key = ?', (course_key,)
+                )
+            }
+        roster = json.loads(row[3]) if row[3] else {}
+        return {'matrix_data': matrix_data, 'rows': row[0], 'cols': row[1], 'density': row[2],
+                **{key: roster.get(key, []) for key in ROSTER_KEYS}}
+
+    def save_course(self, grades_data, course_key, matrix_info):
+        """Guarda (o reemplaza) un curso y sus celdas en una sola transacción"""
+        course_info = grades_data['courses'][course_key]
+        with self.database.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO grades_courses '
+                '(course_key, tutor_id, course_code, info, rows, cols, density, cells, roster) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (course_key, str(course_info['tutor_id']), course_info['course_code'],
+                 json.dumps(course_info, ensure_ascii=False), matrix_info['rows'], matrix_info['cols'],
+                 matrix_info.get('density'), len(matrix_info['matrix_data']), self._roster(matrix_info))
+            )
+            connection.execute('DELETE FROM grades_cells WHERE course_key = ?', (course_key,))
+            connection.executemany(
+                'INSERT INTO grades_cells (course_key, row, col, value) VALUES (?, ?, ?, ?)',
+                ((course_key, *self._cell(key), value) for key, value in matrix_info['matrix_data'].items())
+            )
+            self._touch(connection, grades_data)
+
+    def save_course_delta(self, grades_data, course_key, matrix_info, changes, added=None):
+        """
+        Guarda solo las celdas que cambiaron en un curso, en una sola transacción.
+
+        Args:
+            grades_data (dict): Manifiesto en memoria
+            course_key (str): Clave del curso
+            matrix_info (dict): Matriz completa ya actualizada
+            changes (dict): "fila,columna" -> nota nueva (None si la celda se borró)
+            added (dict): Actividades y estudiantes agregados; solo si hay alguno se
+                reescriben las listas
+        """
+        course_info = grades_data['courses'][course_key]
+        with self.database.transaction() as connection:
+            updated = connection.execute(
+                'UPDATE grades_courses SET info = ?, rows = ?, cols = ?, density = ?, cells = ? WHERE course_key = ?',
+                (json.dumps(course_info, ensure_ascii=False), matrix_info['rows'], matrix_info['cols'],
+                 matrix_info.get('density'), len(matrix_info['matrix_data']), course_key)
+            ).rowcount
+            if updated and added and any(added.get(f"{key}_added") for key in ROSTER_KEYS):
+                connection.execute(
+                    'UPDATE grades_courses SET roster = ? WHERE course_key = ?',
+                    (self._roster(matrix_info), course_key)
+                )
+            if not updated:
+                self.save_course(grades_data, course_key, matrix_info)
+                return
+            connection.executemany(
+                'INSERT OR REPLACE INTO grades_cells (course_key, row, col, value) VALUES (?, ?, ?, ?)',
+                ((course_key, *self._cell(key), value) for key, value in changes.items() if value is not None)
+            )
+            connection.executemany(
+                'DELETE FROM grades_cells WHERE course_key = ? AND row = ? AND col = ?',
+                ((course_key, *self._cell(key)) for key, value in changes.items() if value is None)
+            )
+            self._touch(connection, grades_data)
+
+    def delete_course(self, grades_data, course_key):
+        """Elimina un curso y sus celdas"""
+        with self.database.transaction() as connection:
+            connection.execute('DELETE FROM grades_courses WHERE course_key = ?', (course_key,))
+            connection.execute('DELETE FROM grades_cells WHERE course_key = ?', (course_key,))
+            self._touch(connection, grades_data)
+
+    @staticmethod
+    def _roster(data):
+        """Listas de actividades y estudiantes de un curso como JSON"""
+        return json.dumps({key: data.get(key, []) for key in ROSTER_KEYS}, ensure_ascii=False)
+
+    @staticmethod
+    def _cell(key):
+        """Posición (fila, columna) de una clave de celda en tupla o texto"""
+        if isinstance(key, tuple):
+            return key
+        row, col = key.split(',')
+        return int(row), int(col)
+
+    @staticmethod
+    def _touch(connection, grades_data):
+        """Guarda la fecha de última actualización"""
+        connection.execute(
+            "UPDATE grades_metadata SET value = ? WHERE key = 'last_updated'",
+            (grades_data['metadata']['last_updated'],)
+        )
+
+    def get_stats(self):
+        """Obtiene la configuración de la persistencia"""
+        return {'backend': self.name, 'path': self.database.path}
@@ -0,0 +1,121 @@
+import io
+import xml.etree.ElementTree as ET
+
+# Bytes leídos del archivo por bloque
+CHUNK_SIZE = 64 * 1024
+
+
+class RootedStream:
+    """
+    Flujo de lectura que envuelve un documento de notas en un elemento raíz.
+    El archivo de notas no tiene raíz (<curso> y <notas> son hermanos), así que se
+    entrega al parser la declaración XML original, luego <root>, el resto del
+    archivo tal como llega del flujo y al final </root>, sin copiarlo completo.
+    """
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        """
+        Args:
+            stream: Archivo o flujo binario con el documento
+            chunk_size (int): Bytes leídos del flujo por bloque
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.pending = self._head()
+        self.finished = False
+
+    def _head(self):
+        """Primer bloque: la declaración (si existe) seguida de la raíz sintética"""
+        head = self.stream.read(self.chunk_size)
+        stripped = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+        if stripped.startswith(b'<?xml'):
+            end = stripped.find(b'?>')
+            while end < 0:
+                chunk = self.stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                stripped += chunk
+                end = stripped.find(b'?>')
+            if end >= 0:
+                return stripped[:end + 2] + b'<root>' + stripped[end + 2:]
+        return b'<root>' + stripped
+
+    def read(self, size=-1):
+        """Lee hasta size bytes del documento envuelto"""
+        if size is None or size < 0:
+            size = self.chunk_size
+        while len(self.pending) < size and not self.finished:
+            chunk = self.stream.read(max(size, self.chunk_size))
+            if chunk:
+                self.pending += chunk
+            else:
+                self.pending += b'</root>'
+                self.finished = True
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+def iter_grades_xml(source):
+    """
+    Recorre un archivo de notas con iterparse sin cargarlo completo. Cada elemento
+    se libera en cuanto se procesa, de modo que la memoria no depende del tamaño
+    del archivo.
+
+    Formato esperado (sin elemento raíz):
+        <?xml version="1.0"?>
+        <curso codigo="XXXX">Nombre_del_curso</curso>
+        <notas>
+            <actividad nombre="Tarea1" carnet="XXXX">90</actividad>
+            ...
+        </notas>
+
+    Args:
+        source: Flujo binario, bytes o texto con el documento
+
+    Yields:
+        tuple: ('curso', código, nombre), ('actividad', nombre, carnet, nota) y al
+            final ('notas',) si el documento tenía el elemento <notas>
+
+    Raises:
+        ValueError: Si una actividad no tiene sus atributos o su nota no es válida
+        ET.ParseError: Si el documento no es XML válido
+    """
+    parser = None
+    if isinstance(source, str):
+        # El texto ya viene decodificado: la codificación declarada no aplica
+        source = io.BytesIO(source.encode('utf-8'))
+        parser = ET.XMLParser(encoding='utf-8')
+    elif isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    notas = None
+    course_seen = False
+    for event, element in ET.iterparse(RootedStream(source), events=('start', 'end'), parser=parser):
+        if event == 'start':
+            if element.tag == 'notas' and notas is None:
+                notas = element
+            continue
+
+        if element.tag == 'actividad' and notas is not None:
+            activity_name = element.get('nombre')
+            student_carnet = element.get('carnet')
+            grade_value = (element.text or '').strip()
+            if not activity_name or not student_carnet or not grade_value:
+                raise ValueError("Missing required attributes in 'actividad' element")
+            try:
+                grade = float(grade_value)
+            except ValueError:
+                raise ValueError(f"Invalid grade value: {grade_value}")
+            if grade < 0 or grade > 100:
+                raise ValueError(f"Invalid grade value: {grade_value}")
+            yield 'actividad', activity_name, student_carnet, grade
+            # Liberar la actividad y quitarla de <notas> para que no se acumulen
+            element.clear()
+            notas.clear()
+        elif element.tag == 'curso' and not course_seen:
+            course_seen = True
+            yield 'curso', element.get('codigo'), (element.text or '').strip()
+            element.clear()
+        elif element is notas:
+            yield ('notas',)
+            element.clear()
@@ -0,0 +1,161 @@
+import argparse
+import os
+import threading
+import time
+import bcrypt
+
+# Límites del costo de bcrypt aceptados por la política
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+DEFAULT_ROUNDS = 12
+
+
+def get_rounds(hashed):
+    """
+    Obtiene el costo (rounds) con que se generó un hash de bcrypt.
+
+    Args:
+        hashed (str): Hash con formato $2b$<rounds>$...
+
+    Returns:
+        int: Costo del hash o None si el formato no es válido
+    """
+    parts = hashed.split('$') if hashed else []
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def measure_ms(rounds, samples=3):
+    """Mide el tiempo mínimo (ms) de un hash de bcrypt con el costo dado"""
+    salt = bcrypt.gensalt(rounds)
+    best = None
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration-password', salt)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate(target_ms, min_rounds=MIN_ROUNDS, max_rounds=MAX_ROUNDS):
+    """
+    Elige el mayor costo cuyo tiempo de hash no supera target_ms en esta máquina.
+    Cada punto de costo duplica el tiempo, por lo que basta medir el mínimo y
+    extrapolar; el costo elegido se mide de nuevo para confirmarlo.
+
+    Args:
+        target_ms (float): Latencia objetivo de un hash
+        min_rounds (int): Costo mínimo aceptado aunque supere el objetivo
+        max_rounds (int): Costo máximo
+
+    Returns:
+        tuple: (costo elegido, tiempo medido en ms)
+    """
+    base_ms = measure_ms(min_rounds)
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+
+    measured = measure_ms(rounds, samples=1) if rounds != min_rounds else base_ms
+    while rounds > min_rounds and measured > target_ms:
+        rounds -= 1
+        measured /= 2
+    return rounds, measured
+
+
+class HashPolicy:
+    """
+    Política de costo de bcrypt para las contraseñas.
+    El costo puede fijarse o calibrarse contra una latencia objetivo; los hashes
+    con un costo menor al vigente se regeneran en el siguiente inicio de sesión.
+    """
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, target_ms=None, measured_ms=None):
+        """
+        Inicializa la política.
+
+        Args:
+            rounds (int): Costo de bcrypt vigente; None lo calibra contra target_ms
+                la primera vez que se necesita
+            target_ms (float): Latencia objetivo usada en la calibración, si la hubo
+            measured_ms (float): Tiempo medido de un hash con el costo vigente
+        """
+        if rounds is None and target_ms is None:
+            raise ValueError("Sin costo de bcrypt se requiere una latencia objetivo")
+        self.lock = threading.Lock()
+        self._rounds = None
+        if rounds is not None:
+            self.rounds = rounds
+        self.target_ms = target_ms
+        self.measured_ms = measured_ms
+
+    @property
+    def rounds(self):
+        """
+        Costo de bcrypt vigente. Una política pendiente de calibrar se calibra en
+        el primer uso, de modo que importar el módulo (por ejemplo en los procesos
+        del pool de hash) no mide nada.
+        """
+        if self._rounds is None:
+            with self.lock:
+                if self._rounds is None:
+                    rounds, measured_ms = calibrate(self.target_ms)
+                    self.measured_ms = round(measured_ms, 3)
+                    self._rounds = rounds
+        return self._rounds
+
+    @rounds.setter
+    def rounds(self, rounds):
+        if not MIN_ROUNDS <= rounds <= MAX_ROUNDS:
+            raise ValueError(f"El costo de bcrypt debe estar entre {MIN_ROUNDS} y {MAX_ROUNDS}")
+        self._rounds = rounds
+
+    @classmethod
+    def calibrated(cls, target_ms):
+        """Crea una política calibrada para la latencia objetivo en esta máquina"""
+        rounds, measured_ms = calibrate(target_ms)
+        return cls(rounds, target_ms=target_ms, measured_ms=round(measured_ms, 3))
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Crea la política según el entorno: BCRYPT_ROUNDS fija el costo y
+        BCRYPT_TARGET_MS lo calibra en el primer uso; sin ninguno se usa el costo
+        por defecto.
+        """
+        if os.environ.get('BCRYPT_ROUNDS'):
+            return cls(int(os.environ['BCRYPT_ROUNDS']))
+        if os.environ.get('BCRYPT_TARGET_MS'):
+            return cls(None, target_ms=float(os.environ['BCRYPT_TARGET_MS']))
+        return cls()
+
+    def gensalt(self):
+        """Genera una sal con el costo vigente"""
+        return bcrypt.gensalt(self.rounds)
+
+    def needs_rehash(self, hashed):
+        """Indica si un hash fue generado con un costo menor al vigente"""
+        rounds = get_rounds(hashed)
+        return rounds is not None and rounds < self.rounds
+
+    def get_stats(self):
+        """Obtiene la configuración de la política"""
+        return {
+            'rounds': self.rounds,
+            'target_ms': self.target_ms,
+            'measured_ms': self.measured_ms
+        }
+
+
+# Política global usada por el servicio de hash
+hash_policy = HashPolicy.from_environment()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibra el costo de bcrypt para una latencia objetivo')
+    parser.add_argument('--target-ms', type=float, default=250, help='Latencia objetivo de un hash en ms')
+    args = parser.parse_args()
+
+    rounds, measured_ms = calibrate(args.target_ms)
+    print(f"BCRYPT_ROUNDS={rounds}  # {measured_ms:.1f} ms por hash (objetivo {args.target_ms:.0f} ms)")
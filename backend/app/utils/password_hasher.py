@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import bcrypt
+from app.utils.hash_policy import hash_policy
+
+
+def _hash_one(password, rounds):
+    """Hashea una contraseña con bcrypt (se ejecuta en los procesos del pool)"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _init_worker(rounds):
+    """
+    Inicializa un proceso del pool con el costo ya calibrado por el proceso
+    principal, para que la política del proceso hijo nunca vuelva a calibrarse.
+    """
+    hash_policy.rounds = rounds
+
+
+class PasswordHasher:
+    """
+    Servicio de hash de contraseñas con bcrypt.
+    Las operaciones individuales se ejecutan de forma síncrona en el hilo que las
+    llama; los lotes se reparten en un pool acotado de procesos para usar todos
+    los núcleos en lugar de uno solo. El costo lo decide la política de hash.
+    """
+
+    def __init__(self, policy, max_workers=None, min_batch=2):
+        """
+        Inicializa el servicio.
+
+        Args:
+            policy (HashPolicy): Política de costo de bcrypt
+            max_workers (int): Procesos del pool; por defecto el número de núcleos
+            min_batch (int): Tamaño mínimo de lote para usar el pool
+        """
+        self.policy = policy
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.min_batch = min_batch
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def hash(self, password):
+        """Hashea una contraseña de forma síncrona"""
+        return _hash_one(password, self.policy.rounds)
+
+    def check(self, password, hashed):
+        """Verifica una contraseña contra su hash"""
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """Indica si un hash quedó por debajo del costo de la política vigente"""
+        return self.policy.needs_rehash(hashed)
+
+    def _get_executor(self):
+        """Crea el pool de procesos la primera vez que se necesita"""
+        with self.lock:
+            if self._executor is None:
+                # spawn evita heredar los hilos y locks del servidor en los procesos hijos
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.policy.rounds,)
+                )
+            return self._executor
+
+    def hash_many(self, passwords):
+        """
+        Hashea un lote de contraseñas enviándolas todas al pool a la vez.
+
+        Args:
+            passwords (list): Contraseñas en texto plano
+
+        Returns:
+            list: Hashes en el mismo orden que las contraseñas
+        """
+        passwords = list(passwords)
+        hash_one = partial(_hash_one, rounds=self.policy.rounds)
+        if self.max_workers < 2 or len(passwords) < self.min_batch:
+            return [hash_one(password) for password in passwords]
+        try:
+            executor = self._get_executor()
+            chunksize = max(1, len(passwords) // (self.max_workers * 4))
+            return list(executor.map(hash_one, passwords, chunksize=chunksize))
+        except Exception as e:
+            print(f"Error usando el pool de hash, se continúa en serie: {str(e)}")
+            self.shutdown()
+            return [hash_one(password) for password in passwords]
+
+    def shutdown(self):
+        """Detiene el pool de procesos"""
+        with self.lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def get_stats(self):
+        """Obtiene la configuración del pool"""
+        return {
+            'policy': self.policy.get_stats(),
+            'max_workers': self.max_workers,
+            'min_batch': self.min_batch,
+            'pool_started': self._executor is not None
+        }
+
+
+# Instancia global del servicio de hash
+password_hasher = PasswordHasher(hash_policy, int(os.environ.get('BCRYPT_WORKERS', 0)) or None)
@@ -0,0 +1,127 @@
+class Query:
+    """
+    Capa de consultas relacionales sobre los almacenamientos en memoria.
+    Cada fila es un diccionario alias -> registro; las consultas se componen con
+    filtros (where), joins por hash (join), proyecciones (select) y agrupaciones
+    (group_by), y se evalúan de forma perezosa en pasadas lineales.
+
+    Ejemplo:
+        Query.scan(assignments, 'assignment')
+            .join(Query.scan(courses, 'course'), 'assignment.course_code', 'course.codigo')
+            .select(code='course.codigo', name='course.nombre')
+    """
+
+    def __init__(self, rows, aliases):
+        """
+        Inicializa una consulta.
+
+        Args:
+            rows (iterable): Filas (dict alias -> registro)
+            aliases (tuple): Alias presentes en cada fila
+        """
+        self.rows = rows
+        self.aliases = tuple(aliases)
+
+    @classmethod
+    def scan(cls, source, alias):
+        """
+        Crea una consulta que recorre un almacén columnar o una lista de registros.
+
+        Args:
+            source (ColumnarStore/iterable): Origen de los registros
+            alias (str): Nombre con el que se referencian sus campos ('alias.campo')
+        """
+        records = source.iter_records() if hasattr(source, 'iter_records') else source
+        return cls(({alias: record} for record in records), (alias,))
+
+    @staticmethod
+    def _getter(spec):
+        """Convierte 'alias.campo' (o una función de la fila) en una función de acceso"""
+        if callable(spec):
+            return spec
+        alias, field = spec.split('.', 1)
+
+        def get(row):
+            record = row.get(alias)
+            return None if record is None else record.get(field)
+        return get
+
+    def where(self, predicate):
+        """
+        Filtra las filas.
+
+        Args:
+            predicate (callable): Función que recibe la fila y devuelve True para conservarla
+        """
+        return Query((row for row in self.rows if predicate(row)), self.aliases)
+
+    def join(self, other, left_key, right_key, how='inner'):
+        """
+        Combina con otra consulta mediante un hash join: se construye una tabla hash
+        con el lado derecho y se recorre el izquierdo una sola vez.
+
+        Args:
+            other (Query): Consulta del lado derecho (se materializa)
+            left_key (str/callable): Clave del lado izquierdo
+            right_key (str/callable): Clave del lado derecho
+            how (str): 'inner' o 'left' (conserva las filas izquierdas sin pareja)
+        """
+        if how not in ('inner', 'left'):
+            raise ValueError(f"Tipo de join no soportado: {how}")
+        left_get = self._getter(left_key)
+        right_get = self._getter(right_key)
+
+        table = {}
+        for row in other.rows:
+            key = right_get(row)
+            if key is not None:
+                table.setdefault(key, []).append(row)
+        empty = {alias: None for alias in other.aliases}
+
+        def rows():
+            for row in self.rows:
+                matches = table.get(left_get(row))
+                if matches:
+                    for match in matches:
+                        yield {**row, **match}
+                elif how == 'left':
+                    yield {**row, **empty}
+
+        return Query(rows(), self.aliases + other.aliases)
+
+    def select(self, **fields):
+        """
+        Proyecta cada fila a un diccionario plano.
+
+        Args:
+            **fields: Nombre de salida -> 'alias.campo' o función de la fila
+
+        Returns:
+            generator: Diccionarios con los campos proyectados
+        """
+        getters = [(name, self._getter(spec)) for name, spec in fields.items()]
+        return ({name: get(row) for name, get in getters} for row in self.rows)
+
+    def group_by(self, key, value=None):
+        """
+        Agrupa las filas por clave.
+
+        Args:
+            key (str/callable): Clave de agrupación
+            value (callable): Transformación de cada fila; por defecto la fila completa
+
+        Returns:
+            dict: Clave -> lista de valores, en el orden de las filas
+        """
+        key_get = self._getter(key)
+        groups = {}
+        for row in self.rows:
+            groups.setdefault(key_get(row), []).append(row if value is None else value(row))
+        return groups
+
+    def all(self):
+        """Materializa las filas en una lista"""
+        return list(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+
+
+class RecordCache:
+    """
+    Caché LRU acotada para registros ya decodificados de un almacenamiento.
+    Evita reconstruir y convertir los datos desde la matriz en cada lectura.
+    Un candado propio hace atómicas las operaciones sobre el OrderedDict: sin él,
+    move_to_end fallaría si otro hilo invalida la entrada entre la lectura y el
+    movimiento.
+    """
+
+    def __init__(self, max_size=10000):
+        """
+        Inicializa la caché.
+
+        Args:
+            max_size (int): Número máximo de registros residentes
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Obtiene un registro de la caché.
+
+        Args:
+            key: Identificador del registro
+
+        Returns:
+            dict: Registro decodificado o None si no está en caché
+        """
+        with self.lock:
+            record = self.entries.get(key)
+            if record is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return record
+
+    def peek(self, key):
+        """
+        Obtiene un registro sin contarlo como acierto o fallo ni moverlo en el LRU.
+
+        Args:
+            key: Identificador del registro
+
+        Returns:
+            dict: Registro decodificado o None si no está en caché
+        """
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key, record):
+        """
+        Almacena (o reemplaza) un registro en la caché.
+
+        Args:
+            key: Identificador del registro
+            record (dict): Registro decodificado
+        """
+        with self.lock:
+            if record is None:
+                self.entries.pop(key, None)
+                return
+            self.entries[key] = record
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Elimina un registro de la caché"""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """Vacía la caché"""
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        """
+        Obtiene estadísticas de uso de la caché.
+
+        Returns:
+            dict: Aciertos, fallos, tamaño y tasa de aciertos
+        """
+        with self.lock:
+            hits, misses, size = self.hits, self.misses, len(self.entries)
+        lookups = hits + misses
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': (hits / lookups) * 100 if lookups > 0 else 0
+        }
@@ -0,0 +1,307 @@
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+# Puntaje de cada tipo de coincidencia de un término con una palabra indexada
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+FUZZY_SCORE = 0.6
+
+# Máximo de palabras del vocabulario que se expanden por término (prefijos muy cortos)
+MAX_EXPANSIONS = 5000
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """
+    Divide un texto en palabras normalizadas (minúsculas, sin acentos).
+
+    Args:
+        text (str): Texto a dividir
+
+    Returns:
+        list: Palabras en el orden del texto
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _TOKEN.findall(text)
+
+
+def _grams(token):
+    """Trigramas de una palabra con marcas de inicio y fin"""
+    padded = f"^{token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_distance(token):
+    """Ediciones toleradas según la longitud del término (ninguna en códigos numéricos)"""
+    if len(token) < 3 or any(char.isdigit() for char in token):
+        return 0
+    return 1 if len(token) <= 5 else 2
+
+
+def bounded_levenshtein(a, b, limit):
+    """
+    Distancia de edición entre dos palabras, cortando en cuanto supera limit.
+
+    Returns:
+        int: Distancia, o limit + 1 si es mayor que limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class SearchIndex:
+    """
+    Índice de búsqueda por nombre sobre varios almacenes (índice invertido de palabras).
+    Cada palabra normalizada apunta a los documentos que la contienen; un vocabulario
+    ordenado resuelve prefijos con bisect y un índice de trigramas sobre el vocabulario
+    propone candidatos para la búsqueda tolerante a errores de tipeo. El índice se
+    mantiene al día con los eventos de cambio de los almacenes.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # tipo -> (almacén, campos indexados)
+        self.sources = {}
+        # entidad del bus de eventos -> tipo
+        self.entities = {}
+        # (tipo, id) -> (palabras, etiqueta)
+        self.documents = {}
+        self.postings = {}
+        self.vocabulary = []
+        self.grams = {}
+        self.queries = 0
+        # Durante una reconstrucción el vocabulario se ordena una sola vez al final
+        self._bulk = False
+        # Tipos cuyo almacén se reemplazó completo; se reconstruyen en la siguiente búsqueda
+        self.stale = set()
+
+    def add_source(self, kind, store, fields, entity=None):
+        """
+        Registra un almacén cuyos registros se indexan.
+
+        Args:
+            kind (str): Tipo de resultado ('student', 'tutor', 'course')
+            store (ColumnarStore/SqliteStore): Almacén de registros
+            fields (tuple): Campos de texto indexados
+            entity (str): Nombre del almacén en los eventos de cambio
+        """
+        self.sources[kind] = (store, tuple(fields))
+        if entity is not None:
+            self.entities[entity] = kind
+
+    def _add_token(self, token, key):
+        """Agrega un documento a la lista de una palabra"""
+        documents = self.postings.get(token)
+        if documents is None:
+            documents = self.postings[token] = set()
+            if self._bulk:
+                self.vocabulary.append(token)
+            else:
+                insort(self.vocabulary, token)
+            for gram in _grams(token):
+                self.grams.setdefault(gram, set()).add(token)
+        documents.add(key)
+
+    def _remove_token(self, token, key):
+        """Quita un documento de la lista de una palabra"""
+        documents = self.postings.get(token)
+        if documents is None:
+            return
+        documents.discard(key)
+        if not documents:
+            del self.postings[token]
+            del self.vocabulary[bisect_left(self.vocabulary, token)]
+            for gram in _grams(token):
+                tokens = self.grams.get(gram)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.grams[gram]
+
+    def index(self, kind, row_id, record):
+        """
+        Indexa (o reindexa) un registro.
+
+        Args:
+            kind (str): Tipo del registro
+            row_id (int): Id del registro
+            record (Record/dict): Registro con los campos indexados; None lo quita del índice
+        """
+        key = (kind, row_id)
+        with self.lock:
+            self.remove(kind, row_id)
+            if record is None:
+                return
+            values = [record.get(field) for field in self.sources[kind][1]]
+            label = ' '.join(str(value) for value in values if value)
+            tokens = tuple(dict.fromkeys(tokenize(label)))
+            if not tokens:
+                return
+            self.documents[key] = (tokens, label)
+            for token in tokens:
+                self._add_token(token, key)
+
+    def remove(self, kind, row_id):
+        """Quita un registro del índice"""
+        key = (kind, row_id)
+        with self.lock:
+            document = self.documents.pop(key, None)
+            if document is not None:
+                for token in document[0]:
+                    self._remove_token(token, key)
+
+    def rebuild(self, kind=None):
+        """
+        Reconstruye el índice completo (o el de un tipo) recorriendo los almacenes.
+
+        Args:
+            kind (str): Tipo a reconstruir; None reconstruye todos
+        """
+        with self.lock:
+            kinds = [kind] if kind is not None else list(self.sources)
+            self.stale.difference_update(kinds)
+            if kind is None:
+                self.documents, self.postings, self.vocabulary, self.grams = {}, {}, [], {}
+            else:
+                for key in [key for key in self.documents if key[0] == kind]:
+                    self.remove(*key)
+            self._bulk = True
+            try:
+                for name in kinds:
+                    store = self.sources[name][0]
+                    for row_id in list(store.ids()):
+                        self.index(name, row_id, store.get(row_id))
+            finally:
+                self._bulk = False
+                self.vocabulary.sort()
+
+    def handle_event(self, event):
+        """Aplica un evento de cambio de un almacén al índice"""
+        kind = self.entities.get(event.entity)
+        if kind is None:
+            return
+        if event.operation == 'reload':
+            with self.lock:
+                self.stale.add(kind)
+        elif event.operation == 'delete':
+            self.remove(kind, event.id)
+        else:
+            self.index(kind, event.id, self.sources[kind][0].get(event.id))
+
+    def attach(self, event_bus):
+        """
+        Suscribe el índice a los eventos de los almacenes registrados.
+
+        Returns:
+            int: Identificador de la suscripción
+        """
+        return event_bus.subscribe(self.handle_event, entities=list(self.entities))
+
+    def _matches(self, term):
+        """
+        Documentos que coinciden con un término, con el mejor puntaje de cada uno.
+
+        Returns:
+            dict: (tipo, id) -> puntaje
+        """
+        scores = {}
+
+        def add(token, score):
+            for key in self.postings.get(token, ()):
+                if scores.get(key, 0) < score:
+                    scores[key] = score
+
+        # Coincidencia exacta y por prefijo (rango contiguo del vocabulario ordenado)
+        position = bisect_left(self.vocabulary, term)
+        for token in self.vocabulary[position:position + MAX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            add(token, EXACT_SCORE if token == term else PREFIX_SCORE * len(term) / len(token))
+
+        # Tolerancia a errores: candidatos que comparten trigramas, verificados por distancia
+        limit = _max_distance(term)
+        if limit:
+            term_grams = _grams(term)
+            shared = {}
+            for gram in term_grams:
+                for token in self.grams.get(gram, ()):
+                    shared[token] = shared.get(token, 0) + 1
+            needed = max(1, len(term_grams) - 3 * limit)
+            for token, count in shared.items():
+                if count < needed or token.startswith(term):
+                    continue
+                distance = bounded_levenshtein(term, token, limit)
+                if distance <= limit:
+                    add(token, FUZZY_SCORE / (1 + distance))
+        return scores
+
+    def search(self, query, kinds=None, limit=10):
+        """
+        Busca registros cuyo texto contiene todas las palabras de la consulta, por
+        coincidencia exacta, por prefijo o con errores de tipeo.
+
+        Args:
+            query (str): Texto a buscar
+            kinds (iterable): Tipos a incluir; None incluye todos
+            limit (int): Máximo de resultados
+
+        Returns:
+            list: Diccionarios {'type', 'id', 'score', 'label'} ordenados por relevancia
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        kinds = set(kinds) if kinds is not None else None
+
+        with self.lock:
+            for kind in list(self.stale):
+                self.rebuild(kind)
+            self.queries += 1
+            per_term = sorted((self._matches(term) for term in terms), key=len)
+            candidates = per_term[0]
+            results = []
+            for key, score in candidates.items():
+                if kinds is not None and key[0] not in kinds:
+                    continue
+                total = score
+                for other in per_term[1:]:
+                    other_score = other.get(key)
+                    if other_score is None:
+                        break
+                    total += other_score
+                else:
+                    label = self.documents[key][1]
+                    results.append((total / len(terms), -len(label), -key[1], key, label))
+
+        best = heapq.nlargest(limit, results)
+        return [
+            {'type': key[0], 'id': key[1], 'score': round(score, 4), 'label': label}
+            for score, _, _, key, label in best
+        ]
+
+    def get_stats(self):
+        """Obtiene estadísticas del índice"""
+        return {
+            'documents': len(self.documents),
+            'tokens': len(self.postings),
+            'trigrams': len(self.grams),
+            'queries': self.queries,
+            'stale': sorted(self.stale),
+            'sources': {kind: list(fields) for kind, (_, fields) in self.sources.items()}
+        }
@@ -0,0 +1,114 @@
+import json
+from datetime import date, datetime
+from json.encoder import encode_basestring_ascii
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+from app.models.records import Record
+
+# Fragmentos '"campo":' precalculados por clase de registro (en orden alfabético,
+# igual que jsonify con sort_keys)
+_record_keys = {}
+
+
+def _keys_for(record_type):
+    """
+    Obtiene las tuplas (campo, fragmento JSON de la clave, es fecha) de una clase
+    de registro
+    """
+    keys = _record_keys.get(record_type)
+    if keys is None:
+        keys = [
+            (name, encode_basestring_ascii(name) + ':', name in record_type.timestamps)
+            for name in sorted(record_type.__slots__)
+        ]
+        _record_keys[record_type] = keys
+    return keys
+
+
+def _encode_timestamp(micros):
+    """Codifica una fecha guardada en microsegundos igual que jsonify codifica un datetime"""
+    return encode_basestring_ascii(http_date(micros // 1000000))
+
+
+def _encode_value(value):
+    """Codifica un valor escalar de un registro a JSON"""
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if isinstance(value, datetime):
+        return encode_basestring_ascii(http_date(value))
+    return dumps(value)
+
+
+def record_to_json(record):
+    """
+    Convierte un registro a JSON directamente desde sus slots, sin construir un dict.
+    Los campos sin valor se omiten.
+
+    Args:
+        record (Record): Registro a serializar
+
+    Returns:
+        str: Objeto JSON
+    """
+    parts = []
+    for name, key, timestamp in _keys_for(type(record)):
+        value = getattr(record, name)
+        if value is not None:
+            parts.append(key + (_encode_timestamp(value) if timestamp else _encode_value(value)))
+    return '{' + ','.join(parts) + '}'
+
+
+def dumps(payload):
+    """
+    Serializa una respuesta a JSON usando la ruta rápida para los registros.
+
+    Args:
+        payload: dict, list, Record o valor compatible con JSON
+
+    Returns:
+        str: Documento JSON
+    """
+    if isinstance(payload, Record):
+        return record_to_json(payload)
+    if isinstance(payload, dict):
+        parts = [
+            encode_basestring_ascii(str(key)) + ':' + dumps(value)
+            for key, value in sorted(payload.items(), key=lambda item: str(item[0]))
+        ]
+        return '{' + ','.join(parts) + '}'
+    if isinstance(payload, (list, tuple)):
+        return '[' + ','.join(map(dumps, payload)) + ']'
+    if isinstance(payload, (date, datetime)):
+        return encode_basestring_ascii(http_date(payload))
+    return json.dumps(payload)
+
+
+def json_response(payload, status=200):
+    """
+    Crea una respuesta JSON de Flask serializada con dumps().
+
+    Args:
+        payload: Contenido de la respuesta
+        status (int): Código de estado HTTP
+
+    Returns:
+        Response: Respuesta con mimetype application/json
+    """
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask que sabe serializar registros con jsonify()"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
@@ -0,0 +1,156 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+
+class SharedStorage:
+    """
+    Modo de almacenamiento compartido entre varios procesos (workers).
+    La instantánea y el log de escritura anticipada en disco son el conjunto de
+    datos común: un candado de archivo permite un solo escritor a la vez y cada
+    proceso, antes de atender una petición, aplica las entradas que los demás
+    agregaron al log desde la última vez. Si otro proceso compactó el log (archivo
+    nuevo), se recarga la instantánea y se reproduce el log nuevo completo.
+    """
+
+    def __init__(self, write_ahead_log, lock_path=None):
+        """
+        Inicializa el modo compartido.
+
+        Args:
+            write_ahead_log (WriteAheadLog): Log compartido (aún sin abrir)
+            lock_path (str): Archivo de candado; por defecto <log>.lock
+        """
+        self.wal = write_ahead_log
+        self.snapshot_manager = write_ahead_log.snapshot_manager
+        self.lock_path = lock_path or f"{write_ahead_log.path}.lock"
+        self.lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        # El candado de archivo no excluye a los hilos del mismo proceso
+        self.thread_lock = threading.RLock()
+        self.local = threading.local()
+
+        self.inode = None
+        self.offset = 0
+        self.entries_applied = 0
+        self.reloads = 0
+        self._compactor = None
+        self._stop_event = threading.Event()
+
+    @contextmanager
+    def _file_lock(self, mode):
+        """Toma el candado de archivo en modo compartido o exclusivo"""
+        with self.thread_lock:
+            depth = getattr(self.local, 'depth', 0)
+            if depth == 0:
+                fcntl.flock(self.lock_fd, mode)
+            self.local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self.local.depth -= 1
+                if self.local.depth == 0:
+                    fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def _log_identity(self):
+        """Inodo y tamaño actuales del archivo de log, o (None, 0) si no existe"""
+        try:
+            stat = os.stat(self.wal.path)
+        except FileNotFoundError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def _catch_up(self):
+        """Aplica las entradas nuevas del log (el candado ya debe estar tomado)"""
+        inode, size = self._log_identity()
+        if inode != self.inode:
+            # El log fue compactado por otro proceso: partir de la instantánea nueva
+            if self.inode is not None:
+                self.wal.reopen()
+                self.snapshot_manager.load()
+                self.reloads += 1
+            self.inode = inode
+            self.offset = 0
+        if size > self.offset:
+            applied, self.offset = self.wal.apply_tail(self.offset)
+            self.entries_applied += applied
+
+    def open(self):
+        """Carga la instantánea, reproduce el log y lo abre, todo bajo el candado exclusivo"""
+        with self._file_lock(fcntl.LOCK_EX):
+            self.snapshot_manager.warm_start()
+            self.wal.replay()
+            self.wal.open()
+            self.inode, self.offset = self._log_identity()
+
+    def refresh(self):
+        """Pone al día este proceso con las escrituras de los demás"""
+        inode, size = self._log_identity()
+        if inode == self.inode and size == self.offset:
+            return
+        with self._file_lock(fcntl.LOCK_SH):
+            self._catch_up()
+
+    @contextmanager
+    def write(self):
+        """
+        Bloque de escritura con el candado exclusivo: se aplican primero las
+        escrituras de otros procesos y, al salir, las propias quedan en el log
+        antes de liberar el candado.
+        """
+        with self._file_lock(fcntl.LOCK_EX):
+            self._catch_up()
+            try:
+                with self.wal.group():
+                    yield
+            finally:
+                self.wal.flush()
+                self.inode, self.offset = self._log_identity()
+
+    def checkpoint(self):
+        """Compacta el log compartido en una instantánea nueva bajo el candado exclusivo"""
+        with self.write():
+            snapshot = self.wal.checkpoint()
+        return snapshot
+
+    def start_compaction(self, max_bytes, check_interval=1.0):
+        """
+        Inicia un hilo que compacta el log compartido cuando supera max_bytes.
+
+        Args:
+            max_bytes (int): Tamaño del log que dispara la compactación
+            check_interval (float): Segundos entre revisiones del tamaño
+        """
+        if self._compactor is not None:
+            return
+
+        def run():
+            while not self._stop_event.wait(check_interval):
+                if self._log_identity()[1] >= max_bytes:
+                    try:
+                        self.checkpoint()
+                    except Exception as e:
+                        print(f"Error compactando el log compartido {self.wal.path}: {str(e)}")
+
+        self._compactor = threading.Thread(target=run, name='shared-wal-compactor', daemon=True)
+        self._compactor.start()
+
+    def close(self):
+        """Detiene la compactación, cierra el log y libera el candado"""
+        self._stop_event.set()
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        with self._file_lock(fcntl.LOCK_EX):
+            self.wal.close()
+        os.close(self.lock_fd)
+
+    def get_stats(self):
+        """Obtiene el estado de la réplica local"""
+        return {
+            'pid': os.getpid(),
+            'lock_path': self.lock_path,
+            'log_offset': self.offset,
+            'entries_applied': self.entries_applied,
+            'snapshot_reloads': self.reloads
+        }
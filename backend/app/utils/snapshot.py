@@ -0,0 +1,269 @@
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+
+# Cabecera del archivo: firma, versión del formato, orden de bytes y número de almacenes
+SNAPSHOT_MAGIC = b'IPC2SNAP'
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct('<8sHBI')
+_UINT = struct.Struct('<Q')
+_LENGTH = struct.Struct('<I')
+_BYTEORDERS = ('little', 'big')
+
+
+class SnapshotWriter:
+    """Escritor binario en memoria para el contenido de una instantánea"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write_uint(self, value):
+        """Escribe un entero sin signo de 64 bits"""
+        self.buffer += _UINT.pack(value)
+
+    def write_str(self, value):
+        """Escribe una cadena UTF-8 precedida por su longitud"""
+        data = value.encode('utf-8')
+        self.buffer += _LENGTH.pack(len(data))
+        self.buffer += data
+
+    def write_array(self, values):
+        """Escribe un array tipado como bloque de bytes en el orden nativo"""
+        data = values.tobytes()
+        self.buffer += _UINT.pack(len(data))
+        self.buffer += data
+
+    def write_strings(self, values):
+        """Escribe una lista de cadenas: longitudes en caracteres y un único bloque UTF-8"""
+        self.write_array(array('I', map(len, values)))
+        data = ''.join(values).encode('utf-8', 'surrogatepass')
+        self.buffer += _UINT.pack(len(data))
+        self.buffer += data
+
+
+class SnapshotReader:
+    """Lector binario sobre el contenido completo de una instantánea"""
+
+    def __init__(self, data, byteorder):
+        self.data = memoryview(data)
+        self.offset = 0
+        self.swap = byteorder != sys.byteorder
+
+    def _take(self, size):
+        """Obtiene los siguientes size bytes"""
+        end = self.offset + size
+        if end > len(self.data):
+            raise ValueError("Instantánea truncada")
+        chunk = self.data[self.offset:end]
+        self.offset = end
+        return chunk
+
+    def read_uint(self):
+        """Lee un entero sin signo de 64 bits"""
+        return _UINT.unpack(self._take(_UINT.size))[0]
+
+    def read_str(self):
+        """Lee una cadena UTF-8 precedida por su longitud"""
+        size = _LENGTH.unpack(self._take(_LENGTH.size))[0]
+        return str(self._take(size), 'utf-8')
+
+    def read_array(self, typecode):
+        """Lee un array tipado, corrigiendo el orden de bytes si es necesario"""
+        values = array(typecode)
+        values.frombytes(self._take(self.read_uint()))
+        if self.swap:
+            values.byteswap()
+        return values
+
+    def read_strings(self):
+        """Lee una lista de cadenas escrita con write_strings()"""
+        lengths = self.read_array('I')
+        text = str(self._take(self.read_uint()), 'utf-8', 'surrogatepass')
+        values = []
+        position = 0
+        for length in lengths:
+            values.append(text[position:position + length])
+            position += length
+        return values
+
+
+class SnapshotManager:
+    """
+    Persistencia de los almacenes columnares en un archivo binario versionado.
+    La instantánea se escribe de forma atómica (archivo temporal + rename) y se
+    carga en bloque al iniciar, sin recalcular hashes ni reconstruir registros.
+    """
+
+    def __init__(self, stores, path):
+        """
+        Inicializa el administrador de instantáneas.
+
+        Args:
+            stores (dict): Almacenes columnares por nombre
+            path (str): Ruta del archivo de instantánea
+        """
+        self.stores = stores
+        self.path = path
+        self.lock = threading.Lock()
+        self.last_snapshot = None
+        self._stop_event = None
+        self._thread = None
+
+    def save(self):
+        """
+        Escribe una instantánea de todos los almacenes.
+
+        Returns:
+            dict: Información de la instantánea escrita
+        """
+        with self.lock:
+            started = time.perf_counter()
+            writer = SnapshotWriter()
+            writer.buffer += _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                          _BYTEORDERS.index(sys.byteorder), len(self.stores))
+            records = {}
+            for name, store in self.stores.items():
+                writer.write_str(name)
+                store.write_snapshot(writer)
+                records[name] = store.count
+            writer.buffer += _LENGTH.pack(zlib.crc32(writer.buffer))
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(writer.buffer)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self._fsync_directory(directory)
+
+            self.last_snapshot = {
+                'path': self.path,
+                'bytes': len(writer.buffer),
+                'records': records,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'created_at': datetime.utcnow()
+            }
+            return self.last_snapshot
+
+    def load(self):
+        """
+        Carga la instantánea en los almacenes. Todos los almacenes se leen y
+        validan antes de reemplazar cualquier contenido.
+
+        Returns:
+            dict: Información de la carga o None si no existe el archivo
+
+        Raises:
+            ValueError: Si el archivo está dañado o no es compatible
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with self.lock:
+            started = time.perf_counter()
+            with open(self.path, 'rb') as f:
+                data = f.read()
+
+            if len(data) < _HEADER.size + _LENGTH.size:
+                raise ValueError("Instantánea truncada")
+            payload = memoryview(data)[:-_LENGTH.size]
+            if zlib.crc32(payload) != _LENGTH.unpack(data[-_LENGTH.size:])[0]:
+                raise ValueError("La suma de verificación de la instantánea no coincide")
+
+            magic, version, byteorder, store_count = _HEADER.unpack(payload[:_HEADER.size])
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError("El archivo no es una instantánea de almacenamiento")
+            if version != SNAPSHOT_VERSION:
+                raise ValueError(f"Versión de instantánea no soportada: {version}")
+
+            reader = SnapshotReader(payload, _BYTEORDERS[byteorder])
+            reader.offset = _HEADER.size
+            states = {}
+            for _ in range(store_count):
+                name = reader.read_str()
+                if name not in self.stores:
+                    raise ValueError(f"Almacén desconocido en la instantánea: {name}")
+                states[name] = self.stores[name].read_snapshot(reader)
+
+            records = {}
+            for name, state in states.items():
+                self.stores[name].restore(state)
+                records[name] = self.stores[name].count
+
+            return {
+                'path': self.path,
+                'bytes': len(data),
+                'records': records,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3)
+            }
+
+    def warm_start(self):
+        """
+        Carga la instantánea al iniciar si existe; un archivo inválido se ignora
+        y los almacenes quedan vacíos.
+
+        Returns:
+            dict: Información de la carga o None
+        """
+        try:
+            return self.load()
+        except Exception as e:
+            print(f"Error cargando instantánea {self.path}: {str(e)}")
+            return None
+
+    def start_periodic(self, interval_seconds):
+        """
+        Inicia un hilo que escribe una instantánea cada interval_seconds.
+
+        Args:
+            interval_seconds (float): Intervalo entre instantáneas
+        """
+        if self._thread is not None:
+            return
+        self._stop_event = threading.Event()
+
+        def run():
+            while not self._stop_event.wait(interval_seconds):
+                try:
+                    self.save()
+                except Exception as e:
+                    print(f"Error escribiendo instantánea {self.path}: {str(e)}")
+
+        self._thread = threading.Thread(target=run, name='snapshot-writer', daemon=True)
+        self._thread.start()
+
+    def stop_periodic(self):
+        """Detiene el hilo de instantáneas periódicas"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self._stop_event = None
+
+    def get_status(self):
+        """Obtiene la ruta, la última instantánea escrita y si hay escritura periódica"""
+        return {
+            'path': self.path,
+            'exists': os.path.exists(self.path),
+            'periodic': self._thread is not None,
+            'last_snapshot': self.last_snapshot
+        }
+
+    @staticmethod
+    def _fsync_directory(directory):
+        """Sincroniza el directorio para que el rename sea durable"""
+        if os.name != 'posix':
+            return
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
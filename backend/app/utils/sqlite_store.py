@@ -0,0 +1,696 @@
+import secrets
+import sqlite3
+import threading
+from contextlib import contextmanager
+from app.utils.columnar_store import COLUMN_TYPECODES, to_epoch_micros, from_epoch_micros, timestamp_columns
+from app.utils.record_cache import RecordCache
+
+# Tipo SQLite de cada tipo de columna (los timestamps se guardan en microsegundos desde la época)
+SQL_TYPES = {
+    'int': 'INTEGER',
+    'bool': 'INTEGER',
+    'timestamp': 'INTEGER',
+    'str': 'TEXT'
+}
+
+# Filas leídas por consulta al iterar un almacén completo
+ITER_BATCH_SIZE = 256
+
+
+class SqliteDatabase:
+    """
+    Base de datos SQLite local compartida por los almacenes de un proceso.
+    Las escrituras usan una sola conexión protegida por un candado y se agrupan en
+    transacciones anidables (las internas son savepoints). Las lecturas usan un
+    grupo de conexiones propias y no esperan al escritor: el modo WAL de SQLite les
+    da la última versión confirmada mientras otro hilo o proceso escribe.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        """
+        Abre (o crea) la base de datos.
+
+        Args:
+            path (str): Archivo de la base de datos
+            timeout (float): Segundos de espera si otro proceso tiene el candado de escritura
+        """
+        self.path = path
+        self.timeout = timeout
+        self.connection = self._connect()
+        self.lock = threading.RLock()
+        self.depth = 0
+        # Hilo con la transacción abierta: sus lecturas deben ver sus propios cambios
+        self.owner = None
+        # Contador impar mientras hay una transacción abierta (ver begin_read/may_cache)
+        self.generation = 0
+        # Conexiones de lectura libres
+        self.readers = []
+        self.readers_lock = threading.Lock()
+        self.stores = {}
+        self.commits = 0
+        self.rollbacks = 0
+
+        with self.lock:
+            self.connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS _stores ('
+                'name TEXT PRIMARY KEY, epoch TEXT NOT NULL, version INTEGER NOT NULL, next_id INTEGER NOT NULL)'
+            )
+            self.data_version = self._data_version()
+
+    def _connect(self):
+        """Abre una conexión en modo autocommit (las transacciones se controlan a mano)"""
+        return sqlite3.connect(
+            self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False, cached_statements=256
+        )
+
+    @contextmanager
+    def reading(self, snapshot=False):
+        """
+        Conexión para una lectura. El hilo que tiene abierta una transacción lee por
+        la conexión de escritura (y ve sus propios cambios); los demás toman una
+        conexión de lectura del grupo sin esperar al candado de escritura.
+
+        Args:
+            snapshot (bool): Abrir una transacción de lectura para que varias
+                consultas vean la misma versión confirmada
+        """
+        if self.owner == threading.get_ident():
+            yield self.connection
+            return
+        with self.readers_lock:
+            connection = self.readers.pop() if self.readers else None
+        if connection is None:
+            connection = self._connect()
+        try:
+            if snapshot:
+                connection.execute('BEGIN')
+                try:
+                    yield connection
+                finally:
+                    connection.execute('COMMIT')
+            else:
+                yield connection
+        finally:
+            with self.readers_lock:
+                self.readers.append(connection)
+
+    def begin_read(self):
+        """Marca el inicio de una lectura que se quiere guardar en una caché"""
+        return self.generation
+
+    def may_cache(self, generation):
+        """
+        Indica si lo leído desde begin_read puede guardarse en una caché: ninguna
+        transacción estaba abierta ni se confirmó ni se recargó nada entretanto, así
+        que ninguna invalidación pudo adelantarse a la lectura.
+        """
+        return generation % 2 == 0 and self.generation == generation
+
+    def _data_version(self):
+        """Contador de SQLite que cambia cuando otra conexión confirma cambios"""
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    @contextmanager
+    def transaction(self):
+        """
+        Agrupa las escrituras en una transacción. Los bloques anidados usan savepoints:
+        un error dentro de uno deshace solo ese bloque; la confirmación ocurre al salir
+        del bloque exterior.
+        """
+        with self.lock:
+            depth = self.depth
+            savepoint = f"sp_{depth}"
+            if depth == 0:
+                self.connection.execute('BEGIN IMMEDIATE')
+                self.owner = threading.get_ident()
+                self.generation += 1
+            else:
+                self.connection.execute(f'SAVEPOINT {savepoint}')
+            self.depth += 1
+            try:
+                yield self.connection
+            except BaseException:
+                self.depth -= 1
+                if depth == 0:
+                    try:
+                        self.connection.execute('ROLLBACK')
+                        self.rollbacks += 1
+                        # Lo ya aplicado en memoria (cachés, versiones) puede no estar en disco
+                        for store in self.stores.values():
+                            store.reload()
+                    finally:
+                        self.owner = None
+                        self.generation += 1
+                else:
+                    self.connection.execute(f'ROLLBACK TO {savepoint}')
+                    self.connection.execute(f'RELEASE {savepoint}')
+                raise
+            self.depth -= 1
+            if depth == 0:
+                try:
+                    self.connection.execute('COMMIT')
+                    self.commits += 1
+                finally:
+                    self.owner = None
+                    self.generation += 1
+            else:
+                self.connection.execute(f'RELEASE {savepoint}')
+
+    def refresh(self):
+        """
+        Descarta las cachés de los almacenes si otro proceso modificó la base de datos
+        desde la última comprobación. Si un hilo de este proceso está escribiendo no
+        se espera: la comprobación queda para la siguiente llamada.
+
+        Returns:
+            bool: True si hubo cambios externos
+        """
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            data_version = self._data_version()
+            if data_version == self.data_version:
+                return False
+            self.data_version = data_version
+            # Las lecturas en curso no deben guardar en caché lo leído antes del cambio
+            self.generation += 2
+            for store in self.stores.values():
+                store.reload()
+                # Lo derivado de los registros (índices de búsqueda, cachés) debe reconstruirse
+                store._publish(None, 'reload')
+            return True
+        finally:
+            self.lock.release()
+
+    def vacuum(self):
+        """
+        Devuelve al sistema de archivos las páginas libres de la base de datos.
+
+        Returns:
+            int: Páginas liberadas
+        """
+        with self.lock:
+            before = self.connection.execute('PRAGMA freelist_count').fetchone()[0]
+            self.connection.execute('PRAGMA incremental_vacuum')
+            after = self.connection.execute('PRAGMA freelist_count').fetchone()[0]
+            return before - after
+
+    def close(self):
+        """Cierra las conexiones"""
+        with self.lock:
+            with self.readers_lock:
+                for connection in self.readers:
+                    connection.close()
+                self.readers = []
+            self.connection.close()
+
+    def get_stats(self):
+        """Obtiene estadísticas de la base de datos"""
+        with self.reading() as connection:
+            page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+            page_size = connection.execute('PRAGMA page_size').fetchone()[0]
+        return {
+            'path': self.path,
+            'size_bytes': page_count * page_size,
+            'commits': self.commits,
+            'rollbacks': self.rollbacks,
+            'tables': sorted(self.stores)
+        }
+
+
+class SqliteStore:
+    """
+    Almacén de registros en una tabla SQLite con la misma interfaz que ColumnarStore.
+    Cada columna del esquema es una columna de la tabla, el id externo es la clave
+    primaria y las columnas únicas o de búsqueda tienen índice. Los registros
+    decodificados se guardan en la misma caché LRU que usa el almacén en memoria.
+    """
+
+    def __init__(self, database, table, schema, record_type=None, cache_size=10000, unique=(), indexes=(),
+                 ordered=()):
+        """
+        Inicializa el almacén y crea su tabla e índices si no existen.
+
+        Args:
+            database (SqliteDatabase): Base de datos compartida
+            table (str): Nombre de la tabla
+            schema (list): Lista de tuplas (nombre_columna, tipo) como en ColumnarStore
+            record_type (type): Clase de registro con __slots__ en el orden del esquema
+            cache_size (int): Tamaño máximo de la caché de registros decodificados
+            unique (tuple): Columnas de valor único
+            indexes (tuple): Otras columnas por las que se busca con find()
+            ordered (tuple): Columnas int/timestamp consultadas por rango con find_range()
+        """
+        for name, column_type in schema:
+            if column_type not in COLUMN_TYPECODES:
+                raise ValueError(f"Tipo de columna no soportado para {name}: {column_type}")
+        self.schema = dict(schema)
+        if record_type is not None and tuple(self.schema) != tuple(record_type.__slots__):
+            raise ValueError(f"Los campos de {record_type.__name__} no coinciden con el esquema")
+        if record_type is not None and set(record_type.timestamps) != timestamp_columns(self.schema):
+            raise ValueError(f"Los campos de fecha de {record_type.__name__} no coinciden con el esquema")
+        for name in ordered:
+            if self.schema.get(name) not in ('int', 'timestamp'):
+                raise ValueError(f"Columna ordenada desconocida o no numérica: {name}")
+        for name in tuple(unique) + tuple(indexes):
+            if name not in self.schema:
+                raise ValueError(f"Columna indexada desconocida: {name}")
+
+        self.database = database
+        self.table = table
+        self.record_type = record_type
+        self.unique = tuple(unique)
+        self.indexes = tuple(dict.fromkeys(tuple(unique) + tuple(indexes) + tuple(ordered)))
+        self.ordered = tuple(ordered)
+        self.cache = RecordCache(cache_size)
+        self.events = None
+        self.entity = None
+
+        columns = ', '.join(f'"{name}"' for name in self.schema)
+        placeholders = ', '.join('?' for _ in self.schema)
+        updates = ', '.join(f'"{name}" = excluded."{name}"' for name in self.schema)
+        # Sentencias fijas: sqlite3 conserva compiladas las sentencias por su texto
+        self.sql = {
+            'select': f'SELECT {columns} FROM "{table}" WHERE id = ?',
+            'scan': f'SELECT id, {columns} FROM "{table}" WHERE id > ? ORDER BY id LIMIT ?',
+            'insert': f'INSERT INTO "{table}" (id, _version, {columns}) VALUES (?, ?, {placeholders})',
+            # Reemplaza solo por id: un valor único repetido es un error, no borra la otra fila
+            'upsert': f'INSERT INTO "{table}" (id, _version, {columns}) VALUES (?, ?, {placeholders}) '
+                      f'ON CONFLICT (id) DO UPDATE SET _version = excluded._version, {updates}',
+            'delete': f'DELETE FROM "{table}" WHERE id = ?',
+            'exists': f'SELECT 1 FROM "{table}" WHERE id = ?',
+            'version': f'SELECT _version FROM "{table}" WHERE id = ?',
+            'ids': f'SELECT id FROM "{table}" ORDER BY id',
+            'count': f'SELECT COUNT(*) FROM "{table}"',
+            'bump': 'UPDATE _stores SET version = version + 1, next_id = MAX(next_id, ?) WHERE name = ? RETURNING version',
+            'allocate': 'UPDATE _stores SET next_id = next_id + ? WHERE name = ? RETURNING next_id',
+            'meta': 'SELECT epoch, version, next_id FROM _stores WHERE name = ?'
+        }
+
+        with database.transaction() as connection:
+            column_defs = ', '.join(f'"{name}" {SQL_TYPES[column_type]}' for name, column_type in self.schema.items())
+            connection.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" (id INTEGER PRIMARY KEY, _version INTEGER NOT NULL, {column_defs})'
+            )
+            for name in self.indexes:
+                if name in self.unique:
+                    # La base de datos garantiza la unicidad también entre procesos; el
+                    # índice simple de versiones anteriores se sustituye
+                    connection.execute(f'DROP INDEX IF EXISTS "{table}_{name}"')
+                    connection.execute(
+                        f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_{name}_unique" ON "{table}" ("{name}")'
+                    )
+                else:
+                    connection.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{name}" ON "{table}" ("{name}")')
+            connection.execute(
+                'INSERT OR IGNORE INTO _stores (name, epoch, version, next_id) VALUES (?, ?, 0, 1)',
+                (table, secrets.token_hex(4))
+            )
+        database.stores[table] = self
+        self.reload()
+
+    def reload(self):
+        """Vuelve a leer la versión del almacén y descarta la caché (cambios de otro proceso o rollback)"""
+        with self.database.lock:
+            self.epoch, self.version, self.next_id = self.database.connection.execute(
+                self.sql['meta'], (self.table,)
+            ).fetchone()
+        self.cache.clear()
+
+    @property
+    def count(self):
+        """Número de registros"""
+        with self.database.reading() as connection:
+            return connection.execute(self.sql['count']).fetchone()[0]
+
+    def _encode(self, name, value):
+        """Convierte un valor de Python a su representación en la tabla"""
+        if value is None:
+            return None
+        column_type = self.schema[name]
+        if column_type == 'str':
+            return str(value)
+        if column_type == 'bool':
+            return 1 if value else 0
+        if column_type == 'timestamp':
+            return to_epoch_micros(value)
+        return int(value)
+
+    def _decode(self, name, raw, materialize=True):
+        """
+        Convierte un valor de la tabla de vuelta a su tipo de Python (con materialize=False
+        los timestamps quedan en microsegundos, como en los registros tipados)
+        """
+        if raw is None:
+            return None
+        column_type = self.schema[name]
+        if column_type == 'bool':
+            return bool(raw)
+        if column_type == 'timestamp' and materialize:
+            return from_epoch_micros(raw)
+        return raw
+
+    def _build(self, row):
+        """Construye un registro a partir de los valores de una fila"""
+        if self.record_type is not None:
+            return self.record_type(*[self._decode(name, raw, False) for name, raw in zip(self.schema, row)])
+        values = [self._decode(name, raw) for name, raw in zip(self.schema, row)]
+        return {name: value for name, value in zip(self.schema, values) if value is not None}
+
+    def _bump_version(self, connection, min_next_id=0):
+        """Incrementa la versión del almacén dentro de la transacción en curso"""
+        self.version = connection.execute(self.sql['bump'], (min_next_id, self.table)).fetchone()[0]
+        self.next_id = max(self.next_id, min_next_id)
+        return self.version
+
+    def _publish(self, row_id, operation):
+        """Publica un cambio en el bus de eventos, si hay uno conectado"""
+        if self.events is not None:
+            self.events.publish(self.entity, row_id, operation)
+
+    def attach_events(self, event_bus, entity=None):
+        """
+        Conecta (o desconecta con None) un bus de eventos de cambio.
+
+        Args:
+            event_bus (EventBus): Bus que recibe publish(entidad, id, operación)
+            entity (str): Nombre de la entidad en los eventos
+        """
+        self.events = event_bus
+        self.entity = entity
+
+    def record_version(self, row_id):
+        """
+        Obtiene la versión de la última escritura de un registro.
+
+        Returns:
+            int: Versión del registro o None si no existe
+        """
+        with self.database.reading() as connection:
+            row = connection.execute(self.sql['version'], (row_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def etag(self, row_id=None):
+        """
+        Obtiene una etiqueta de versión del almacén completo o de un registro.
+
+        Returns:
+            str: Etiqueta '<época>.<versión>' o '<época>.<id>.<versión>'; None si el
+                registro no existe
+        """
+        if row_id is None:
+            return f"{self.epoch}.{self.version}"
+        version = self.record_version(row_id)
+        return None if version is None else f"{self.epoch}.{row_id}.{version}"
+
+    def allocate_id(self):
+        """
+        Reserva el siguiente id de registro (atómico entre procesos).
+
+        Returns:
+            int: Id asignado
+        """
+        return self.allocate_ids(1)[0]
+
+    def allocate_ids(self, count):
+        """
+        Reserva un bloque de ids consecutivos.
+
+        Args:
+            count (int): Número de ids
+
+        Returns:
+            range: Ids asignados
+        """
+        with self.database.transaction() as connection:
+            self.next_id = connection.execute(self.sql['allocate'], (count, self.table)).fetchone()[0]
+        return range(self.next_id - count, self.next_id)
+
+    def lock_key(self, *key):
+        """
+        Bloque que serializa las operaciones sobre una clave. SQLite admite un solo
+        escritor, así que es una transacción: la comprobación y el alta de un valor
+        único quedan atómicas también entre procesos.
+        """
+        return self.database.transaction()
+
+    def lock_keys(self, keys):
+        """Bloque para varias claves (una sola transacción)"""
+        return self.database.transaction()
+
+    def exists(self, row_id):
+        """Indica si existe un registro con el id dado"""
+        with self.database.reading() as connection:
+            return connection.execute(self.sql['exists'], (row_id,)).fetchone() is not None
+
+    def insert(self, row_id, record):
+        """
+        Inserta (o reemplaza) un registro completo con el id dado.
+
+        Args:
+            row_id (int): Id del registro
+            record (dict): Valores por nombre de columna; las columnas ausentes quedan vacías
+        """
+        values = [self._encode(name, record.get(name)) for name in self.schema]
+        with self.database.transaction() as connection:
+            version = self._bump_version(connection, row_id + 1)
+            connection.execute(self.sql['upsert'], (row_id, version, *values))
+            self.cache.invalidate(row_id)
+        self._publish(row_id, 'insert')
+
+    def bulk_insert(self, row_ids, records):
+        """
+        Inserta un bloque de registros nuevos en una sola transacción. Si algún id
+        ya existe la clave primaria rechaza el bloque completo.
+
+        Args:
+            row_ids (range): Ids nuevos en orden ascendente (ver allocate_ids)
+            records (list): Valores por nombre de columna de cada registro
+        """
+        if len(row_ids) != len(records):
+            raise ValueError("El número de ids no coincide con el número de registros")
+        if not records:
+            return
+        rows = [[self._encode(name, record.get(name)) for name in self.schema] for record in records]
+        with self.database.transaction() as connection:
+            version = self._bump_version(connection, row_ids[-1] + 1)
+            connection.executemany(
+                self.sql['insert'], ((row_id, version, *values) for row_id, values in zip(row_ids, rows))
+            )
+        for row_id in row_ids:
+            self._publish(row_id, 'insert')
+
+    def update(self, row_id, changes):
+        """
+        Actualiza columnas de un registro existente. Los valores None se ignoran.
+
+        Returns:
+            bool: True si el registro existía
+        """
+        changed = [name for name, value in changes.items() if name in self.schema and value is not None]
+        with self.database.transaction() as connection:
+            if connection.execute(self.sql['exists'], (row_id,)).fetchone() is None:
+                return False
+            if not changed:
+                return True
+            assignments = ', '.join(f'"{name}" = ?' for name in changed)
+            encoded = {name: self._encode(name, changes[name]) for name in changed}
+            version = self._bump_version(connection)
+            connection.execute(
+                f'UPDATE "{self.table}" SET _version = ?, {assignments} WHERE id = ?',
+                (version, *encoded.values(), row_id)
+            )
+            self.cache.invalidate(row_id)
+        self._publish(row_id, 'update')
+        return True
+
+    def delete(self, row_id):
+        """
+        Elimina un registro.
+
+        Returns:
+            bool: True si el registro existía
+        """
+        with self.database.transaction() as connection:
+            if connection.execute(self.sql['delete'], (row_id,)).rowcount == 0:
+                return False
+            self._bump_version(connection)
+            self.cache.invalidate(row_id)
+        self._publish(row_id, 'delete')
+        return True
+
+    def get(self, row_id):
+        """
+        Obtiene un registro decodificado.
+
+        Returns:
+            Record/dict: Instancia de record_type (compartida con la caché) o dict; None si no existe
+        """
+        cached = self.cache.get(row_id)
+        if cached is not None:
+            return cached if self.record_type is not None else dict(cached)
+        # Una escritura que se cruce con la lectura invalidaría antes de que el registro
+        # anterior llegue a la caché: en ese caso no se guarda
+        generation = self.database.begin_read()
+        with self.database.reading() as connection:
+            row = connection.execute(self.sql['select'], (row_id,)).fetchone()
+        if row is None:
+            return None
+        record = self._build(row)
+        if self.database.may_cache(generation):
+            self.cache.put(row_id, record)
+        return record if self.record_type is not None else dict(record)
+
+    def ids(self):
+        """Itera los ids de los registros en orden ascendente"""
+        with self.database.reading() as connection:
+            return iter([row[0] for row in connection.execute(self.sql['ids'])])
+
+    def get_all(self):
+        """Obtiene todos los registros"""
+        return list(self.iter_records())
+
+    def iter_records(self, after_id=0):
+        """
+        Itera los registros en orden de id leyendo la tabla por bloques (keyset).
+
+        Args:
+            after_id (int): Solo se devuelven registros con id mayor a este
+        """
+        last_id = after_id
+        while True:
+            with self.database.reading() as connection:
+                rows = connection.execute(self.sql['scan'], (last_id, ITER_BATCH_SIZE)).fetchall()
+            for row in rows:
+                yield self._build(row[1:])
+            if len(rows) < ITER_BATCH_SIZE:
+                return
+            last_id = rows[-1][0]
+
+    def page(self, after_id=0, limit=None):
+        """
+        Obtiene una página de registros usando paginación por cursor (keyset).
+
+        Returns:
+            tuple: (lista de registros, cursor siguiente o None si no hay más)
+        """
+        with self.database.reading() as connection:
+            rows = connection.execute(
+                self.sql['scan'], (after_id, -1 if limit is None else limit + 1)
+            ).fetchall()
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit] if has_more else rows
+        records = [self._build(row[1:]) for row in rows]
+        return records, (rows[-1][0] if has_more else None)
+
+    def find(self, name, value):
+        """
+        Busca los ids cuyo valor en la columna coincide (con índice si la columna lo tiene).
+
+        Returns:
+            list: Ids que coinciden en orden ascendente
+        """
+        if value is None:
+            return []
+        raw = self._encode(name, value)
+        with self.database.reading() as connection:
+            rows = connection.execute(
+                f'SELECT id FROM "{self.table}" WHERE "{name}" = ? ORDER BY id', (raw,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def find_first(self, name, value):
+        """
+        Busca un id cuyo valor en la columna coincide (pensado para columnas únicas).
+
+        Returns:
+            int: Id encontrado o None
+        """
+        if value is None:
+            return None
+        raw = self._encode(name, value)
+        with self.database.reading() as connection:
+            row = connection.execute(
+                f'SELECT id FROM "{self.table}" WHERE "{name}" = ? LIMIT 1', (raw,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def existing_values(self, name, values):
+        """
+        Obtiene cuáles de los valores ya están en uso, consultando por bloques.
+
+        Returns:
+            set: Valores que ya existen
+        """
+        raw_values = {}
+        for value in values:
+            if value is not None:
+                raw_values[self._encode(name, value)] = value
+        found = set()
+        raws = list(raw_values)
+        with self.database.reading() as connection:
+            for start in range(0, len(raws), 500):
+                chunk = raws[start:start + 500]
+                rows = connection.execute(
+                    f'SELECT DISTINCT "{name}" FROM "{self.table}" WHERE "{name}" IN ({", ".join("?" for _ in chunk)})',
+                    chunk
+                ).fetchall()
+                found.update(raw_values[row[0]] for row in rows)
+        return found
+
+    def find_range(self, name, low=None, high=None, limit=None, descending=False):
+        """
+        Busca los ids cuyo valor en una columna ordenada está en [low, high) usando su índice.
+
+        Returns:
+            list: Ids ordenados por valor (y por id a igual valor)
+        """
+        if name not in self.ordered:
+            raise KeyError(name)
+        conditions = [f'"{name}" IS NOT NULL']
+        params = []
+        if low is not None:
+            conditions.append(f'"{name}" >= ?')
+            params.append(self._encode(name, low))
+        if high is not None:
+            conditions.append(f'"{name}" < ?')
+            params.append(self._encode(name, high))
+        direction = 'DESC' if descending else 'ASC'
+        params.append(-1 if limit is None else limit)
+        with self.database.reading() as connection:
+            rows = connection.execute(
+                f'SELECT id FROM "{self.table}" WHERE {" AND ".join(conditions)} '
+                f'ORDER BY "{name}" {direction}, id {direction} LIMIT ?', params
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def compact(self):
+        """
+        Devuelve al sistema de archivos las páginas libres de la base de datos.
+
+        Returns:
+            dict: Páginas liberadas
+        """
+        return {'freed_pages': self.database.vacuum()}
+
+    def get_stats(self):
+        """
+        Obtiene estadísticas del almacén.
+
+        Returns:
+            dict: Registros, versión, índices y estado de la caché
+        """
+        return {
+            'backend': 'sqlite',
+            'table': self.table,
+            'records': self.count,
+            'version': self.version,
+            'indexes': list(self.indexes),
+            'record_cache': self.cache.get_stats()
+        }
+
+    def __repr__(self):
+        return f"SqliteStore({self.table}, {len(self.schema)} columnas)"
@@ -0,0 +1,121 @@
+import os
+from contextlib import nullcontext
+from app.utils.columnar_store import ColumnarStore
+
+# Implementaciones disponibles de los almacenes
+BACKENDS = ('memory', 'sqlite')
+
+
+class StorageBackend:
+    """
+    Punto de extensión que decide dónde viven los registros de los almacenamientos.
+    'memory' crea almacenes columnares en memoria (con instantáneas y log opcionales);
+    'sqlite' crea tablas en una base de datos SQLite local con índices, de modo que
+    el historial no tiene que caber en la memoria del proceso. Ambos exponen la
+    misma interfaz, por lo que los almacenamientos no cambian según la elección.
+    """
+
+    def __init__(self, name='memory', path=None):
+        """
+        Inicializa el backend.
+
+        Args:
+            name (str): 'memory' o 'sqlite'
+            path (str): Archivo de la base de datos SQLite (solo para 'sqlite')
+        """
+        if name not in BACKENDS:
+            raise ValueError(f"Backend de almacenamiento no soportado: {name}")
+        self.name = name
+        self.path = path or 'storage.db'
+        self.database = None
+        # Sección de escritura en memoria (ver attach_writer)
+        self.writer = None
+        if name == 'sqlite':
+            from app.utils.sqlite_store import SqliteDatabase
+            self.database = SqliteDatabase(self.path)
+
+    @classmethod
+    def from_environment(cls):
+        """Crea el backend configurado con STORAGE_BACKEND y SQLITE_PATH"""
+        return cls(os.environ.get('STORAGE_BACKEND', 'memory'), os.environ.get('SQLITE_PATH'))
+
+    @property
+    def in_memory(self):
+        """Indica si los registros viven en memoria (y usan instantáneas y log propios)"""
+        return self.database is None
+
+    def create_store(self, table, schema, record_type=None, unique=(), indexes=(), ordered=(), cache_size=10000):
+        """
+        Crea un almacén de registros.
+
+        Args:
+            table (str): Nombre del almacén (tabla en SQLite)
+            schema (list): Lista de tuplas (nombre_columna, tipo)
+            record_type (type): Clase de registro con __slots__ en el orden del esquema
+            unique (tuple): Columnas de valor único
+            indexes (tuple): Columnas por las que se busca con find() (índice en SQLite)
+            ordered (tuple): Columnas con índice ordenado para find_range() (p. ej. created_at)
+            cache_size (int): Tamaño máximo de la caché de registros decodificados
+
+        Returns:
+            ColumnarStore/SqliteStore: Almacén con la interfaz común
+        """
+        if self.database is None:
+            return ColumnarStore(schema, record_type=record_type, cache_size=cache_size, unique=unique,
+                                 ordered=ordered)
+        from app.utils.sqlite_store import SqliteStore
+        return SqliteStore(self.database, table, schema, record_type=record_type,
+                           cache_size=cache_size, unique=unique, indexes=indexes, ordered=ordered)
+
+    def create_grades_backend(self, storage_file):
+        """
+        Crea la persistencia de las notas.
+
+        Args:
+            storage_file (str): Archivo JSON de notas (solo para 'memory')
+
+        Returns:
+            JsonGradesBackend/SqliteGradesBackend: Persistencia con load_manifest/load_matrix/save_course/delete_course
+        """
+        from app.utils.grades_backend import JsonGradesBackend, SqliteGradesBackend
+        if self.database is None:
+            return JsonGradesBackend(storage_file)
+        return SqliteGradesBackend(self.database)
+
+    def attach_writer(self, writer):
+        """
+        Conecta (o desconecta con None) la sección de escritura en memoria: el
+        candado de escritor del modo compartido (que ya agrupa el log) o el grupo
+        del log de escritura anticipada.
+
+        Args:
+            writer (callable): Devuelve el contexto de escritura (SharedStorage.write o WriteAheadLog.group)
+        """
+        self.writer = writer
+
+    def write_section(self):
+        """Sección de escritura en memoria; sin efecto si no hay escritor conectado"""
+        return self.writer() if self.writer is not None else nullcontext()
+
+    def transaction(self):
+        """
+        Agrupa las escrituras de un bloque en una sola confirmación: una transacción
+        en SQLite y la sección de escritura en memoria. Solo debe envolver las
+        escrituras; validar y hashear contraseñas se hace antes de abrirla.
+        """
+        return self.write_section() if self.database is None else self.database.transaction()
+
+    def refresh(self):
+        """Descarta las cachés si otro proceso modificó la base de datos"""
+        return self.database.refresh() if self.database is not None else False
+
+    def get_stats(self):
+        """Obtiene la configuración y estadísticas del backend"""
+        return {
+            'backend': self.name,
+            'database': self.database.get_stats() if self.database is not None else None
+        }
+
+
+# Backend global elegido por configuración al iniciar
+storage_backend = StorageBackend.from_environment()
@@ -0,0 +1,344 @@
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+# Operaciones registradas en el log
+OPERATIONS = {'insert': 1, 'update': 2, 'delete': 3}
+_OPERATION_NAMES = {code: name for name, code in OPERATIONS.items()}
+
+# Cada entrada: longitud y CRC32 del contenido, seguidos del contenido
+_FRAME = struct.Struct('<II')
+_ENTRY = struct.Struct('<BqH')
+_INT = struct.Struct('<q')
+_LENGTH = struct.Struct('<I')
+_FIELD = struct.Struct('<B')
+
+
+class WriteAheadLog:
+    """
+    Log de escritura anticipada (WAL) para los almacenes columnares.
+    Cada inserción, actualización o eliminación se agrega como una entrada binaria
+    compacta; un hilo de escritura agrupa las entradas pendientes y hace un único
+    fsync por grupo (group commit). Al iniciar, el log se reproduce sobre la última
+    instantánea, y la compactación escribe una instantánea nueva y vacía el log.
+    """
+
+    def __init__(self, snapshot_manager, path, flush_interval=0.002):
+        """
+        Inicializa el log.
+
+        Args:
+            snapshot_manager (SnapshotManager): Instantáneas de los mismos almacenes
+            path (str): Ruta del archivo de log
+            flush_interval (float): Segundos que se esperan para agrupar entradas antes del fsync
+        """
+        self.snapshot_manager = snapshot_manager
+        self.stores = snapshot_manager.stores
+        self.path = path
+        self.previous_path = f"{path}.1"
+        self.flush_interval = flush_interval
+
+        self.file = None
+        self.buffer = bytearray()
+        self.appended_lsn = 0
+        self.synced_lsn = 0
+        self.bytes_written = 0
+        self.fsync_count = 0
+        self.entries_written = 0
+        self.last_checkpoint = None
+
+        self.condition = threading.Condition()
+        self.io_lock = threading.Lock()
+        self.checkpoint_lock = threading.Lock()
+        self.local = threading.local()
+        self._flusher = None
+        self._compactor = None
+        self._stop_event = threading.Event()
+
+    def _encode(self, store_name, operation, row_id, fields):
+        """Codifica una entrada del log"""
+        column_types = list(self.stores[store_name].schema.values())
+        name = store_name.encode('utf-8')
+        payload = bytearray(_FIELD.pack(len(name)))
+        payload += name
+        payload += _ENTRY.pack(OPERATIONS[operation], row_id, len(fields))
+        for index, value in fields:
+            payload += _FIELD.pack(index)
+            if column_types[index] == 'str':
+                data = value.encode('utf-8', 'surrogatepass')
+                payload += _LENGTH.pack(len(data))
+                payload += data
+            else:
+                payload += _INT.pack(value)
+        return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _decode(self, payload):
+        """Decodifica el contenido de una entrada del log"""
+        name_length = payload[0]
+        store_name = payload[1:1 + name_length].decode('utf-8')
+        offset = 1 + name_length
+        operation, row_id, field_count = _ENTRY.unpack_from(payload, offset)
+        offset += _ENTRY.size
+
+        store = self.stores[store_name]
+        columns = list(store.schema.items())
+        values = {}
+        for _ in range(field_count):
+            index = payload[offset]
+            offset += 1
+            name, column_type = columns[index]
+            if column_type == 'str':
+                size = _LENGTH.unpack_from(payload, offset)[0]
+                offset += _LENGTH.size
+                values[name] = payload[offset:offset + size].decode('utf-8', 'surrogatepass')
+                offset += size
+            else:
+                values[name] = _INT.unpack_from(payload, offset)[0]
+                offset += _INT.size
+        return store, _OPERATION_NAMES[operation], row_id, values
+
+    def _replay_file(self, path, start=0, truncate=True):
+        """
+        Reproduce las entradas de un archivo de log. Una entrada incompleta o dañada
+        al final (escritura interrumpida) marca el fin del log y se descarta.
+
+        Args:
+            path (str): Archivo de log
+            start (int): Posición desde la que se leen entradas
+            truncate (bool): Recortar del archivo la cola incompleta
+
+        Returns:
+            tuple: (entradas aplicadas, posición final leída)
+        """
+        if not os.path.exists(path):
+            return 0, 0
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+
+        applied = 0
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            size, checksum = _FRAME.unpack_from(data, offset)
+            payload = data[offset + _FRAME.size:offset + _FRAME.size + size]
+            if len(payload) != size or zlib.crc32(payload) != checksum:
+                break
+            store, operation, row_id, values = self._decode(payload)
+            if operation == 'insert':
+                store.insert(row_id, values)
+            elif operation == 'update':
+                store.update(row_id, values)
+            else:
+                store.delete(row_id)
+            applied += 1
+            offset += _FRAME.size + size
+
+        if offset < len(data) and truncate:
+            print(f"Log {path}: se descartaron {len(data) - offset} bytes incompletos al final")
+            with open(path, 'r+b') as f:
+                f.truncate(start + offset)
+        return applied, start + offset
+
+    def replay(self):
+        """
+        Reproduce el log sobre el contenido actual de los almacenes (normalmente la
+        instantánea recién cargada). Las entradas son idempotentes: volver a aplicar
+        entradas ya incluidas en la instantánea deja el mismo estado final.
+
+        Returns:
+            dict: Entradas aplicadas por archivo
+        """
+        return {
+            'previous': self._replay_file(self.previous_path)[0],
+            'current': self._replay_file(self.path)[0]
+        }
+
+    def apply_tail(self, start):
+        """
+        Aplica las entradas que otros procesos agregaron al log desde start,
+        sin volver a registrarlas en el log.
+
+        Args:
+            start (int): Posición ya aplicada del log
+
+        Returns:
+            tuple: (entradas aplicadas, nueva posición)
+        """
+        journals = {name: store.journal for name, store in self.stores.items()}
+        for store in self.stores.values():
+            store.attach_journal(None)
+        try:
+            return self._replay_file(self.path, start, truncate=False)
+        finally:
+            for name, store in self.stores.items():
+                store.attach_journal(journals[name], name if journals[name] is not None else None)
+
+    def open(self):
+        """Abre el log para agregar entradas y conecta los almacenes a él"""
+        self.file = open(self.path, 'ab')
+        self.bytes_written = self.file.tell()
+        self._stop_event.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name='wal-flusher', daemon=True)
+        self._flusher.start()
+        for name, store in self.stores.items():
+            store.attach_journal(self, name)
+
+    def close(self):
+        """Escribe las entradas pendientes, detiene los hilos y cierra el log"""
+        for store in self.stores.values():
+            store.attach_journal(None)
+        self._stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        for thread in (self._flusher, self._compactor):
+            if thread is not None:
+                thread.join()
+        self._flusher = None
+        self._compactor = None
+        self._flush()
+        self.file.close()
+        self.file = None
+
+    def append(self, store_name, operation, row_id, fields):
+        """
+        Agrega una entrada al log y espera a que sea durable. Dentro de group()
+        la espera se hace una sola vez al salir del bloque.
+
+        Args:
+            store_name (str): Nombre del almacén
+            operation (str): 'insert', 'update' o 'delete'
+            row_id (int): Id del registro
+            fields (list): Pares (índice de columna, valor) con los valores escritos
+        """
+        frame = self._encode(store_name, operation, row_id, fields)
+        with self.condition:
+            self.buffer += frame
+            self.appended_lsn += 1
+            lsn = self.appended_lsn
+            self.condition.notify_all()
+
+        if getattr(self.local, 'depth', 0):
+            self.local.lsn = lsn
+        else:
+            self.wait_for(lsn)
+
+    def wait_for(self, lsn):
+        """Espera hasta que la entrada lsn esté escrita y sincronizada en disco"""
+        with self.condition:
+            while self.synced_lsn < lsn and self._flusher is not None:
+                self.condition.wait()
+
+    @contextmanager
+    def group(self):
+        """
+        Agrupa las escrituras del hilo actual: las entradas se agregan sin esperar
+        y al salir se espera una sola vez a que todas sean durables.
+        """
+        self.local.depth = getattr(self.local, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            self.local.depth -= 1
+            if self.local.depth == 0:
+                lsn = getattr(self.local, 'lsn', 0)
+                self.local.lsn = 0
+                self.wait_for(lsn)
+
+    def flush(self):
+        """Escribe de inmediato las entradas pendientes"""
+        self._flush()
+
+    def reopen(self):
+        """Vuelve a abrir el archivo de log (otro proceso lo rotó al compactar)"""
+        self._flush()
+        with self.io_lock:
+            self.file.close()
+            self.file = open(self.path, 'ab')
+            self.bytes_written = self.file.tell()
+
+    def _flush(self):
+        """Escribe las entradas pendientes con un único fsync"""
+        with self.io_lock:
+            with self.condition:
+                if not self.buffer:
+                    return
+                data = self.buffer
+                lsn = self.appended_lsn
+                self.buffer = bytearray()
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.bytes_written += len(data)
+            self.fsync_count += 1
+            with self.condition:
+                self.entries_written += lsn - self.synced_lsn
+                self.synced_lsn = lsn
+                self.condition.notify_all()
+
+    def _flush_loop(self):
+        """Hilo de group commit: espera entradas, deja que se acumulen y sincroniza"""
+        while not self._stop_event.is_set():
+            with self.condition:
+                while not self.buffer and not self._stop_event.is_set():
+                    self.condition.wait()
+            if self.flush_interval:
+                time.sleep(self.flush_interval)
+            self._flush()
+
+    def checkpoint(self):
+        """
+        Compacta el log en una instantánea nueva: rota el log actual, escribe la
+        instantánea y elimina el log rotado. Si el proceso se interrumpe a la mitad,
+        al reiniciar se reproducen ambos archivos sobre la instantánea anterior.
+
+        Returns:
+            dict: Información de la instantánea escrita
+        """
+        with self.checkpoint_lock:
+            self._flush()
+            with self.io_lock:
+                self.file.close()
+                os.replace(self.path, self.previous_path)
+                self.file = open(self.path, 'ab')
+                self.bytes_written = 0
+            snapshot = self.snapshot_manager.save()
+            os.remove(self.previous_path)
+            self.last_checkpoint = snapshot
+            return snapshot
+
+    def start_compaction(self, max_bytes, check_interval=1.0):
+        """
+        Inicia un hilo que compacta el log en una instantánea cuando supera max_bytes.
+
+        Args:
+            max_bytes (int): Tamaño del log que dispara la compactación
+            check_interval (float): Segundos entre revisiones del tamaño
+        """
+        if self._compactor is not None:
+            return
+
+        def run():
+            while not self._stop_event.wait(check_interval):
+                if self.bytes_written >= max_bytes:
+                    try:
+                        self.checkpoint()
+                    except Exception as e:
+                        print(f"Error compactando el log {self.path}: {str(e)}")
+
+        self._compactor = threading.Thread(target=run, name='wal-compactor', daemon=True)
+        self._compactor.start()
+
+    def get_stats(self):
+        """Obtiene estadísticas del log"""
+        return {
+            'path': self.path,
+            'bytes': self.bytes_written,
+            'entries_written': self.entries_written,
+            'fsyncs': self.fsync_count,
+            'pending_entries': self.appended_lsn - self.synced_lsn,
+            'background_compaction': self._compactor is not None,
+            'last_checkpoint': self.last_checkpoint
+        }
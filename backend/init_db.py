@@ -91,9 +91,8 @@ def init_database():
             stats = user_service.get_storage_stats()
             print(f"\n📊 Estadísticas del sistema:")
             print(f"   - Total usuarios: {stats['total_users']}")
-            print(f"   - Densidad matriz usuarios: {stats['users_matrix_density']:.2f}%")
-            print(f"   - Densidad índice usernames: {stats['username_index_density']:.2f}%")
-            print(f"   - Densidad índice emails: {stats['email_index_density']:.2f}%")
+            print(f"   - Memoria de columnas: {stats['column_memory_bytes']} bytes")
+            print(f"   - Capacidad reservada: {stats['capacity']} filas")
         except Exception as e:
             print(f"❌ Error obteniendo estadísticas: {str(e)}")
         
@@ -0,0 +1,1029 @@
+import pytest
+from app.models.user_storage import UserStorage
+from app.models.course_storage import CourseStorage
+
+
+@pytest.fixture
+def user_storage():
+    """Fresh user storage for each test"""
+    return UserStorage()
+
+
+@pytest.fixture
+def course_storage():
+    """Fresh course storage for each test"""
+    return CourseStorage()
+
+
+def test_record_cache_hits_after_first_read(course_storage):
+    """Repeated reads are served from the decoded-record cache"""
+    course = course_storage.create_course({'codigo': '770', 'nombre': 'IPC2'})
+    course_storage.courses.cache.hits = 0
+    course_storage.courses.cache.misses = 0
+
+    course_storage.get_course_by_id(course['course_id'])
+    course_storage.get_course_by_id(course['course_id'])
+
+    stats = course_storage.get_matrix_stats()['record_cache']
+    assert stats['hits'] == 2
+    assert stats['misses'] == 0
+
+
+def test_record_cache_invalidated_on_update(user_storage):
+    """Updates are visible through the cache"""
+    user = user_storage.create_user({
+        'username': 'cacheuser',
+        'email': 'cache@example.com',
+        'password': 'secret',
+        'first_name': 'Old'
+    })
+    user_storage.get_user_by_id(user['user_id'])
+    user_storage.update_user(user['user_id'], {'first_name': 'New'})
+
+    assert user_storage.get_user_by_id(user['user_id'])['first_name'] == 'New'
+
+
+def test_record_cache_survives_concurrent_invalidation():
+    """get/put/invalidate from several threads never fail and keep the cache within its bound"""
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+    from app.utils.record_cache import RecordCache
+
+    cache = RecordCache(max_size=8)
+
+    def churn(worker):
+        for step in range(2000):
+            key = step % 16
+            cache.put(key, {'worker': worker})
+            cache.get(key)
+            cache.invalidate((key + worker) % 16)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(churn, range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+
+    stats = cache.get_stats()
+    assert stats['size'] <= 8
+    assert stats['hits'] + stats['misses'] == 8 * 2000
+
+
+def test_records_are_read_only(course_storage):
+    """Records returned by the stores cannot be mutated through item assignment"""
+    course = course_storage.create_course({'codigo': '771', 'nombre': 'IPC1'})
+    fetched = course_storage.get_course_by_id(course['course_id'])
+
+    with pytest.raises(TypeError):
+        fetched['nombre'] = 'Changed'
+    assert course_storage.get_course_by_id(course['course_id'])['nombre'] == 'IPC1'
+
+
+def test_record_serializes_like_dict(course_storage):
+    """The fast serializer matches json of the record's dict"""
+    import json
+    from app.utils.serializers import dumps
+
+    course = course_storage.create_course({'codigo': '772', 'nombre': 'Álgebra "lineal"'})
+    payload = json.loads(dumps({'data': [course], 'count': 1}))
+
+    assert payload['count'] == 1
+    assert payload['data'][0]['nombre'] == 'Álgebra "lineal"'
+    assert payload['data'][0]['course_id'] == course['course_id']
+    assert isinstance(payload['data'][0]['created_at'], str)
+
+
+def test_columnar_lookup_by_value(user_storage):
+    """Lookups by string columns return the exact record"""
+    for index in range(3):
+        user_storage.create_user({
+            'username': f'user{index}',
+            'email': f'user{index}@example.com'
+        })
+
+    assert user_storage.get_user_by_username('user1')['email'] == 'user1@example.com'
+    assert user_storage.get_user_by_email('user2@example.com')['username'] == 'user2'
+    assert user_storage.get_user_by_username('missing') is None
+
+
+def test_columnar_delete_frees_lookup(user_storage):
+    """Deleted records are no longer listed nor found"""
+    user = user_storage.create_user({'username': 'gone', 'email': 'gone@example.com'})
+    assert user_storage.delete_user(user['user_id']) is True
+
+    assert user_storage.get_user_by_username('gone') is None
+    assert user_storage.get_all_users() == []
+
+
+def test_deleted_slots_are_reused_and_ids_stay_stable(user_storage):
+    """Freed slots are reused while external ids keep growing"""
+    first = user_storage.create_user({'username': 'first', 'email': 'first@example.com'})
+    user_storage.delete_user(first['user_id'])
+    second = user_storage.create_user({'username': 'second', 'email': 'second@example.com'})
+
+    assert second['user_id'] == first['user_id'] + 1
+    assert user_storage.users.get_stats()['capacity'] == 1
+    assert [u['username'] for u in user_storage.get_all_users()] == ['second']
+
+
+def test_compaction_keeps_ids_and_drops_dead_rows(course_storage):
+    """Compaction renumbers slots only; lookups by id and value keep working"""
+    courses = [course_storage.create_course({'codigo': str(code), 'nombre': f'Curso {code}'}) for code in range(5)]
+    for course in courses[:3]:
+        course_storage.courses.delete(course['course_id'])
+
+    result = course_storage.compact()
+
+    assert result['freed_slots'] == 3
+    assert course_storage.courses.get_stats()['capacity'] == 2
+    assert course_storage.get_course_by_id(courses[4]['course_id'])['codigo'] == '4'
+    assert course_storage.get_course_by_code('3')['course_id'] == courses[3]['course_id']
+    assert course_storage.get_course_by_code('0') is None
+
+
+def test_keyset_pagination_walks_all_records(course_storage):
+    """Pages chained by next_cursor cover every record exactly once"""
+    for code in range(7):
+        course_storage.create_course({'codigo': str(code), 'nombre': f'Curso {code}'})
+    course_storage.courses.delete(3)
+
+    seen = []
+    cursor = 0
+    while cursor is not None:
+        page, cursor = course_storage.get_courses_page(after_id=cursor, limit=2)
+        seen.extend(course['course_id'] for course in page)
+
+    assert seen == [1, 2, 4, 5, 6, 7]
+    assert [c['course_id'] for c in course_storage.iter_courses(after_id=4)] == [5, 6, 7]
+
+
+def test_snapshot_round_trip_restores_records_and_lookups(tmp_path, user_storage, course_storage):
+    """A saved snapshot warm-starts empty stores with the same records, ids and lookups"""
+    from app.utils.snapshot import SnapshotManager
+
+    user = user_storage.create_user({'username': 'snap', 'email': 'snap@example.com', 'first_name': 'Ñandú'})
+    doomed = course_storage.create_course({'codigo': '1', 'nombre': 'Borrado'})
+    course_storage.create_course({'codigo': '2', 'nombre': 'Vivo'})
+    course_storage.courses.delete(doomed['course_id'])
+    path = str(tmp_path / 'snapshot.bin')
+    SnapshotManager({'users': user_storage.users, 'courses': course_storage.courses}, path).save()
+
+    users, courses = UserStorage(), CourseStorage()
+    result = SnapshotManager({'users': users.users, 'courses': courses.courses}, path).load()
+
+    assert result['records'] == {'users': 1, 'courses': 1}
+    assert users.get_user_by_username('snap') == user
+    assert courses.get_course_by_code('2')['nombre'] == 'Vivo'
+    assert courses.get_course_by_code('1') is None
+    assert courses.create_course({'codigo': '3', 'nombre': 'Nuevo'})['course_id'] == 3
+
+
+def test_snapshot_rejects_corrupted_file(tmp_path, course_storage):
+    """A damaged snapshot is rejected without touching the stores"""
+    from app.utils.snapshot import SnapshotManager
+
+    course_storage.create_course({'codigo': '1', 'nombre': 'Curso'})
+    path = tmp_path / 'snapshot.bin'
+    SnapshotManager({'courses': course_storage.courses}, str(path)).save()
+    data = bytearray(path.read_bytes())
+    data[20] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    target = CourseStorage()
+    with pytest.raises(ValueError):
+        SnapshotManager({'courses': target.courses}, str(path)).load()
+    assert target.get_all_courses() == []
+
+
+def _open_log(tmp_path, course_storage):
+    """Warm-start a course storage from tmp_path and open its write-ahead log"""
+    from app.utils.snapshot import SnapshotManager
+    from app.utils.wal import WriteAheadLog
+
+    snapshots = SnapshotManager({'courses': course_storage.courses}, str(tmp_path / 'snapshot.bin'))
+    snapshots.load()
+    log = WriteAheadLog(snapshots, str(tmp_path / 'wal.log'))
+    log.replay()
+    log.open()
+    return log
+
+
+def test_write_ahead_log_replays_mutations(tmp_path, course_storage):
+    """Inserts, updates and deletes logged since the last snapshot are replayed at startup"""
+    log = _open_log(tmp_path, course_storage)
+    first = course_storage.create_course({'codigo': '1', 'nombre': 'Uno'})
+    log.checkpoint()
+    second = course_storage.create_course({'codigo': '2', 'nombre': 'Dos'})
+    course_storage.courses.update(second['course_id'], {'nombre': 'Dos bis'})
+    course_storage.courses.delete(first['course_id'])
+    log.close()
+
+    restarted = CourseStorage()
+    _open_log(tmp_path, restarted).close()
+
+    assert restarted.get_course_by_code('1') is None
+    assert restarted.get_course_by_id(second['course_id'])['nombre'] == 'Dos bis'
+    assert restarted.get_course_by_id(second['course_id']).created_at == second.created_at
+
+
+def test_write_ahead_log_group_commit_and_torn_tail(tmp_path, course_storage):
+    """A group of writes shares fsyncs, and a torn final entry is discarded on replay"""
+    log = _open_log(tmp_path, course_storage)
+    with log.group():
+        for code in range(50):
+            course_storage.create_course({'codigo': str(code), 'nombre': f'Curso {code}'})
+    stats = log.get_stats()
+    log.close()
+
+    assert stats['entries_written'] == 50
+    assert stats['fsyncs'] < 50
+
+    with open(tmp_path / 'wal.log', 'ab') as f:
+        f.write(b'\x10\x00\x00\x00partial')
+    restarted = CourseStorage()
+    _open_log(tmp_path, restarted).close()
+
+    assert restarted.courses.count == 50
+
+
+def test_bulk_create_dedupes_and_skips_existing(course_storage):
+    """Bulk ingest drops in-batch duplicates and, when asked, codes that already exist"""
+    course_storage.create_course({'codigo': '1', 'nombre': 'Existente'})
+
+    created = course_storage.bulk_create_courses([
+        {'codigo': '1', 'nombre': 'Repetido'},
+        {'codigo': '2', 'nombre': 'Dos'},
+        {'codigo': '2', 'nombre': 'Dos otra vez'},
+        {'codigo': '3', 'nombre': 'Tres'}
+    ], skip_existing=True)
+
+    assert [course['course_id'] for course in created] == [2, 3]
+    assert course_storage.get_course_by_code('2')['nombre'] == 'Dos'
+    assert course_storage.get_course_by_code('1')['nombre'] == 'Existente'
+
+
+def test_bulk_create_users_dedupes_emails_within_the_batch(user_storage):
+    """Two usernames sharing an email in one batch keep only the first, like repeated usernames"""
+    created = user_storage.bulk_create_users([
+        {'username': 'ana', 'email': 'ana@tutor.com', 'password_hash': 'x'},
+        {'username': 'ana2', 'email': 'ana@tutor.com', 'password_hash': 'x'},
+        {'username': 'beto', 'email': 'beto@tutor.com', 'password_hash': 'x'}
+    ])
+
+    assert [user['username'] for user in created] == ['ana', 'beto']
+    assert user_storage.get_user_by_username('ana2') is None
+    assert user_storage.users.find_first('email', 'ana@tutor.com') == created[0]['user_id']
+
+
+def test_bulk_create_is_all_or_nothing(course_storage):
+    """An invalid or conflicting item rejects the whole batch"""
+    course_storage.create_course({'codigo': '1', 'nombre': 'Existente'})
+
+    with pytest.raises(Exception):
+        course_storage.bulk_create_courses([{'codigo': '2', 'nombre': 'Dos'}, {'codigo': '3'}])
+    with pytest.raises(Exception):
+        course_storage.bulk_create_courses([{'codigo': '2', 'nombre': 'Dos'}, {'codigo': '1', 'nombre': 'Uno'}])
+
+    assert [course['codigo'] for course in course_storage.get_all_courses()] == ['1']
+
+
+def test_password_hasher_pool_keeps_order():
+    """Batch hashing through the process pool returns hashes in input order"""
+    from app.utils.hash_policy import HashPolicy
+    from app.utils.password_hasher import PasswordHasher
+
+    hasher = PasswordHasher(HashPolicy(rounds=10), max_workers=2)
+    try:
+        hashes = hasher.hash_many(['uno', 'dos', 'tres'])
+    finally:
+        hasher.shutdown()
+
+    assert [hasher.check(password, hashed) for password, hashed in zip(['uno', 'dos', 'tres'], hashes)] == [True] * 3
+    assert not hasher.check('uno', hashes[1])
+
+
+def test_hash_policy_calibrates_lazily_and_pool_workers_reuse_the_cost(monkeypatch, user_storage):
+    """A target-latency policy calibrates once in the parent; workers and existing users hash nothing extra"""
+    from app.utils import hash_policy as policy_module
+    from app.utils import password_hasher as hasher_module
+
+    calibrations = []
+    monkeypatch.setattr(policy_module, 'calibrate', lambda target_ms: calibrations.append(target_ms) or (11, 5.0))
+    monkeypatch.setenv('BCRYPT_TARGET_MS', '5')
+    policy = policy_module.HashPolicy.from_environment()
+    assert calibrations == []
+    assert policy.rounds == 11 and policy.rounds == 11 and calibrations == [5.0]
+
+    hasher = hasher_module.PasswordHasher(policy, max_workers=2)
+    executor = hasher._get_executor()
+    try:
+        assert executor._initializer is hasher_module._init_worker and executor._initargs == (11,)
+    finally:
+        hasher.shutdown()
+    monkeypatch.setattr(hasher_module.hash_policy, '_rounds', None)
+    hasher_module._init_worker(11)
+    assert hasher_module.hash_policy.rounds == 11 and calibrations == [5.0]
+
+    user_storage.create_user({'username': 'ana', 'email': 'ana@example.com', 'password_hash': 'x'})
+    hashed = []
+    monkeypatch.setattr(hasher_module.password_hasher, 'hash_many',
+                        lambda passwords: [hashed.append(password) or 'h' for password in passwords])
+    user_storage.bulk_create_users([
+        {'username': 'ana', 'email': 'ana@example.com', 'password': 'vieja'},
+        {'username': 'beto', 'email': 'beto@example.com', 'password': 'nueva'}
+    ], skip_existing=True)
+    assert hashed == ['nueva']
+
+
+def test_login_rehashes_passwords_below_policy(monkeypatch, user_storage):
+    """A successful login upgrades a hash whose cost is below the current policy"""
+    from app.utils.hash_policy import hash_policy, get_rounds
+
+    monkeypatch.setattr(hash_policy, 'rounds', 10)
+    user_storage.create_user({'username': 'legacy', 'email': 'legacy@example.com', 'password': 'secret'})
+    monkeypatch.setattr(hash_policy, 'rounds', 11)
+
+    assert user_storage.authenticate_user('legacy', 'wrong') is None
+    assert get_rounds(user_storage.get_user_by_username('legacy')['password_hash']) == 10
+
+    user = user_storage.authenticate_user('legacy', 'secret')
+    assert get_rounds(user['password_hash']) == 11
+    assert user_storage.authenticate_user('legacy', 'secret') is not None
+
+
+def test_rehash_on_login_takes_only_the_shared_writer_section(monkeypatch):
+    """In shared mode a login holds the cross-process writer lock only for the rehash write"""
+    from contextlib import contextmanager
+    from app.utils.hash_policy import hash_policy
+    from app.utils.storage_backend import StorageBackend
+
+    sections = []
+
+    @contextmanager
+    def writer():
+        sections.append('enter')
+        yield
+
+    backend = StorageBackend('memory')
+    backend.attach_writer(writer)
+    users = UserStorage(backend=backend)
+    monkeypatch.setattr(hash_policy, 'rounds', 10)
+    users.create_user({'username': 'legacy', 'email': 'legacy@example.com', 'password': 'secret'})
+    monkeypatch.setattr(hash_policy, 'rounds', 11)
+
+    assert users.authenticate_user('legacy', 'wrong') is None and sections == []
+    assert users.authenticate_user('legacy', 'secret') is not None and sections == ['enter']
+    assert users.authenticate_user('legacy', 'secret') is not None and sections == ['enter']
+
+
+def test_unique_index_follows_updates_and_compaction(user_storage):
+    """Unique lookups stay exact after a username change, a delete and compaction"""
+    first = user_storage.create_user({'username': 'old', 'email': 'old@example.com'})
+    second = user_storage.create_user({'username': 'other', 'email': 'other@example.com'})
+    user_storage.update_user(first['user_id'], {'username': 'new'})
+    user_storage.delete_user(second['user_id'])
+    user_storage.compact()
+
+    assert user_storage.get_user_by_username('old') is None
+    assert user_storage.get_user_by_username('new')['user_id'] == first['user_id']
+    assert user_storage.get_user_by_email('other@example.com') is None
+    assert user_storage.users.get_stats()['unique_indexes'] == {'username': 1, 'email': 1}
+
+
+def test_identity_service_resolves_handles_with_one_bcrypt_check(monkeypatch, user_storage):
+    """Any login handle maps to one principal and costs at most one password check"""
+    from app.models.student_storage import StudentStorage
+    from app.services.identity_service import IdentityService
+    from app.utils.password_hasher import password_hasher
+
+    student_storage = StudentStorage()
+    user_storage.create_user({'username': 'tutor1', 'email': 'tutor1@example.com', 'password': 'secret'})
+    student_storage.create_student({'carnet': '2020', 'password': 'clave', 'nombre': 'Ana'})
+    identity = IdentityService(user_storage, student_storage)
+
+    checks = []
+    original_check = password_hasher.check
+    monkeypatch.setattr(password_hasher, 'check', lambda *args: checks.append(args) or original_check(*args))
+
+    assert identity.authenticate('tutor1@example.com', 'secret')[0] == 'tutor'
+    assert identity.authenticate('2020', 'clave')[0] == 'student'
+    assert identity.authenticate('2020', 'wrong') is None
+    assert identity.authenticate('nobody', 'secret') is None
+    assert len(checks) == 3
+
+
+def test_concurrent_creates_keep_ids_and_unique_codes(course_storage):
+    """Parallel creates never share an id or register the same unique code twice"""
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible to provoke races
+    try:
+        def create(i):
+            try:
+                # Every code is requested by four threads; exactly one of them may win
+                return course_storage.create_course({'codigo': str(i % 50), 'nombre': f'Curso {i}'})['course_id']
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            created = [course_id for course_id in pool.map(create, range(200)) if course_id is not None]
+            allocated = list(pool.map(lambda _: course_storage.courses.allocate_id(), range(500)))
+    finally:
+        sys.setswitchinterval(interval)
+
+    store = course_storage.courses
+    assert len(created) == len(set(created)) == 50
+    assert sorted(store.existing_values('codigo', [str(i) for i in range(50)])) == sorted(str(i) for i in range(50))
+    assert len(set(allocated)) == 500 and not set(allocated) & set(created)
+    assert store.get_stats()['locks']['rows']['stripes'] == 64
+
+
+def test_concurrent_writes_to_distinct_rows_keep_slots_and_indexes_consistent():
+    """Column writes run under each row's stripe; slots, dictionaries and indexes stay consistent"""
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+    from app.utils.columnar_store import ColumnarStore
+
+    store = ColumnarStore([('codigo', 'str'), ('orden', 'int')], unique=('codigo',), ordered=('orden',))
+
+    def churn(worker):
+        for step in range(100):
+            row_id = store.allocate_id()
+            store.insert(row_id, {'codigo': f'{worker}-{step}', 'orden': step})
+            store.update(row_id, {'orden': step * 2})
+            if step % 3 == 0:
+                store.delete(row_id)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(churn, range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+
+    unique, ordered = dict(store.unique_indexes['codigo']), store.ordered_indexes['orden']
+    ordered = (ordered[0].tolist(), ordered[1].tolist())
+    store._rebuild_indexes()
+    assert unique == store.unique_indexes['codigo']
+    assert ordered == tuple(values.tolist() for values in store.ordered_indexes['orden'])
+    assert store.count == 8 * 66 == len(store.live_ids)
+    assert sorted(store.slot_ids[slot] for slot in store.slots.values()) == list(store.live_ids)
+    assert store.get(store.find_first('codigo', '7-98'))['orden'] == 196
+
+
+def test_bulk_insert_accepts_a_block_overtaken_by_a_single_insert(course_storage):
+    """A block reserved before a concurrent single create still inserts and keeps ids sorted"""
+    store = course_storage.courses
+    block = store.allocate_ids(3)
+    single = store.allocate_id()
+    store.insert(single, {'codigo': 'solo', 'nombre': 'Individual'})
+
+    store.bulk_insert(block, [{'codigo': str(i), 'nombre': f'Curso {i}'} for i in range(3)])
+
+    assert list(store.live_ids) == [1, 2, 3, 4]
+    assert [course['codigo'] for course in course_storage.get_all_courses()] == ['0', '1', '2', 'solo']
+    with pytest.raises(ValueError):
+        store.bulk_insert(block, [{'codigo': str(i), 'nombre': 'Repetido'} for i in range(3)])
+
+
+def test_timestamps_stay_integers_until_output_and_feed_recent_index(tmp_path):
+    """Timestamps are epoch microseconds on records, datetimes as dict values, and the created_at index serves recent queries"""
+    from datetime import datetime, timedelta
+    from app.utils.storage_backend import StorageBackend
+
+    base = datetime(2024, 1, 1)
+    for backend in (StorageBackend(), StorageBackend('sqlite', str(tmp_path / 'storage.db'))):
+        courses = CourseStorage(backend=backend)
+        courses.bulk_create_courses([{'codigo': str(i), 'nombre': f'Curso {i}'} for i in range(5)])
+        store = courses.courses
+        for i, course_id in enumerate(list(store.ids())):
+            store.update(course_id, {'created_at': base + timedelta(days=i)})
+        store.update(store.find_first('codigo', '1'), {'created_at': base + timedelta(days=10)})
+
+        course = courses.get_course_by_code('1')
+        assert course.created_at == 1704931200000000
+        assert course['created_at'] == base + timedelta(days=10)
+        assert [c['codigo'] for c in courses.get_recent_courses(3)] == ['1', '4', '3']
+        assert [c['codigo'] for c in courses.get_recent_courses(10, since=base + timedelta(days=3))] == ['1', '4', '3']
+        assert store.find_range('created_at', high=base + timedelta(days=2)) == [store.find_first('codigo', '0')]
+
+
+def test_query_hash_join_filters_and_projects(course_storage):
+    """Inner and left hash joins over stores, with filters and projections"""
+    from app.models.assignment_storage import AssignmentStorage
+    from app.utils.query import Query
+
+    assignments = AssignmentStorage()
+    course_storage.create_course({'codigo': '770', 'nombre': 'IPC1'})
+    course_storage.create_course({'codigo': '771', 'nombre': 'IPC2'})
+    assignments.create_tutor_course_assignment(1, '771')
+    assignments.create_tutor_course_assignment(2, '999')
+
+    joined = (
+        Query.scan(assignments.tutor_assignments, 'assignment')
+        .join(Query.scan(course_storage.courses, 'course'), 'assignment.course_code', 'course.codigo')
+        .select(tutor='assignment.tutor_id', name='course.nombre')
+    )
+    assert list(joined) == [{'tutor': '1', 'name': 'IPC2'}]
+
+    unassigned = (
+        Query.scan(course_storage.courses, 'course')
+        .join(Query.scan(assignments.tutor_assignments, 'assignment'), 'course.codigo', 'assignment.course_code', how='left')
+        .where(lambda row: row['assignment'] is None)
+        .select(code='course.codigo')
+    )
+    assert list(unassigned) == [{'code': '770'}]
+
+
+def test_shared_storage_replicates_between_workers(tmp_path):
+    """Two workers sharing a snapshot and log see each other's writes, also across a checkpoint"""
+    from app.utils.shared_storage import SharedStorage
+    from app.utils.snapshot import SnapshotManager
+    from app.utils.wal import WriteAheadLog
+
+    def open_worker():
+        storage = CourseStorage()
+        snapshots = SnapshotManager({'courses': storage.courses}, str(tmp_path / 'snapshot.bin'))
+        shared = SharedStorage(WriteAheadLog(snapshots, str(tmp_path / 'wal.log')))
+        shared.open()
+        return storage, shared
+
+    storage_a, shared_a = open_worker()
+    storage_b, shared_b = open_worker()
+    try:
+        with shared_a.write():
+            storage_a.create_course({'codigo': '1', 'nombre': 'Uno'})
+        shared_b.refresh()
+        assert storage_b.get_course_by_code('1')['nombre'] == 'Uno'
+
+        shared_a.checkpoint()
+        with shared_b.write():
+            storage_b.create_course({'codigo': '2', 'nombre': 'Dos'})
+        shared_a.refresh()
+
+        assert [course['codigo'] for course in storage_a.get_all_courses()] == ['1', '2']
+        assert shared_b.get_stats()['snapshot_reloads'] == 1
+    finally:
+        shared_a.close()
+        shared_b.close()
+
+
+def test_change_events_are_versioned_per_mutation(tmp_path, course_storage):
+    """Columnar stores and grades publish ordered change events to subscribers"""
+    from app.models.grades_storage import GradesStorage
+    from app.utils.events import EventBus
+
+    bus = EventBus()
+    course_storage.courses.attach_events(bus, 'courses')
+    grades = GradesStorage(str(tmp_path / 'grades.json'), event_bus=bus)
+    received = []
+    bus.subscribe(received.append, entities=['grades'])
+
+    course = course_storage.create_course({'codigo': '770', 'nombre': 'IPC1'})
+    course_storage.courses.update(course['course_id'], {'nombre': 'IPC2'})
+    xml = '<curso codigo="770">IPC2</curso><notas><actividad nombre="T1" carnet="1">90</actividad></notas>'
+    grades.parse_grades_xml(xml, 5)
+    grades.parse_grades_xml(xml, 5)
+    grades.delete_course_grades('770', 5)
+
+    events = bus.changes_since(0)
+    assert [(event.entity, event.operation) for event in events] == [
+        ('courses', 'insert'), ('courses', 'update'),
+        ('grades', 'insert'), ('grades', 'update'), ('grades', 'delete')
+    ]
+    assert [event.version for event in events] == [1, 2, 3, 4, 5]
+    assert [event.id for event in received] == ['770_5'] * 3
+    assert [event.operation for event in bus.changes_since(3, entities=['grades'])] == ['update', 'delete']
+
+
+def test_record_and_store_versions_bump_on_mutation(course_storage):
+    """Writes bump the store version and only the touched record's version"""
+    store = course_storage.courses
+    first = course_storage.create_course({'codigo': '770', 'nombre': 'IPC1'})['course_id']
+    second = course_storage.create_course({'codigo': '771', 'nombre': 'IPC2'})['course_id']
+    store_tag, first_tag, second_tag = store.etag(), store.etag(first), store.etag(second)
+
+    store.update(first, {'nombre': 'IPC1 A'})
+    assert store.etag() != store_tag
+    assert store.etag(first) != first_tag
+    assert store.etag(second) == second_tag
+
+    store.compact()
+    assert store.etag(second) == second_tag
+
+    store.delete(second)
+    assert store.etag(second) is None
+    assert store.record_version(first) < store.version
+
+
+def test_sqlite_backend_matches_store_interface(tmp_path):
+    """Storages on the SQLite backend keep lookups, paging and grades across reopening"""
+    from app.models.grades_storage import GradesStorage
+    from app.utils.storage_backend import StorageBackend
+
+    path = str(tmp_path / 'storage.db')
+    backend = StorageBackend('sqlite', path)
+    courses = CourseStorage(backend=backend)
+    courses.bulk_create_courses([{'codigo': str(770 + i), 'nombre': f'Curso {i}'} for i in range(5)])
+    store = courses.courses
+    store.update(store.find_first('codigo', '771'), {'nombre': 'IPC2'})
+    store.delete(store.find_first('codigo', '774'))
+
+    with pytest.raises(RuntimeError):
+        with backend.transaction():
+            courses.create_course({'codigo': '900', 'nombre': 'Rollback'})
+            raise RuntimeError('abort')
+    assert courses.get_course_by_code('900') is None
+
+    page, cursor = store.page(0, 2)
+    assert [course['codigo'] for course in page] == ['770', '771'] and cursor == 2
+    assert store.existing_values('codigo', ['770', '774', '999']) == {'770'}
+    grades = GradesStorage(event_bus=None, backend=backend)
+    grades.parse_grades_xml('<curso codigo="770">IPC1</curso><notas><actividad nombre="T1" carnet="1">90</actividad></notas>', 5)
+    backend.database.close()
+
+    reopened = StorageBackend('sqlite', path)
+    courses = CourseStorage(backend=reopened)
+    assert courses.get_course_by_code('771')['nombre'] == 'IPC2'
+    assert courses.courses.count == 4
+    assert courses.courses.allocate_id() == 6  # the rolled-back id is not consumed
+    course = GradesStorage(backend=reopened).get_course_grades('770', 5)
+    assert course['sparse_matrix'].get_value(0, 0) == 90
+    assert (course['course_info']['activities'], course['course_info']['students']) == (['T1'], ['1'])
+    assert 'activities' not in GradesStorage(backend=reopened).get_all_courses()['770_5']
+    reopened.database.close()
+
+
+def test_sqlite_readers_do_not_wait_for_the_writer(tmp_path):
+    """Reads run on their own connections during a write transaction and never cache a row it may change"""
+    import threading
+    from app.utils.storage_backend import StorageBackend
+
+    backend = StorageBackend('sqlite', str(tmp_path / 'storage.db'))
+    courses = CourseStorage(backend=backend)
+    course_id = courses.create_course({'codigo': '770', 'nombre': 'IPC1'})['course_id']
+    store = courses.courses
+    store.cache.clear()
+
+    started, release = threading.Event(), threading.Event()
+
+    def write():
+        with backend.transaction():
+            store.update(course_id, {'nombre': 'IPC2'})
+            started.set()
+            release.wait(5)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        assert started.wait(5)
+        # The reader sees the last committed version without blocking on the open transaction
+        assert store.get(course_id)['nombre'] == 'IPC1'
+        assert store.find_first('codigo', '770') == course_id and store.count == 1
+        assert store.cache.get_stats()['size'] == 0
+    finally:
+        release.set()
+        writer.join()
+    assert store.get(course_id)['nombre'] == 'IPC2'
+    assert store.cache.get_stats()['size'] == 1
+    backend.database.close()
+
+
+def test_sqlite_unique_columns_hold_across_processes(tmp_path):
+    """Unique columns are UNIQUE indexes: another process' write is seen and duplicates are rejected"""
+    import sqlite3
+    from app.utils.storage_backend import StorageBackend
+
+    path = str(tmp_path / 'storage.db')
+    backend = StorageBackend('sqlite', path)
+    other = StorageBackend('sqlite', path)
+    courses = CourseStorage(backend=backend)
+    courses.bulk_create_courses([{'codigo': str(100 + i), 'nombre': f'Curso {i}'} for i in range(50)])
+    assert courses.get_course_by_code('999') is None
+
+    # The check inside the lock_key transaction sees the other process' committed row
+    CourseStorage(backend=other).create_course({'codigo': '999', 'nombre': 'Externo'})
+    with pytest.raises(Exception, match='ya existe'):
+        courses.create_course({'codigo': '999', 'nombre': 'Duplicado'})
+    assert courses.get_course_by_code('999')['nombre'] == 'Externo'
+
+    store = courses.courses
+    first = store.find_first('codigo', '100')
+    with pytest.raises(sqlite3.IntegrityError):
+        store.insert(store.allocate_id(), {'codigo': '100', 'nombre': 'Duplicado'})
+    # Re-inserting an id replaces that row only; a clash on codigo never deletes another one
+    store.insert(first, {'codigo': '100', 'nombre': 'Reemplazado'})
+    with pytest.raises(sqlite3.IntegrityError):
+        store.insert(first, {'codigo': '101', 'nombre': 'Choque'})
+    assert courses.get_course_by_code('100')['nombre'] == 'Reemplazado'
+    assert courses.get_course_by_code('101')['nombre'] == 'Curso 1'
+    assert store.count == 51
+    backend.database.close()
+    other.database.close()
+
+
+def test_search_index_prefix_typos_and_updates(course_storage):
+    """The search index ranks exact, prefix and misspelled matches and follows store changes"""
+    from app.models.student_storage import StudentStorage
+    from app.utils.events import EventBus
+    from app.utils.search_index import SearchIndex
+
+    bus = EventBus()
+    students = StudentStorage()
+    students.students.attach_events(bus, 'students')
+    course_storage.courses.attach_events(bus, 'courses')
+    index = SearchIndex()
+    index.add_source('student', students.students, ('nombre', 'carnet'), 'students')
+    index.add_source('course', course_storage.courses, ('nombre', 'codigo'), 'courses')
+    index.attach(bus)
+
+    students.bulk_create_students([
+        {'carnet': '1001', 'nombre': 'Pedro Rodríguez', 'password': 'x'},
+        {'carnet': '1002', 'nombre': 'Laura Rodas', 'password': 'x'}
+    ])
+    course_storage.create_course({'codigo': '770', 'nombre': 'Introducción a la Programación'})
+
+    assert [hit['label'] for hit in index.search('rodriguez')] == ['Pedro Rodríguez 1001']
+    assert [hit['label'] for hit in index.search('rod')] == ['Laura Rodas 1002', 'Pedro Rodríguez 1001']
+    assert index.search('pedro rodrigues')[0]['label'] == 'Pedro Rodríguez 1001'
+    assert [hit['type'] for hit in index.search('progra')] == ['course']
+    assert index.search('rod', kinds=['course']) == []
+
+    student_id = students.get_student_by_carnet('1002')['student_id']
+    students.students.update(student_id, {'nombre': 'Laura Pérez'})
+    assert [hit['label'] for hit in index.search('rod')] == ['Pedro Rodríguez 1001']
+    assert index.search('perez')[0]['id'] == student_id
+
+
+def test_configuration_unit_of_work_checks_references_and_rolls_back(monkeypatch, course_storage):
+    """A configuration upload resolves references against the staged batch and never loads halfway"""
+    from app.models.student_storage import StudentStorage
+    from app.models.assignment_storage import AssignmentStorage
+    from app.services.unit_of_work import ConfigurationUnitOfWork
+
+    users, students, assignments = UserStorage(), StudentStorage(), AssignmentStorage()
+
+    def stage(unit_of_work, codigo):
+        unit_of_work.stage_course(codigo, 'Curso')
+        unit_of_work.stage_tutor('T100', 'clave', 'Ana')
+        unit_of_work.stage_student('2020', 'clave', 'Luis')
+        unit_of_work.stage_tutor_assignment(codigo, 'T100')
+        unit_of_work.stage_tutor_assignment(codigo, 'T100')
+        unit_of_work.stage_tutor_assignment('999', 'T100')
+        unit_of_work.stage_student_assignment(codigo, '2020')
+        unit_of_work.stage_student_assignment(codigo, '3030')
+
+    unit_of_work = ConfigurationUnitOfWork(course_storage, users, students, assignments)
+    stage(unit_of_work, '770')
+    stats = unit_of_work.commit()
+    assert (stats['cursos_cargados'], stats['tutores_cargados'], stats['estudiantes_cargados']) == (1, 1, 1)
+    assert stats['asignaciones']['tutores'] == {'total': 3, 'correcto': 1, 'incorrecto': 2}
+    assert stats['asignaciones']['estudiantes'] == {'total': 2, 'correcto': 1, 'incorrecto': 1}
+    tutor = users.get_user_by_username('T100')
+    assert [a['course_code'] for a in assignments.get_tutor_assignments(tutor['user_id'])] == ['770']
+
+    # A failure while writing the last store undoes every store written before it
+    def fail(pairs, skip_existing=False):
+        list(pairs)
+        raise Exception('disk full')
+    users.bulk_create_users([{'username': 'T300', 'email': 'T300@tutor.com', 'password_hash': 'x', 'first_name': 'Eva'}])
+    monkeypatch.setattr(assignments, 'bulk_create_student_assignments', fail)
+    unit_of_work = ConfigurationUnitOfWork(course_storage, users, students, assignments)
+    stage(unit_of_work, '771')
+    unit_of_work.stage_tutor('T100', 'nueva', 'Ana María')
+    unit_of_work.stage_tutor('T200', 'nueva', 'Beto')
+    unit_of_work.stage_tutor('T300', 'nueva', 'Eva')
+    with pytest.raises(Exception, match='disk full'):
+        unit_of_work.commit()
+    assert course_storage.get_course_by_code('771') is None
+    assert users.get_user_by_username('T200') is None
+    assert users.get_user_by_username('T100')['first_name'] == 'Ana'
+    assert users.get_user_by_username('T300').get('last_name') is None  # columns that were empty stay empty
+    assert len(assignments.get_tutor_assignments(tutor['user_id'])) == 1
+
+    # Assignments may reference courses that already exist without declaring them again
+    monkeypatch.undo()
+    unit_of_work = ConfigurationUnitOfWork(course_storage, users, students, assignments)
+    unit_of_work.stage_tutor_assignment('770', 'T300')
+    stats = unit_of_work.commit()
+    assert stats['asignaciones']['tutores'] == {'total': 1, 'correcto': 1, 'incorrecto': 0}
+
+
+def test_configuration_unit_of_work_hashes_before_opening_the_transaction(monkeypatch):
+    """Every password of a configuration upload is hashed before the write transaction opens"""
+    from contextlib import contextmanager
+    from app.models.student_storage import StudentStorage
+    from app.models.assignment_storage import AssignmentStorage
+    from app.services.unit_of_work import ConfigurationUnitOfWork
+    from app.utils import password_hasher as hasher_module
+    from app.utils.storage_backend import StorageBackend
+
+    state = {'open': False, 'hashed_inside': 0}
+
+    @contextmanager
+    def writer():
+        state['open'] = True
+        try:
+            yield
+        finally:
+            state['open'] = False
+
+    def hash_many(passwords):
+        passwords = list(passwords)
+        state['hashed_inside'] += len(passwords) if state['open'] else 0
+        return [f'hash-{password}' for password in passwords]
+
+    monkeypatch.setattr(hasher_module.password_hasher, 'hash_many', hash_many)
+    backend = StorageBackend('memory')
+    backend.attach_writer(writer)
+    students = StudentStorage(backend=backend)
+    unit_of_work = ConfigurationUnitOfWork(CourseStorage(backend=backend), UserStorage(backend=backend),
+                                           students, AssignmentStorage(backend=backend), backend=backend)
+    unit_of_work.stage_tutor('T100', 'clave', 'Ana')
+    unit_of_work.stage_student('2020', 'secreta', 'Luis')
+    stats = unit_of_work.commit()
+
+    assert (stats['tutores_cargados'], stats['estudiantes_cargados']) == (1, 1)
+    assert state['hashed_inside'] == 0
+    assert students.get_student_by_carnet('2020')['password_hash'] == 'hash-secreta'
+
+
+def test_grades_json_is_segmented_per_course_and_migrates(tmp_path):
+    """Grades migrate from the single-file format and each save rewrites only its course segment"""
+    import json
+    import os
+    from app.models.grades_storage import GradesStorage
+
+    legacy = tmp_path / 'grades.json'
+    legacy.write_text(json.dumps({
+        'courses': {'770_5': {'course_code': '770', 'course_name': 'IPC1', 'tutor_id': 5,
+                              'activities': ['T1'], 'students': ['1'], 'upload_date': '2024-01-01T00:00:00',
+                              'total_activities': 1, 'total_students': 1}},
+        'sparse_matrices': {'770_5': {'matrix_data': {'0,0': 90.0}, 'rows': 1, 'cols': 1, 'density': 1.0}},
+        'metadata': {'created_at': '2024-01-01T00:00:00', 'last_updated': '2024-01-01T00:00:00'}
+    }, indent=2))
+
+    grades = GradesStorage(str(legacy), event_bus=None)
+    assert grades.backend.migrated and legacy.exists()
+    assert grades.get_course_grades('770', 5)['sparse_matrix'].get_value(0, 0) == 90.0
+
+    migrated_segment = grades.backend.segment_path('770_5')
+    before = os.path.getmtime(migrated_segment)
+    os.utime(migrated_segment, (before - 60, before - 60))
+    grades.parse_grades_xml('<curso codigo="../771">IPC2</curso><notas><actividad nombre="T1" carnet="2">75</actividad></notas>', 5)
+    assert os.path.getmtime(migrated_segment) == before - 60
+    assert os.path.dirname(grades.backend.segment_path('../771_5')) == str(tmp_path / 'grades' / 'courses')
+    assert grades.backend.get_stats()['segment_writes'] == 2
+
+    grades.delete_course_grades('770', 5)
+    assert not os.path.exists(migrated_segment)
+    reopened = GradesStorage(str(legacy), event_bus=None)
+    assert not reopened.backend.migrated
+    assert list(reopened.get_all_courses()) == ['../771_5']
+    assert reopened.get_course_grades('../771', 5)['sparse_matrix'].get_value(0, 0) == 75.0
+
+
+def test_grades_load_manifest_only_and_keep_an_lru_of_matrices(tmp_path):
+    """Grades start from the manifest alone and read matrices back on access within the residency cap"""
+    import json
+    from app.models.grades_storage import GradesStorage
+
+    path = str(tmp_path / 'grades.json')
+    grades = GradesStorage(path, event_bus=None)
+    for code, grade in (('770', 90), ('771', 80), ('772', 70)):
+        grades.parse_grades_xml(f'<curso codigo="{code}">C</curso><notas><actividad nombre="T1" carnet="1">{grade}</actividad></notas>', 5)
+
+    reopened = GradesStorage(path, event_bus=None, max_resident=2)
+    stats = reopened.get_storage_stats()
+    assert (stats['total_courses'], stats['total_grades']) == (3, 3)
+    assert stats['resident_matrices']['size'] == 0
+    assert sorted(reopened.get_tutor_courses(5)) == ['770_5', '771_5', '772_5']
+
+    for code, grade in (('770', 90), ('771', 80), ('772', 70), ('770', 90)):
+        assert reopened.get_course_grades(code, 5)['sparse_matrix'].get_value(0, 0) == grade
+    assert list(reopened.matrices.entries) == ['772_5', '770_5']
+    assert reopened.matrices.peek('772_5') is not None
+    assert list(reopened.matrices.entries) == ['772_5', '770_5']  # peeking neither counts nor reorders
+    assert reopened.get_course_grades('999', 5) is None
+
+    # A version 1 manifest (no matrix summaries) is upgraded and written back once
+    manifest = json.loads(open(reopened.backend.manifest_path, encoding='utf-8').read())
+    manifest.update(format=1, matrices={})
+    with open(reopened.backend.manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    upgraded = GradesStorage(path, event_bus=None)
+    assert upgraded.backend.get_stats()['manifest_writes'] == 1
+    assert upgraded.get_storage_stats()['total_grades'] == 3
+    assert GradesStorage(path, event_bus=None).backend.get_stats()['manifest_writes'] == 0
+
+
+def test_grades_manifest_keeps_summaries_and_rosters_live_in_segments(tmp_path):
+    """The manifest holds fixed-size course summaries; activity and student lists move to the segments"""
+    import json
+    from app.models.grades_storage import GradesStorage
+
+    path = str(tmp_path / 'grades.json')
+    grades = GradesStorage(path, event_bus=None)
+    grades.parse_grades_xml('<curso codigo="770">C</curso><notas><actividad nombre="T1" carnet="1">90</actividad>'
+                            '<actividad nombre="T2" carnet="2">80</actividad></notas>', 5)
+
+    def read(file_path):
+        with open(file_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    manifest = read(grades.backend.manifest_path)
+    assert manifest['format'] == 3
+    assert 'activities' not in manifest['courses']['770_5'] and 'students' not in grades.get_all_courses()['770_5']
+    segment = read(grades.backend.segment_path('770_5'))
+    assert (segment['activities'], segment['students']) == (['T1', 'T2'], ['1', '2'])
+    assert grades.get_course_grades('770', 5)['course_info']['students'] == ['1', '2']
+
+    # A version 2 manifest (lists in the course info) moves them into the segment once
+    manifest['format'] = 2
+    manifest['courses']['770_5'].update(activities=['T1', 'T2'], students=['1', '2'])
+    del segment['activities'], segment['students']
+    with open(grades.backend.manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    with open(grades.backend.segment_path('770_5'), 'w', encoding='utf-8') as f:
+        json.dump(segment, f)
+    upgraded = GradesStorage(path, event_bus=None)
+    assert upgraded.backend.get_stats()['manifest_writes'] == 1
+    assert 'activities' not in read(upgraded.backend.manifest_path)['courses']['770_5']
+    assert read(upgraded.backend.segment_path('770_5'))['activities'] == ['T1', 'T2']
+    course = GradesStorage(path, event_bus=None).get_course_grades('770', 5)
+    assert course['course_info']['activities'] == ['T1', 'T2'] and course['sparse_matrix'].get_value(1, 1) == 80.0
+
+
+def test_grades_xml_streams_rootless_documents(tmp_path):
+    """Grades are parsed from a stream in small chunks, honouring the declared encoding"""
+    import io
+    from app.models.grades_storage import GradesStorage
+    from app.utils.grades_xml import RootedStream, iter_grades_xml
+
+    document = ('<?xml version="1.0" encoding="ISO-8859-1"?>\n<curso codigo="770">Introducción</curso>\n<notas>'
+                + ''.join(f'<actividad nombre="T{i % 3}" carnet="{i % 5}">{i % 100}</actividad>' for i in range(200))
+                + '</notas>').encode('latin-1')
+    items = list(iter_grades_xml(RootedStream(io.BytesIO(document), chunk_size=7)))
+    assert items[0] == ('curso', '770', 'Introducción')
+    assert items[-1] == ('notas',) and len(items) == 202
+
+    grades = GradesStorage(str(tmp_path / 'grades.json'), event_bus=None)
+    result = grades.parse_grades_xml(io.BytesIO(document), 5)
+    assert (result['activities_count'], result['students_count']) == (3, 5)
+    course = grades.get_course_grades('770', 5)
+    assert course['course_info']['activities'] == ['T0', 'T1', 'T2']
+    assert course['sparse_matrix'].get_value(1, 1) == 96.0
+    with pytest.raises(ValueError, match='Invalid grade value'):
+        grades.parse_grades_xml('<curso codigo="770">C</curso><notas><actividad nombre="T" carnet="1">101</actividad></notas>', 5)
+    with pytest.raises(ValueError, match="Missing 'notas'"):
+        grades.parse_grades_xml(b'<curso codigo="770">C</curso>', 5)
+
+
+def test_grades_merge_upload_applies_only_the_delta(tmp_path):
+    """A merge re-upload keeps indexes stable, persists only changed cells and reports the delta"""
+    import os
+    from app.models.grades_storage import GradesStorage
+
+    def document(*grades):
+        return '<curso codigo="770">C</curso><notas>' + ''.join(
+            f'<actividad nombre="{activity}" carnet="{carnet}">{grade}</actividad>' for activity, carnet, grade in grades
+        ) + '</notas>'
+
+    path = str(tmp_path / 'grades.json')
+    grades = GradesStorage(path, event_bus=None)
+    grades.parse_grades_xml(document(('T1', 'A', 90), ('T1', 'B', 80), ('T2', 'A', 70)), 5)
+    etag = grades.etag('770', 5)
+
+    result = grades.parse_grades_xml(document(('T1', 'B', 80), ('T1', 'A', 90)), 5, merge=True)
+    assert result['delta']['cells_unchanged'] == 2 and grades.etag('770', 5) == etag
+
+    result = grades.parse_grades_xml(document(('T3', 'C', 60), ('T1', 'B', 85), ('T2', 'A', 0)), 5, merge=True)
+    assert result['delta'] == {
+        'activities_added': ['T3'], 'students_added': ['C'],
+        'cells_added': 1, 'cells_updated': 1, 'cells_removed': 1, 'cells_unchanged': 0
+    }
+    assert grades.backend.get_stats()['delta_writes'] == 1
+
+    for storage in (grades, GradesStorage(path, event_bus=None)):
+        course = storage.get_course_grades('770', 5)
+        assert course['course_info']['activities'] == ['T1', 'T2', 'T3']
+        assert course['course_info']['students'] == ['A', 'B', 'C']
+        assert course['matrix_info']['matrix_data'] == {'0,0': 90.0, '0,1': 85.0, '2,2': 60.0}
+
+    # A new activity with only zero grades changes no cell but is still persisted
+    etag = grades.etag('770', 5)
+    result = grades.parse_grades_xml(document(('T4', 'A', 0)), 5, merge=True)
+    assert result['delta']['activities_added'] == ['T4'] and grades.etag('770', 5) != etag
+    reopened = GradesStorage(path, event_bus=None).get_course_grades('770', 5)
+    assert reopened['course_info']['activities'] == ['T1', 'T2', 'T3', 'T4']
+    assert reopened['matrix_info']['matrix_data'] == {'0,0': 90.0, '0,1': 85.0, '2,2': 60.0}
+
+    # A full upload rewrites the segment and drops the delta log
+    grades.parse_grades_xml(document(('T1', 'A', 50)), 5)
+    assert not os.path.exists(grades.backend.delta_path('770_5'))
+    assert GradesStorage(path, event_bus=None).get_course_grades('770', 5)['matrix_info']['matrix_data'] == {'0,0': 50.0}